@@ -14,6 +14,7 @@ export async function GET(request: NextRequest) {
         sp.price,
         sp.unit,
         sp.currency,
+        sp.price_per_kg,
         sp.scraped_at,
         sp.status,
         sp.flagged_reason,
@@ -93,11 +94,10 @@ export async function POST(request: NextRequest) {
     const price = scrapedPrice.rows[0];
 
     if (action === 'approve') {
-      // Calculate normalized price per kg
-      const pricePerKg = calculatePricePerKg(
-        parseFloat(price.price),
-        price.unit
-      );
+      // Normalized price per kg: as computed by the scraper, else derived from the unit
+      const pricePerKg = price.price_per_kg !== null
+        ? parseFloat(price.price_per_kg)
+        : calculatePricePerKg(parseFloat(price.price), price.unit);
 
       // Insert into approved prices table
       await client.query(
@@ -45,6 +45,7 @@ CREATE TABLE scraped_prices (
     price DECIMAL(10, 2) NOT NULL,
     unit VARCHAR(50) NOT NULL,
     currency VARCHAR(10) DEFAULT 'NGN',
+    price_per_kg DECIMAL(10, 2),  -- existing databases: migrations/001_scraped_prices_price_per_kg.sql
     scraped_at TIMESTAMP NOT NULL,
     status VARCHAR(50) DEFAULT 'pending',
     flagged_reason TEXT,
@@ -75,6 +76,9 @@ SELECT create_hypertable('prices', 'time');
 CREATE INDEX idx_scraped_prices_status ON scraped_prices(status);
 CREATE INDEX idx_scraped_prices_product ON scraped_prices(product_id);
 CREATE INDEX idx_scraped_prices_location ON scraped_prices(location_id);
+-- Recent approved prices per product/location (anomaly checks)
+CREATE INDEX idx_scraped_prices_recent_approved ON scraped_prices(product_id, location_id, scraped_at DESC)
+    WHERE status = 'approved';
 CREATE INDEX idx_prices_product_time ON prices(product_id, time DESC);
 CREATE INDEX idx_prices_location_time ON prices(location_id, time DESC);
 
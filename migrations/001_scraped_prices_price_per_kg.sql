@@ -0,0 +1,5 @@
+-- Normalized price per kg computed by the scrapers (scrapers/units.py).
+-- init-db.sql only runs on a fresh database; apply this to existing ones:
+--   psql "$DATABASE_URL" -f migrations/001_scraped_prices_price_per_kg.sql
+-- The ingestion worker also applies it at startup. Safe to run repeatedly.
+ALTER TABLE scraped_prices ADD COLUMN IF NOT EXISTS price_per_kg DECIMAL(10, 2);
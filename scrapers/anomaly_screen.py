@@ -0,0 +1,185 @@
+"""
+Vectorized anomaly pre-screen for scraped prices
+Loads the recent approved prices of every product/location once per run and
+scores records against robust per-pair statistics with numpy, so the
+ingestion worker does not need a query per record
+"""
+from typing import Dict, List
+
+import numpy as np
+
+# Schema version of the `anomaly` object attached to records
+SCREEN_VERSION = 1
+
+# Approved prices of the last 7 days, newest first per product/location,
+# at most `limit` per pair
+WINDOW_QUERY = """
+    SELECT product_id, location_id, price, recency
+    FROM (
+        SELECT product_id, location_id, price,
+               ROW_NUMBER() OVER (PARTITION BY product_id, location_id ORDER BY scraped_at DESC) AS recency
+        FROM scraped_prices
+        WHERE status = 'approved'
+          AND scraped_at > NOW() - INTERVAL '7 days'
+    ) recent
+    WHERE recency <= %s
+"""
+
+# Iglewicz and Hoaglin: |0.6745 (x - median) / MAD| > 3.5 is an outlier
+MAD_SCALE = 0.6745
+MAD_THRESHOLD = 3.5
+IQR_FENCE = 1.5
+# The ingestion worker's rule: more than 30% away from the mean of the last 10 approved prices
+LEGACY_THRESHOLD = 0.3
+LEGACY_WINDOW = 10
+
+
+def pair_keys(product_ids: np.ndarray, location_ids: np.ndarray) -> np.ndarray:
+    """One int64 key per (product, location)"""
+    return (product_ids.astype(np.int64) << 32) | location_ids.astype(np.int64)
+
+
+def grouped_quantile(values: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float) -> np.ndarray:
+    """Quantile `q` of each group of `values`, which must be sorted within groups (linear interpolation)"""
+    position = starts + q * (counts - 1)
+    low = np.floor(position).astype(np.int64)
+    high = np.ceil(position).astype(np.int64)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+class PriceWindow:
+    """Per product/location statistics of recent approved prices, one array entry per pair
+
+    The statistics arrays have one extra trailing entry (no samples, NaN
+    statistics) that records of unknown pairs are pointed at.
+    """
+
+    def __init__(self, product_ids, location_ids, prices, recency):
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        location_ids = np.asarray(location_ids, dtype=np.int64)
+        prices = np.asarray(prices, dtype=np.float64)
+        recency = np.asarray(recency, dtype=np.int64)
+
+        keys = pair_keys(product_ids, location_ids)
+        order = np.lexsort((prices, keys))
+        keys, prices, recency = keys[order], prices[order], recency[order]
+
+        self.keys, starts, self.counts = np.unique(keys, return_index=True, return_counts=True)
+        group = np.repeat(np.arange(len(self.keys)), self.counts)
+
+        self.median = grouped_quantile(prices, starts, self.counts, 0.5)
+        self.q1 = grouped_quantile(prices, starts, self.counts, 0.25)
+        self.q3 = grouped_quantile(prices, starts, self.counts, 0.75)
+
+        deviations = np.abs(prices - self.median[group])
+        deviations = deviations[np.lexsort((deviations, group))]
+        self.mad = grouped_quantile(deviations, starts, self.counts, 0.5)
+
+        latest = recency <= LEGACY_WINDOW
+        latest_counts = np.bincount(group[latest], minlength=len(self.keys))
+        latest_sums = np.bincount(group[latest], weights=prices[latest], minlength=len(self.keys))
+        self.legacy_mean = latest_sums / np.maximum(latest_counts, 1)
+
+        self.counts = np.append(self.counts, 0)
+        for name in ('median', 'q1', 'q3', 'mad', 'legacy_mean'):
+            setattr(self, name, np.append(getattr(self, name), np.nan))
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        """Array index of each pair key, the trailing no-history entry for unknown pairs"""
+        index = np.searchsorted(self.keys, keys)
+        found = index < len(self.keys)
+        found[found] = self.keys[index[found]] == keys[found]
+        index[~found] = len(self.keys)
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def load(cls, conn, limit: int = 100) -> 'PriceWindow':
+        with conn.cursor() as cursor:
+            cursor.execute(WINDOW_QUERY, (limit,))
+            rows = cursor.fetchall()
+        return cls(
+            [row['product_id'] for row in rows],
+            [row['location_id'] for row in rows],
+            [float(row['price']) for row in rows],
+            [row['recency'] for row in rows],
+        )
+
+
+class AnomalyScreen:
+    """Scores records against a PriceWindow and tags the ones that look wrong
+
+    Each record gets an `anomaly` object: `score` is the robust z-score
+    0.6745 * (price - median) / MAD, `tags` lists the tests it failed
+    ('mad', 'iqr', 'legacy_30pct') and `flagged` is the verdict the ingestion
+    worker stores. Pairs with at least `min_samples` prices are judged by the
+    MAD test, which a few bad approved prices cannot drag around; pairs with
+    less history fall back to the worker's 30% rule. When the MAD is 0 (all
+    recent prices equal) it is floored at `min_spread` of the median so a
+    small move is not an infinite score.
+    """
+
+    def __init__(self, window: PriceWindow, min_samples: int = 5, min_spread: float = 0.02):
+        self.window = window
+        self.min_samples = min_samples
+        self.min_spread = min_spread
+
+    def score(self, records: List[Dict]) -> int:
+        """Attach an `anomaly` object to every record in place, returning how many were flagged"""
+        if not records:
+            return 0
+
+        keys = pair_keys(
+            np.fromiter((r['product_id'] for r in records), dtype=np.int64, count=len(records)),
+            np.fromiter((r['location_id'] for r in records), dtype=np.int64, count=len(records)),
+        )
+        prices = np.fromiter((float(r['price']) for r in records), dtype=np.float64, count=len(records))
+
+        w = self.window
+        index = w.lookup(keys)
+        samples = w.counts[index]
+        median = w.median[index]
+        iqr = w.q3[index] - w.q1[index]
+        legacy_mean = w.legacy_mean[index]
+
+        # NaN statistics (unknown pairs) compare False, so those records pass
+        with np.errstate(invalid='ignore', divide='ignore'):
+            robust = samples >= self.min_samples
+            mad = np.maximum(w.mad[index], self.min_spread * median)
+            z = np.where(robust, MAD_SCALE * (prices - median) / mad, 0.0)
+            mad_outlier = robust & (np.abs(z) > MAD_THRESHOLD)
+            iqr_outlier = robust & (
+                (prices < w.q1[index] - IQR_FENCE * iqr) | (prices > w.q3[index] + IQR_FENCE * iqr)
+            )
+            legacy_change = np.abs(prices - legacy_mean) / legacy_mean
+            legacy_outlier = legacy_change > LEGACY_THRESHOLD
+            median_change = (prices - median) / median
+
+        flagged = np.where(robust, mad_outlier, legacy_outlier)
+
+        for i, record in enumerate(records):
+            tags = [
+                tag for tag, hit in (('mad', mad_outlier[i]), ('iqr', iqr_outlier[i]), ('legacy_30pct', legacy_outlier[i]))
+                if hit
+            ]
+            record['anomaly'] = {
+                'version': SCREEN_VERSION,
+                'score': round(float(z[i]), 3),
+                'samples': int(samples[i]),
+                'tags': tags,
+                'flagged': bool(flagged[i]),
+                'reason': self.reason(
+                    robust[i], median[i], median_change[i], z[i], legacy_mean[i], legacy_change[i]
+                ) if flagged[i] else None,
+            }
+        return int(flagged.sum())
+
+    @staticmethod
+    def reason(robust, median, median_change, z, legacy_mean, legacy_change) -> str:
+        if robust:
+            return (f"Price {abs(median_change) * 100:.1f}% {'above' if median_change > 0 else 'below'} "
+                    f"recent median (₦{median:.2f}), robust z-score {z:.1f}")
+        # Same wording as the ingestion worker
+        return f"Price changed {legacy_change * 100:.1f}% from recent average (₦{legacy_mean:.2f})"
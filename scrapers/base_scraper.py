@@ -1,159 +1,816 @@
 """
 Base scraper class with common functionality for all scrapers
 """
+import hashlib
 import json
 import logging
-from datetime import datetime
-from typing import Dict, List, Optional
-import pika
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import queue
+import threading
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
 import os
 from dotenv import load_dotenv
 
+# Only stdlib-backed helpers are imported here. HTTP, HTML parsing, Postgres,
+# RabbitMQ and numpy are imported where they are first used, so importing a
+# scraper costs only what that scraper actually runs
+from dedupe import FingerprintStore, fingerprint
+from listing_store import ListingStore
+from location_matcher import LocationMatcher
+from lookup_cache import LookupCache
+from metrics import RunMetrics
+from scrape_frequency import FrequencyPlanner
+
+if TYPE_CHECKING:
+    from fetcher import Fetcher, FetchResult
+    from html_extract import ListingExtractor, Selector
+
 load_dotenv()
 
+# Local state kept between runs (seen listings, caches, spools)
+STATE_DIR = os.getenv(
+    'SCRAPER_STATE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.scraper_state')
+)
+
+def state_path(filename: str) -> str:
+    """Path of a file inside STATE_DIR, creating the directory if needed"""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    return os.path.join(STATE_DIR, filename)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
 class BaseScraper:
+    # Politeness budget for fetch_pages, applied per host.
+    # Override in child classes to match what each site tolerates.
+    requests_per_second = 0.5
+    burst = 2
+    max_concurrency = 3
+    request_timeout = 30
+    max_retries = int(os.getenv('HTTP_MAX_RETRIES', '3'))
+    
+    # On-disk HTTP cache for fetched pages (conditional requests, LRU bounded)
+    http_cache_enabled = os.getenv('HTTP_CACHE', '1') != '0'
+    http_cache_max_mb = int(os.getenv('HTTP_CACHE_MAX_MB', '200'))
+    
+    # Append every fetched page to the raw page archive (page_archive.py) so
+    # it can be parsed again later with replay.py. Off by default.
+    page_archive_enabled = os.getenv('PAGE_ARCHIVE', '0') == '1'
+    page_archive_dir = os.getenv('PAGE_ARCHIVE_DIR')
+    page_archive_segment_mb = int(os.getenv('PAGE_ARCHIVE_SEGMENT_MB', '256'))
+    
+    # HTML parser backend for extract_listings: 'lxml' or 'soup'
+    parser_backend = os.getenv('SCRAPER_PARSER', 'lxml')
+    
+    # Child classes declare {'container': [Selector, ...], field: [Selector, ...]}
+    listing_selectors: Dict[str, List['Selector']] = {}
+    
+    # Records per queue message, and how long a partial batch may wait (seconds)
+    # before it is committed to the outbox
+    publish_batch_size = int(os.getenv('PUBLISH_BATCH_SIZE', '100'))
+    publish_max_delay = float(os.getenv('PUBLISH_MAX_DELAY', '2'))
+    
+    # How long a run waits at the end for the outbox to be forwarded to
+    # RabbitMQ. Whatever is left is sent by the next run of the scraper.
+    outbox_drain_timeout = float(os.getenv('OUTBOX_DRAIN_TIMEOUT', '30'))
+    
+    # Cross-run duplicate suppression: a record repeating an observation
+    # (product, location, price, title) published less than DEDUPE_TTL_HOURS
+    # ago is not sent again. Bulk runs are never deduplicated.
+    dedupe_enabled = os.getenv('DEDUPE', '1') != '0'
+    dedupe_ttl_hours = float(os.getenv('DEDUPE_TTL_HOURS', '24'))
+    dedupe_max_entries = int(os.getenv('DEDUPE_MAX_ENTRIES', '200000'))
+    
+    # Score records against the recent approved prices of their product and
+    # location before publishing, so the ingestion worker can store the
+    # verdict without a query per record
+    anomaly_prescreen = os.getenv('ANOMALY_PRESCREEN', '1') != '0'
+    
+    # Records per COPY batch in bulk mode (backfills, historical imports)
+    bulk_batch_size = int(os.getenv('BULK_BATCH_SIZE', '50000'))
+    
+    # Records buffered between the scraping thread and the publisher.
+    # When the broker is slow the buffer fills and scraping waits.
+    stream_buffer_size = int(os.getenv('SCRAPER_STREAM_BUFFER', '500'))
+    
+    # How long the in-memory product/location indexes are trusted (seconds)
+    lookup_cache_ttl = int(os.getenv('LOOKUP_CACHE_TTL', '900'))
+    
+    # Adaptive mode: each product is rescraped once its prices are expected to
+    # have moved by `price_change_threshold`, within these bounds (minutes).
+    # Schedule the scraper at the minimum interval so volatile products are
+    # not held back by the scheduler.
+    adaptive_frequency = os.getenv('ADAPTIVE_SCRAPING', '0') == '1'
+    min_scrape_interval = float(os.getenv('MIN_SCRAPE_INTERVAL', '30'))
+    max_scrape_interval = float(os.getenv('MAX_SCRAPE_INTERVAL', '1440'))
+    price_change_threshold = float(os.getenv('PRICE_CHANGE_THRESHOLD', '0.05'))
+    
     def __init__(self, source_name: str):
         self.source_name = source_name
         self.logger = logging.getLogger(source_name)
         self.db_conn = None
-        self.rabbitmq_conn = None
-        self.channel = None
+        self.resources = None
+        self.outbox = None
+        self.drainer = None
+        self.outbox_buffer = []
+        self.outbox_buffer_since = None
+        self.bulk_loader = None
+        self.dedupe_store = None
+        self.dedupe_stats = Counter()
+        self.anomaly_screen = None
         self.source_id = None
+        self.headers = {}
+        self._fetcher = None
+        self.handled_pages = []
+        self.page_archive = None
+        self._extractor = None
+        self._listing_store = None
+        self._frequency_planner = None
+        self.run_started = time.time()
+        self.deadline = None
+        self.lookup_cache = LookupCache(ttl=self.lookup_cache_ttl)
+        self.location_matcher = None
+        self.unknown_locations = Counter()
+        self.metrics = RunMetrics(source_name)
+    
+    @property
+    def fetcher(self) -> 'Fetcher':
+        """Shared fetcher, created on first use so child classes can set headers first"""
+        if self._fetcher is None:
+            from fetcher import Fetcher
+            from http_cache import HttpCache
+            from http_session import RetryPolicy
+            
+            cache = None
+            if self.http_cache_enabled:
+                cache = HttpCache(state_path('http_cache'), max_bytes=self.http_cache_max_mb * 1024 * 1024)
+            
+            self._fetcher = Fetcher(
+                headers=self.headers,
+                rate=self.requests_per_second,
+                burst=self.burst,
+                max_concurrency=self.max_concurrency,
+                timeout=self.request_timeout,
+                cache=cache,
+                retry=RetryPolicy(max_retries=self.max_retries),
+                deadline=self.deadline,
+                cache_signature=self.parse_signature()
+            )
+        return self._fetcher
+    
+    def parse_settings(self) -> Dict:
+        """Everything that decides which records a page yields; extended by child classes"""
+        return {
+            name: [selector.xpath() for selector in selectors]
+            for name, selectors in self.listing_selectors.items()
+        }
+    
+    def parse_signature(self) -> str:
+        """Fingerprint of parse_settings(): cached pages parsed under another one are parsed again"""
+        settings = json.dumps(self.parse_settings(), sort_keys=True, default=str)
+        return hashlib.sha1(settings.encode('utf-8')).hexdigest()
+    
+    def page_handled(self, page: 'FetchResult'):
+        """Mark a page whose records have all been yielded
         
-    def connect_db(self):
-        """Connect to PostgreSQL database"""
+        Its HTTP cache entry is committed by commit_handled_pages() once those
+        records are in the outbox; a page whose parse or publish failed stays
+        unknown to the cache and is fetched and parsed again by the next run.
+        """
+        if page.cache_entry is not None:
+            self.handled_pages.append(page.cache_entry)
+    
+    def commit_handled_pages(self):
+        """Write the cache entries of the pages whose records have been handed off"""
+        pages, self.handled_pages = self.handled_pages, []
+        if not self._fetcher or not self._fetcher.cache:
+            return
+        for pending in pages:
+            try:
+                self._fetcher.cache.commit(pending)
+            except Exception as e:
+                # The page is only fetched and parsed again next run
+                self.logger.warning(f"Could not cache {pending.url}: {e}")
+    
+    def time_left(self) -> Optional[float]:
+        """Seconds until the run's deadline, None if the run has no time budget"""
+        return None if self.deadline is None else self.deadline - time.monotonic()
+    
+    def out_of_time(self) -> bool:
+        time_left = self.time_left()
+        return time_left is not None and time_left <= 0
+    
+    def fetch_pages(self, urls: Dict[Hashable, str]) -> Iterator['FetchResult']:
+        """Fetch pages concurrently within the politeness budget, yielding each as it completes"""
+        pages = self.fetcher.fetch_all(urls)
+        return self.archive_pages(pages) if self.page_archive else pages
+    
+    def archive_pages(self, pages: Iterator['FetchResult']) -> Iterator['FetchResult']:
+        """Append each new page to the page archive before handing it on
+        
+        Failed and unchanged (HTTP cache hit) pages are not archived: an
+        unchanged page is already in the archive from the run that fetched it,
+        and so is a cached body parsed again under a new parse signature.
+        """
         try:
-            self.db_conn = psycopg2.connect(
-                os.getenv('DATABASE_URL'),
-                cursor_factory=RealDictCursor
+            for page in pages:
+                known_body = page.cache_entry is not None and page.cache_entry.text is None
+                if page.ok and not page.unchanged and not known_body and page.text:
+                    query, page_no = self.archive_key(page.key)
+                    try:
+                        with self.metrics.stage('archive'):
+                            size = self.page_archive.append(
+                                self.source_name, page.url, page.text, query=query, page=page_no,
+                                status=page.status_code, run_started=self.run_started
+                            )
+                        self.metrics.count('archived_bytes', size)
+                    except Exception as e:
+                        # The archive is a convenience, never a reason to lose a run
+                        self.logger.warning(f"Could not archive {page.url}: {e}")
+                yield page
+        finally:
+            pages.close()
+    
+    def archive_key(self, key: Hashable) -> Tuple[Optional[str], Optional[int]]:
+        """(query, page number) a fetch key is archived under; keys are (query, page) tuples by convention"""
+        if isinstance(key, tuple) and len(key) == 2:
+            return str(key[0]), key[1]
+        return str(key), None
+    
+    def parse_archived_page(self, html: str, query: Optional[str], page: Optional[int]) -> List[Dict]:
+        """Override in child classes to support replay: the records of an archived page"""
+        raise NotImplementedError(f"{self.source_name} cannot parse archived pages")
+    
+    def begin_replay_run(self):
+        """Override in child classes to reset per-run parsing state (e.g. listings seen
+        on overlapping pages) before the archived pages of one run are parsed again"""
+        pass
+    
+    @property
+    def extractor(self) -> 'ListingExtractor':
+        """Listing extractor with this scraper's selectors compiled once"""
+        if self._extractor is None:
+            from html_extract import ListingExtractor
+            
+            fields = dict(self.listing_selectors)
+            containers = fields.pop('container')
+            self._extractor = ListingExtractor(containers, fields, backend=self.parser_backend)
+        return self._extractor
+    
+    def log_fetch_stats(self):
+        """Log request counts, retries and where fetch time went"""
+        stats = self._fetcher.stats
+        requests_made = stats['requests'] - stats['errors']
+        if requests_made:
+            self.logger.info(
+                f"HTTP: {stats['requests']} request(s), {stats['retries']} retr(y/ies), "
+                f"{stats['errors']} error(s), {stats['new_connections']} new connection(s); "
+                f"avg connect {stats['connect_seconds'] / requests_made * 1000:.0f} ms, "
+                f"wait {stats['wait_seconds'] / requests_made * 1000:.0f} ms, "
+                f"transfer {stats['transfer_seconds'] / requests_made * 1000:.0f} ms"
+            )
+        if self._fetcher.cache:
+            self.logger.info(f"HTTP cache: {dict(self._fetcher.cache.stats)}")
+    
+    def extract_listings(self, html: str) -> List[Dict[str, Optional[str]]]:
+        """Extract raw listing fields from a page with the configured parser backend"""
+        with self.metrics.stage('parse', backend=self.extractor.backend):
+            listings = self.extractor.extract(html)
+        self.metrics.count('listings', len(listings))
+        return listings
+    
+    def compare_parser_backends(self, html: str, repeat: int = 5) -> Dict:
+        """Time each parser backend on the same page and check their output matches"""
+        return self.extractor.compare(html, repeat=repeat)
+    
+    @property
+    def listing_store(self) -> ListingStore:
+        """Listing IDs seen by previous runs, opened on first use"""
+        if self._listing_store is None:
+            self._listing_store = ListingStore(state_path('listings.db'))
+        return self._listing_store
+    
+    def known_listings(self, listing_ids: Iterable[str]) -> Set[str]:
+        """The listing IDs that an earlier run of this scraper already saw"""
+        return self.listing_store.known(self.source_name, listing_ids, before=self.run_started)
+    
+    def remember_listings(self, listing_ids: Iterable[str]):
+        """Record listing IDs so later runs can stop paging when they reach them"""
+        self.listing_store.remember(self.source_name, listing_ids)
+    
+    @property
+    def frequency_planner(self) -> FrequencyPlanner:
+        """Per-product scrape intervals and price history, opened on first use"""
+        if self._frequency_planner is None:
+            self._frequency_planner = FrequencyPlanner(
+                state_path('frequency.db'),
+                min_interval=self.min_scrape_interval * 60,
+                max_interval=self.max_scrape_interval * 60,
+                change_threshold=self.price_change_threshold
+            )
+        return self._frequency_planner
+    
+    def due_products(self, products: List[str]) -> List[str]:
+        """The products to scrape this run: all of them, or in adaptive mode only those whose interval has passed"""
+        if not self.adaptive_frequency:
+            return products
+        
+        db_rates = {}
+        try:
+            product_ids = {name: self.get_product_id(name) for name in products}
+            db_rates = self.frequency_planner.db_rates(self.db_conn, product_ids)
+        except Exception as e:
+            # Without TimescaleDB history the planner falls back to its own
+            self.logger.warning(f"Price volatility query failed, using local history: {e}")
+            if self.db_conn:
+                self.db_conn.rollback()
+        
+        due = []
+        for plan in self.frequency_planner.plan(self.source_name, products, db_rates):
+            rate = f"{plan.rate * 100:.3f}%/h" if plan.rate is not None else "unknown"
+            next_in = 0 if plan.last_scraped is None else max(0, plan.last_scraped + plan.interval - time.time())
+            self.logger.info(
+                f"   {plan.product:<16} change {rate:<12} ({plan.basis}) every {plan.interval / 60:.0f} min"
+                + ("" if plan.due else f", next in {next_in / 60:.0f} min")
             )
+            self.metrics.count('products_planned', outcome='due' if plan.due else 'not_due')
+            if plan.due:
+                due.append(plan.product)
+        return due
+    
+    def record_scraped_products(self, products: Iterable[str], records: Iterable[Dict]):
+        """Adaptive mode: mark products as scraped and keep their prices per location for volatility"""
+        if not self.adaptive_frequency:
+            return
+        
+        location_prices: Dict[str, Dict[int, List[float]]] = {product: {} for product in products}
+        for record in records:
+            prices = location_prices.get(record['product_name'])
+            if prices is not None:
+                prices.setdefault(record['location_id'], []).append(record['price'])
+        
+        for product, prices in location_prices.items():
+            self.frequency_planner.record(self.source_name, product, prices)
+    
+    def connect_db(self):
+        """Connect to PostgreSQL database, borrowing from the run's shared pool if there is one"""
+        try:
+            if self.resources:
+                self.db_conn = self.resources.acquire_db()
+                self.source_id = self.resources.source_id(self.source_name, self.lookup_source_id)
+            else:
+                import psycopg2
+                from psycopg2.extras import RealDictCursor
+                
+                self.db_conn = psycopg2.connect(
+                    os.getenv('DATABASE_URL'),
+                    cursor_factory=RealDictCursor
+                )
+                self.source_id = self.lookup_source_id()
             self.logger.info("Database connected successfully")
             
-            # Get or create source ID
-            with self.db_conn.cursor() as cursor:
-                cursor.execute(
-                    "SELECT id FROM sources WHERE name = %s",
-                    (self.source_name,)
-                )
-                result = cursor.fetchone()
-                if result:
-                    self.source_id = result['id']
-                else:
-                    cursor.execute(
-                        """INSERT INTO sources (name, url, source_type) 
-                           VALUES (%s, %s, 'website') RETURNING id""",
-                        (self.source_name, 'sample')
-                    )
-                    self.source_id = cursor.fetchone()['id']
-                    self.db_conn.commit()
+            # Preload products and locations so lookups stay in memory
+            self.lookup_cache.load(self.db_conn)
+            self.lookup_cache.stats.clear()
                     
         except Exception as e:
             self.logger.error(f"Database connection failed: {e}")
             raise
     
-    def connect_rabbitmq(self):
-        """Connect to RabbitMQ"""
-        try:
-            params = pika.URLParameters(os.getenv('RABBITMQ_URL'))
-            self.rabbitmq_conn = pika.BlockingConnection(params)
-            self.channel = self.rabbitmq_conn.channel()
-            
-            # Declare queue
-            self.channel.queue_declare(
-                queue='scraped_prices',
-                durable=True
+    def lookup_source_id(self) -> int:
+        """Get or create this scraper's row in sources"""
+        with self.db_conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT id FROM sources WHERE name = %s",
+                (self.source_name,)
             )
-            self.logger.info("RabbitMQ connected successfully")
+            result = cursor.fetchone()
+            if result:
+                return result['id']
             
-        except Exception as e:
-            self.logger.error(f"RabbitMQ connection failed: {e}")
-            raise
+            cursor.execute(
+                """INSERT INTO sources (name, url, source_type) 
+                   VALUES (%s, %s, 'website') RETURNING id""",
+                (self.source_name, 'sample')
+            )
+            source_id = cursor.fetchone()['id']
+            self.db_conn.commit()
+            return source_id
+    
+    def close_db(self):
+        """Close the connection, or hand it back to the shared pool"""
+        if self.db_conn is None:
+            return
+        if self.resources:
+            self.resources.release_db(self.db_conn)
+        else:
+            self.db_conn.close()
+        self.db_conn = None
+    
+    def open_rabbitmq_channel(self):
+        """Connect to RabbitMQ and declare the queue. Returns (connection, channel)
+        
+        With shared run resources this is a channel on the process-wide
+        connection, and closing the returned "connection" only closes the channel.
+        """
+        from publisher import QUEUE_NAME
+        
+        if self.resources:
+            with self.metrics.stage('broker_connect'):
+                lease = self.resources.amqp_channel(QUEUE_NAME)
+            return lease, lease
+        
+        import pika
+        with self.metrics.stage('broker_connect'):
+            params = pika.URLParameters(os.getenv('RABBITMQ_URL'))
+            connection = pika.BlockingConnection(params)
+            try:
+                channel = connection.channel()
+                channel.queue_declare(
+                    queue=QUEUE_NAME,
+                    durable=True
+                )
+            except Exception:
+                connection.close()
+                raise
+        return connection, channel
+    
+    def connect_rabbitmq(self):
+        """Open the local outbox and start forwarding it to RabbitMQ in the background
+        
+        Scraping does not wait for the broker: if it is down, records are kept
+        in the outbox until it is reachable again.
+        """
+        from outbox import Outbox, OutboxDrainer
+        
+        self.outbox = Outbox(state_path('outbox.db'))
+        waiting = self.outbox.pending(self.source_name)
+        if waiting:
+            self.logger.info(f"Outbox: {waiting} record(s) left by earlier runs")
+        
+        self.drainer = OutboxDrainer(
+            self.outbox,
+            self.source_id,
+            self.source_name,
+            connect=self.open_rabbitmq_channel,
+            batch_size=self.publish_batch_size,
+            logger=self.logger,
+            on_batch=self.record_publish
+        )
+        self.drainer.start()
     
     def get_product_id(self, product_name: str) -> Optional[int]:
-        """Get product ID from database by name"""
+        """Get product ID by name from the in-memory lookup cache"""
         try:
-            with self.db_conn.cursor() as cursor:
-                cursor.execute(
-                    "SELECT id FROM products WHERE LOWER(name) LIKE LOWER(%s)",
-                    (f"%{product_name}%",)
-                )
-                result = cursor.fetchone()
-                return result['id'] if result else None
+            with self.metrics.stage('lookup', kind='product'):
+                self.lookup_cache.refresh_if_stale(self.db_conn)
+                return self.lookup_cache.product_id(product_name)
         except Exception as e:
             self.logger.error(f"Error getting product ID: {e}")
             return None
     
     def get_location_id(self, location_name: str) -> Optional[int]:
-        """Get location ID from database by name"""
+        """Get location ID by name from the in-memory lookup cache"""
         try:
-            with self.db_conn.cursor() as cursor:
-                cursor.execute(
-                    "SELECT id FROM locations WHERE LOWER(name) LIKE LOWER(%s)",
-                    (f"%{location_name}%",)
-                )
-                result = cursor.fetchone()
-                return result['id'] if result else None
+            with self.metrics.stage('lookup', kind='location'):
+                self.lookup_cache.refresh_if_stale(self.db_conn)
+                return self.lookup_cache.location_id(location_name)
         except Exception as e:
             self.logger.error(f"Error getting location ID: {e}")
             return None
     
+    def build_location_matcher(self, *tiers: Dict[str, int]):
+        """Compile {location text: location ID} maps, most specific tier first, into one matcher"""
+        self.location_matcher = LocationMatcher(*tiers)
+    
+    def match_location(self, raw_location_text: str) -> Optional[int]:
+        """Resolve free-text location with the compiled matcher, recording unknown locations"""
+        with self.metrics.stage('lookup', kind='location'):
+            match = self.location_matcher.match(raw_location_text) if self.location_matcher else None
+        if match:
+            return match[1]
+        
+        self.unknown_locations[raw_location_text] += 1
+        return None
+    
     def publish_to_queue(self, price_data: Dict):
-        """Publish scraped price data to RabbitMQ"""
+        """Queue scraped price data for the outbox, committing it in size/time bounded batches"""
+        if self.bulk_loader:
+            self.bulk_loader.add(price_data, self.source_id)
+            return
+        
+        if not self.outbox_buffer:
+            self.outbox_buffer_since = time.monotonic()
+        self.outbox_buffer.append(price_data)
+        
+        if len(self.outbox_buffer) >= self.publish_batch_size:
+            self.flush_outbox()
+        else:
+            self.flush_outbox_if_due()
+    
+    def flush_outbox_if_due(self):
+        if self.outbox_buffer and time.monotonic() - self.outbox_buffer_since >= self.publish_max_delay:
+            self.flush_outbox()
+    
+    def flush_outbox(self):
+        """Commit buffered records to the outbox and wake the drainer"""
+        if not self.outbox_buffer:
+            return
+        records, self.outbox_buffer = self.outbox_buffer, []
+        fingerprints = None
+        if self.dedupe_store:
+            records, fingerprints = self.suppress_duplicates(records)
+            if not records:
+                return
+        if self.anomaly_screen:
+            with self.metrics.stage('anomaly_screen'):
+                flagged = self.anomaly_screen.score(records)
+            self.metrics.count('anomaly_flagged', flagged)
+        
+        self.outbox.put(self.source_id, self.source_name, records)
+        self.metrics.count('outbox_written', len(records))
+        # Only what is safely in the outbox counts as published
+        if fingerprints:
+            self.dedupe_store.remember(self.source_name, fingerprints)
+        self.drainer.notify()
+    
+    def suppress_duplicates(self, records: List[Dict]):
+        """Drop records that repeat a recently published observation. Returns (new records, their fingerprints)"""
+        with self.metrics.stage('dedupe'):
+            by_fingerprint = {}
+            for record in records:
+                by_fingerprint.setdefault(fingerprint(self.source_name, record), record)
+            fresh = self.dedupe_store.fresh(self.source_name, by_fingerprint)
+            new = {fp: record for fp, record in by_fingerprint.items() if fp not in fresh}
+        
+        suppressed = len(records) - len(new)
+        self.dedupe_stats['new'] += len(new)
+        self.dedupe_stats['suppressed'] += suppressed
+        self.metrics.count('dedupe_records', len(new), outcome='new')
+        self.metrics.count('dedupe_records', suppressed, outcome='suppressed')
+        return list(new.values()), list(new)
+    
+    def load_anomaly_screen(self):
+        """Load the recent approved price window once for the run; without it the worker checks each record itself"""
         try:
-            message = json.dumps({
-                'source_id': self.source_id,
-                'source_name': self.source_name,
-                'data': price_data,
-                'scraped_at': datetime.utcnow().isoformat()
-            })
-            
-            self.channel.basic_publish(
-                exchange='',
-                routing_key='scraped_prices',
-                body=message,
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # make message persistent
-                )
-            )
-            self.logger.info(f"Published: {price_data.get('product_name')} - ₦{price_data.get('price')}")
+            from anomaly_screen import AnomalyScreen, PriceWindow
             
+            with self.metrics.stage('anomaly_window'):
+                window = PriceWindow.load(self.db_conn)
+            self.anomaly_screen = AnomalyScreen(window)
+            self.logger.info(f"Anomaly pre-screen: recent prices of {len(window)} product/location pair(s) loaded")
         except Exception as e:
-            self.logger.error(f"Failed to publish to queue: {e}")
+            self.logger.warning(f"Anomaly pre-screen disabled, recent prices could not be loaded: {e}")
+            self.db_conn.rollback()
+    
+    def log_dedupe_stats(self):
+        """Log and export the share of records suppressed as duplicates this run"""
+        total = sum(self.dedupe_stats.values())
+        if not total:
+            return
+        ratio = self.dedupe_stats['suppressed'] / total
+        self.metrics.gauge('dedupe_suppression_ratio', ratio)
+        self.logger.info(
+            f"Dedupe: {self.dedupe_stats['new']} new or changed, "
+            f"{self.dedupe_stats['suppressed']} suppressed ({ratio:.0%})"
+        )
+    
+    def record_publish(self, records: int, seconds: float, confirmed: bool):
+        """Publisher callback: time each batch and count confirmed / failed records"""
+        self.metrics.observe('publish', seconds)
+        self.metrics.count('published_records' if confirmed else 'publish_failures', records)
     
-    def scrape(self) -> List[Dict]:
-        """Override this method in child classes"""
+    def drain_outbox(self) -> int:
+        """Commit the last records and wait (bounded) for the outbox to reach RabbitMQ.
+        Returns how many records are still waiting"""
+        self.flush_outbox()
+        timeout = self.outbox_drain_timeout
+        time_left = self.time_left()
+        if time_left is not None:
+            timeout = min(timeout, max(1.0, time_left))
+        
+        pending = self.drainer.drain(timeout)
+        self.logger.info(f"Published {self.drainer.published} record(s) from the outbox")
+        if pending:
+            self.logger.warning(
+                f"📦 {pending} record(s) kept in the outbox ({self.drainer.last_error}), "
+                f"they will be sent by the next run"
+            )
+        return pending
+    
+    def scrape(self) -> Iterable[Dict]:
+        """Override this method in child classes
+        
+        Return a list, or better yield records as they are found so they
+        are published while scraping continues.
+        """
         raise NotImplementedError("Scrape method must be implemented")
     
-    def run(self):
-        """Main execution method"""
+    def iter_scraped(self, on_idle: Optional[Callable[[], None]] = None,
+                     idle_interval: float = 0.5, records: Optional[Iterable[Dict]] = None) -> Iterator[Dict]:
+        """Run scrape() on a producer thread and yield its records through a bounded queue
+        
+        `on_idle` is called whenever no record arrived for `idle_interval`
+        seconds, so the consumer can flush time-bounded batches and keep its
+        broker connection alive while the scraper waits on the network.
+        `records` replaces scrape() as the producer's source.
+        """
+        buffer = queue.Queue(maxsize=self.stream_buffer_size)
+        done = object()
+        stop = threading.Event()
+        errors = []
+        
+        def put(item):
+            while not stop.is_set():
+                try:
+                    buffer.put(item, timeout=idle_interval)
+                    return
+                except queue.Full:
+                    continue
+        
+        def produce():
+            try:
+                for record in (self.scrape() if records is None else records):
+                    if stop.is_set():
+                        return
+                    put(record)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                put(done)
+        
+        producer = threading.Thread(target=produce, name=f"{self.source_name} scrape", daemon=True)
+        producer.start()
+        
         try:
+            while True:
+                try:
+                    item = buffer.get(timeout=idle_interval)
+                except queue.Empty:
+                    if on_idle:
+                        on_idle()
+                    continue
+                
+                if item is done:
+                    break
+                yield item
+        finally:
+            # Unblock the producer if the consumer stopped early
+            stop.set()
+            producer.join(timeout=idle_interval * 2)
+        
+        if errors:
+            raise errors[0]
+    
+    def on_stream_idle(self):
+        """Commit a batch that has waited long enough"""
+        if not self.bulk_loader:
+            self.flush_outbox_if_due()
+    
+    def record_run_stats(self):
+        """Copy the fetcher, HTTP cache and lookup cache counters of this run into the metrics"""
+        for key, value in self.lookup_cache.stats.items():
+            self.metrics.count(f"lookup_cache_{key}", value)
+        if self._fetcher:
+            for key, value in self._fetcher.stats.items():
+                self.metrics.count(f"http_{key}", value)
+            if self._fetcher.cache:
+                for key, value in self._fetcher.cache.stats.items():
+                    self.metrics.count(f"http_cache_{key}", value)
+    
+    def run(self, deadline: Optional[float] = None, bulk: bool = False, resources=None,
+            records: Optional[Iterable[Dict]] = None):
+        """Main execution method
+        
+        `deadline` (a time.monotonic() value) is the run's time budget: no
+        request is sent after it and the records scraped so far are published.
+        
+        With `bulk` the records are COPY'd straight into scraped_prices
+        instead of going through RabbitMQ; for backfills only.
+        
+        `resources` (a resources.RunResources) lends this run its Postgres and
+        RabbitMQ connections; without it the scraper opens its own.
+        
+        `records` are published instead of scraping (replay.py's re-parsed
+        archive pages); they are historical, so they skip cross-run dedupe and
+        the anomaly pre-screen.
+        """
+        try:
+            self.resources = resources
+            self.handled_pages = []
+            self.run_started = time.time()
+            self.deadline = deadline
+            self.metrics.start()
             self.logger.info(f"Starting {self.source_name} scraper...")
-            self.connect_db()
-            self.connect_rabbitmq()
-            
-            # Run scraping
-            results = self.scrape()
+            if deadline is not None:
+                self.logger.info(f"Time budget: {self.time_left():.0f}s")
+            with self.metrics.stage('db_connect'):
+                self.connect_db()
+            if bulk:
+                from bulk_loader import BulkLoader
+                self.bulk_loader = BulkLoader(self.db_conn, batch_size=self.bulk_batch_size, logger=self.logger)
+            else:
+                if self.dedupe_enabled and records is None:
+                    self.dedupe_store = FingerprintStore(
+                        state_path('dedupe.db'),
+                        ttl=self.dedupe_ttl_hours * 3600,
+                        max_entries=self.dedupe_max_entries
+                    )
+                    self.dedupe_stats.clear()
+                # The screen's window is the last days of prices, which says
+                # nothing about historical records: the worker scores those
+                if self.anomaly_prescreen and records is None:
+                    self.load_anomaly_screen()
+                self.connect_rabbitmq()
             
-            self.logger.info(f"Scraped {len(results)} items")
+            if self.page_archive_enabled and records is None:
+                from page_archive import PageArchive
+                self.page_archive = PageArchive(
+                    self.page_archive_dir or state_path('page_archive'),
+                    max_segment_bytes=self.page_archive_segment_mb * 1024 * 1024
+                )
             
-            # Process results
-            for item in results:
+            # Records go to the durable outbox as they are scraped and are
+            # forwarded to RabbitMQ by the drainer thread meanwhile
+            scraped = 0
+            for item in self.iter_scraped(on_idle=self.on_stream_idle, records=records):
                 self.publish_to_queue(item)
+                scraped += 1
+            
+            self.logger.info(f"Scraped {scraped} items")
+            if self.out_of_time():
+                self.logger.warning("⏱️  Time budget used up, the remaining pages were not fetched")
+                self.metrics.count('deadline_exceeded')
+            self.metrics.count('records', scraped)
+            
+            if self.bulk_loader:
+                with self.metrics.stage('bulk_load'):
+                    result = self.bulk_loader.close()
+                self.commit_handled_pages()
+                self.logger.info(f"Bulk load: {result}")
+                self.metrics.count('bulk_loaded', result.inserted)
+                self.metrics.count('listings_rejected', result.invalid, reason='invalid')
+            else:
+                pending = self.drain_outbox()
+                # Every record is in the outbox now, whether sent yet or not
+                self.commit_handled_pages()
+                self.metrics.gauge('outbox_pending', pending)
+                self.log_dedupe_stats()
             
+            self.logger.info(f"Lookup cache: {dict(self.lookup_cache.stats)}")
+            if self._fetcher:
+                self.log_fetch_stats()
+            if self.unknown_locations:
+                self.logger.warning(
+                    f"Skipped {sum(self.unknown_locations.values())} listing(s) with unknown locations: "
+                    f"{dict(self.unknown_locations.most_common(10))}"
+                )
             self.logger.info("Scraping completed successfully")
+            self.metrics.finish('success')
             
         except Exception as e:
             self.logger.error(f"Scraper run failed: {e}")
+            self.metrics.finish('failed')
             raise
         finally:
-            if self.rabbitmq_conn:
-                self.rabbitmq_conn.close()
-            if self.db_conn:
-                self.db_conn.close()
\ No newline at end of file
+            drainer_stopped = True
+            if self.drainer:
+                # Keep what was scraped before a failure; the next run sends it
+                if self.outbox_buffer:
+                    self.flush_outbox()
+                # Bounded by the run's deadline: a drainer stuck in a broker
+                # call must not hold the run (and its scheduler slot) past it
+                time_left = self.time_left()
+                drainer_stopped = self.drainer.stop(
+                    timeout=self.outbox_drain_timeout if time_left is None else max(1.0, time_left)
+                )
+                self.drainer = None
+            if self.outbox:
+                # A drainer left running still uses the outbox connection
+                if drainer_stopped:
+                    self.outbox.close()
+                self.outbox = None
+            self.bulk_loader = None
+            self.anomaly_screen = None
+            if self.dedupe_store:
+                self.dedupe_store.expire()
+                self.dedupe_store.close()
+                self.dedupe_store = None
+            self.record_run_stats()
+            if self._fetcher:
+                self._fetcher.close()
+                self._fetcher = None
+            if self.page_archive:
+                self.page_archive.close()
+                self.page_archive = None
+            if self._listing_store:
+                self._listing_store.close()
+                self._listing_store = None
+            if self._frequency_planner:
+                self._frequency_planner.close()
+                self._frequency_planner = None
+            self.close_db()
\ No newline at end of file
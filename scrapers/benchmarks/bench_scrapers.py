@@ -0,0 +1,333 @@
+"""
+Offline benchmarks for the scraper hot paths
+Runs against the checked-in Jiji search page fixtures (and synthetic pages
+scaled up from them) with a local broker stub - no network, DB or RabbitMQ.
+
+Usage:
+    python benchmarks/bench_scrapers.py --output bench.json
+    python benchmarks/bench_scrapers.py --listings 20000 --repeat 5
+    python benchmarks/bench_scrapers.py --compare before.json after.json
+"""
+import argparse
+import glob
+import random
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRAPERS_DIR = os.path.dirname(BENCH_DIR)
+FIXTURES_DIR = os.path.join(BENCH_DIR, 'fixtures')
+
+sys.path.insert(0, SCRAPERS_DIR)
+sys.path.insert(0, os.path.join(SCRAPERS_DIR, 'scrapers'))
+
+from anomaly_screen import AnomalyScreen, PriceWindow
+from html_extract import BACKENDS
+from jiji_scraper import JijiScraper
+from lookup_cache import LookupIndex
+from outbox import Outbox, OutboxDrainer
+
+# Product names as inserted by init-db.sql, in ID order
+PRODUCTS = [
+    'Rice (Local)', 'Rice (Foreign)', 'Beans (Brown)', 'Tomatoes',
+    'Onions', 'Palm Oil', 'Yam', 'Garri (White)',
+]
+
+LISTING_PATTERN = re.compile(
+    r'<div class="b-list-advert__gallery__item.*?\n      </div>\n',
+    re.DOTALL
+)
+
+
+class StubChannel:
+    """Stands in for a pika BlockingChannel: keeps message sizes, optionally
+    sleeping `confirm_latency` seconds per publish to mimic a broker round trip"""
+
+    def __init__(self, confirm_latency: float = 0.0):
+        self.confirm_latency = confirm_latency
+        self.messages = 0
+        self.bytes = 0
+
+    def confirm_delivery(self):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if self.confirm_latency:
+            time.sleep(self.confirm_latency)
+        self.messages += 1
+        self.bytes += len(body)
+
+
+class StubConnection:
+    def process_data_events(self, time_limit=None):
+        pass
+
+    def close(self):
+        pass
+
+
+def offline_scraper(backend: str) -> JijiScraper:
+    """JijiScraper with lookups preloaded in memory instead of from Postgres"""
+    scraper = JijiScraper()
+    scraper.parser_backend = backend
+    scraper.lookup_cache.products = LookupIndex(enumerate(PRODUCTS, start=1))
+    scraper.lookup_cache.loaded_at = time.monotonic()
+    return scraper
+
+
+def load_fixtures():
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.html'))):
+        with open(path, encoding='utf-8') as f:
+            pages[os.path.basename(path)] = f.read()
+    return pages
+
+
+def synthetic_page(fixture: str, listings: int) -> str:
+    """Scale a fixture up to `listings` adverts by repeating its listings with unique URLs"""
+    blocks = LISTING_PATTERN.findall(fixture)
+    start = fixture.index(blocks[0])
+    end = fixture.index(blocks[-1]) + len(blocks[-1])
+
+    scaled = []
+    for index in range(listings):
+        block = blocks[index % len(blocks)]
+        scaled.append(re.sub(r'-(\d+)\.html', lambda m: f"-{m.group(1)}x{index}.html", block, count=1))
+    return fixture[:start] + ''.join(scaled) + fixture[end:]
+
+
+def measure(func, repeat: int):
+    """Best wall time over `repeat` runs, plus peak traced memory of one run"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def bench_parse(pages, repeat):
+    results = {}
+    for backend in BACKENDS:
+        scraper = offline_scraper(backend)
+        for name, html in pages.items():
+            products = [p for p, r in scraper.product_rules.items() if r['query'].replace('+', '_') in name]
+
+            def run():
+                scraper.seen_listings = set()
+                return scraper.parse_page(html, products)
+
+            seconds, peak, (records, listing_ids) = measure(run, repeat)
+            results[f"parse_listings[{backend}]/{name}"] = {
+                'seconds': seconds,
+                'listings': len(listing_ids),
+                'records': len(records),
+                'listings_per_sec': len(listing_ids) / seconds,
+                'peak_memory_bytes': peak,
+            }
+    return results
+
+
+def bench_extract_price(pages, repeat, size):
+    scraper = offline_scraper('lxml')
+    prices = [l['price'] for html in pages.values() for l in scraper.extract_listings(html) if l['price']]
+    prices = (prices * (size // len(prices) + 1))[:size]
+
+    seconds, peak, _ = measure(lambda: [scraper.extract_price(p) for p in prices], repeat)
+    return {'extract_price': {
+        'seconds': seconds, 'calls': size, 'calls_per_sec': size / seconds, 'peak_memory_bytes': peak,
+    }}
+
+
+def bench_location(pages, repeat, size):
+    scraper = offline_scraper('lxml')
+    locations = [l['location'] for html in pages.values() for l in scraper.extract_listings(html) if l['location']]
+    locations = (locations * (size // len(locations) + 1))[:size]
+
+    seconds, peak, _ = measure(lambda: [scraper.get_location_id(l) for l in locations], repeat)
+    return {'get_location_id': {
+        'seconds': seconds, 'calls': size, 'calls_per_sec': size / seconds, 'peak_memory_bytes': peak,
+    }}
+
+
+def bench_anomaly_screen(pages, repeat, size, locations=200, history=40):
+    """Score scraped records against a synthetic 7-day window of approved prices"""
+    scraper = offline_scraper('lxml')
+    records = []
+    for html in pages.values():
+        scraper.seen_listings = set()
+        records.extend(scraper.parse_page(html, list(scraper.product_rules))[0])
+    records = [dict(r) for r in (records * (size // max(1, len(records)) + 1))[:size]]
+
+    rng = random.Random(0)
+    window_rows = [
+        (product_id, location_id, rng.gauss(50000, 5000), recency)
+        for product_id in range(1, len(PRODUCTS) + 1)
+        for location_id in range(1, locations + 1)
+        for recency in range(1, history + 1)
+    ]
+    window = PriceWindow(*zip(*window_rows))
+
+    seconds, peak, _ = measure(lambda: AnomalyScreen(window).score(records), repeat)
+    return {'anomaly_screen.score': {
+        'seconds': seconds, 'records': size, 'records_per_sec': size / seconds, 'peak_memory_bytes': peak,
+    }}
+
+
+def bench_publish(pages, repeat, size, batch_sizes, confirm_latency):
+    scraper = offline_scraper('lxml')
+    records = []
+    for html in pages.values():
+        scraper.seen_listings = set()
+        records.extend(scraper.parse_page(html, list(scraper.product_rules))[0])
+    records = (records * (size // max(1, len(records)) + 1))[:size]
+
+    results = {}
+    for batch_size in batch_sizes:
+        def run():
+            # Records go through the outbox and its drainer thread, as in a real run
+            channel = StubChannel(confirm_latency)
+            directory = tempfile.mkdtemp(prefix='bench_outbox_')
+            try:
+                scraper.source_id = 1
+                scraper.publish_batch_size = batch_size
+                scraper.outbox = Outbox(os.path.join(directory, 'outbox.db'))
+                scraper.drainer = OutboxDrainer(
+                    scraper.outbox, 1, scraper.source_name,
+                    connect=lambda: (StubConnection(), channel),
+                    batch_size=batch_size, logger=scraper.logger
+                )
+                scraper.drainer.start()
+                for record in records:
+                    scraper.publish_to_queue(record)
+                scraper.drain_outbox()
+                scraper.outbox.close()
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+            return channel
+
+        seconds, peak, channel = measure(run, repeat)
+        results[f"publish_to_queue[batch={batch_size}]"] = {
+            'seconds': seconds,
+            'records': size,
+            'messages': channel.messages,
+            'bytes': channel.bytes,
+            'records_per_sec': size / seconds,
+            'peak_memory_bytes': peak,
+        }
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRAPERS_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args):
+    fixtures = load_fixtures()
+    pages = dict(fixtures)
+    for name, html in fixtures.items():
+        pages[f"synthetic_{args.listings}_{name}"] = synthetic_page(html, args.listings)
+
+    results = {}
+    results.update(bench_parse(pages, args.repeat))
+    results.update(bench_extract_price(fixtures, args.repeat, args.calls))
+    results.update(bench_location(fixtures, args.repeat, args.calls))
+    results.update(bench_anomaly_screen(fixtures, args.repeat, args.calls))
+    results.update(bench_publish(fixtures, args.repeat, args.calls, args.batch_sizes, args.confirm_latency))
+
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {
+            'listings': args.listings,
+            'repeat': args.repeat,
+            'calls': args.calls,
+            'confirm_latency': args.confirm_latency,
+        },
+        'results': results,
+    }
+
+
+RATE_KEYS = ('listings_per_sec', 'records_per_sec', 'calls_per_sec')
+
+
+def print_report(report):
+    print(f"\nBenchmarks @ {report['commit'] or 'unknown commit'} (Python {report['python']})")
+    print("-" * 96)
+    for name, result in report['results'].items():
+        rate_key = next(k for k in RATE_KEYS if k in result)
+        print(f"{name:<64} {result[rate_key]:>12,.0f} {rate_key.split('_')[0]}/s "
+              f"{result['peak_memory_bytes'] / 1024:>8,.0f} KiB")
+    print()
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    print(f"\n{before.get('commit')} -> {after.get('commit')}")
+    print("-" * 96)
+    for name, new in after['results'].items():
+        old = before['results'].get(name)
+        rate_key = next(k for k in RATE_KEYS if k in new)
+        if not old or rate_key not in old:
+            print(f"{name:<64} {'(new)':>12}")
+            continue
+        speedup = new[rate_key] / old[rate_key]
+        memory = new['peak_memory_bytes'] / max(1, old['peak_memory_bytes'])
+        print(f"{name:<64} {speedup:>8.2f}x speed {memory:>8.2f}x memory")
+    print()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark scraper hot paths offline')
+    parser.add_argument('--listings', type=int, default=5000, help='Listings per synthetic page')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per benchmark (best is kept)')
+    parser.add_argument('--calls', type=int, default=20000, help='Calls for the per-item benchmarks')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100, 500])
+    parser.add_argument('--confirm-latency', type=float, default=0.0005,
+                        help='Simulated broker confirm round trip per message (seconds)')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='Compare two saved result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    # Scrapers log every listing, which would dominate the timings
+    logging.disable(logging.WARNING)
+
+    report = run_benchmarks(args)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.output}")
@@ -0,0 +1,163 @@
+"""
+Regression tests for the scraper hot paths the benchmarks exercise
+Offline like bench_scrapers.py: no network, DB or RabbitMQ.
+
+Usage:
+    python -m pytest benchmarks
+"""
+import json
+import time
+from datetime import datetime, timezone
+from email.utils import formatdate
+
+import pytest
+import requests
+
+# Imported first: puts the scraper modules on sys.path
+from bench_scrapers import StubChannel, StubConnection
+from fetcher import CircuitBreaker
+from http_session import RetryPolicy
+from jiji_scraper import JijiScraper
+from outbox import Outbox, OutboxDrainer
+from units import KG, parse_quantities
+
+
+@pytest.fixture(scope='module')
+def jiji():
+    return JijiScraper()
+
+
+def test_location_does_not_match_inside_a_word(jiji):
+    # 'Ota' (Ogun) is a substring of 'Rotary'
+    assert jiji.location_matcher.match('Rotary') is None
+    assert jiji.location_matcher.match('Ogun, Ota') == ('Ota', 29)
+
+
+@pytest.mark.parametrize('text', ['Lagos, Lagos Island', 'Lagos Island, Lagos', 'lagos-island'])
+def test_longer_location_beats_its_prefix(jiji, text):
+    assert jiji.location_matcher.match(text) == ('Lagos Island', 22)
+
+
+def test_pack_count_multiplies_quantity():
+    quantity, dimension = parse_quantities(['5 x 1kg', 'Rice 50kg bag', 'no size'])
+    assert quantity[0] == 5.0
+    assert quantity[1] == 50.0
+    assert list(dimension) == [KG, KG, 0]
+
+
+def test_retry_after_http_date_is_honoured():
+    response = requests.Response()
+    response.status_code = 429
+    response.headers['Retry-After'] = formatdate(time.time() + 30, usegmt=True)
+
+    delay = RetryPolicy(backoff_base=1.0, backoff_max=60.0).delay(0, response)
+    assert 28 <= delay <= 30
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.05)
+    breaker.record(failed=True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.record(failed=True)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.before_request()
+
+    time.sleep(0.06)
+    assert breaker.before_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # One probe at a time
+    assert not breaker.before_request()
+
+    breaker.record(failed=False)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.before_request()
+
+
+class RefusingChannel(StubChannel):
+    """A broker that nacks every batch"""
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        raise RuntimeError('nacked')
+
+
+class CheckingChannel(StubChannel):
+    """Confirms batches, recording how many outbox rows still existed at publish time"""
+
+    def __init__(self, outbox: Outbox):
+        super().__init__()
+        self.outbox = outbox
+        self.pending_at_publish = []
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self.pending_at_publish.append(self.outbox.pending('test'))
+        super().basic_publish(exchange, routing_key, body, properties, mandatory)
+
+
+class CapturingChannel(StubChannel):
+    """Confirms batches, keeping every envelope sent"""
+
+    def __init__(self):
+        super().__init__()
+        self.envelopes = []
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self.envelopes.append(json.loads(body))
+        super().basic_publish(exchange, routing_key, body, properties, mandatory)
+
+
+def drain(outbox: Outbox, channel) -> OutboxDrainer:
+    drainer = OutboxDrainer(outbox, 1, 'test', lambda: (StubConnection(), channel), max_backoff=0.1)
+    drainer.start()
+    drainer.drain(timeout=0.5)
+    return drainer
+
+
+def test_outbox_rows_deleted_only_after_confirm(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.db'))
+    try:
+        outbox.put(1, 'test', [{'price': 100}, {'price': 200}, {'price': 300}])
+
+        drainer = drain(outbox, RefusingChannel())
+        assert drainer.published == 0
+        assert outbox.pending('test') == 3
+
+        channel = CheckingChannel(outbox)
+        drainer = drain(outbox, channel)
+        assert drainer.published == 3
+        assert channel.pending_at_publish == [3]
+        assert outbox.pending('test') == 0
+    finally:
+        outbox.close()
+
+
+def test_outbox_record_drained_late_keeps_its_scrape_time(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.db'))
+    try:
+        outbox.put(1, 'test', [{'price': 100}, {'price': 200, 'scraped_at': '2024-01-02T03:04:05'}])
+        # Scraped an hour before the broker came back
+        scraped = time.time() - 3600
+        with outbox.conn:
+            outbox.conn.execute("UPDATE outbox SET created_at = ?", (scraped,))
+
+        channel = CapturingChannel()
+        drain(outbox, channel)
+        [envelope] = channel.envelopes
+        first, second = envelope['records']
+        assert first['scraped_at'] == datetime.fromtimestamp(scraped, timezone.utc).replace(tzinfo=None).isoformat()
+        assert second['scraped_at'] == '2024-01-02T03:04:05'
+    finally:
+        outbox.close()
+
+
+def test_outbox_rows_sent_under_their_own_source_id(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.db'))
+    try:
+        outbox.put(1, 'test', [{'price': 100}])
+        outbox.put(2, 'test', [{'price': 200}, {'price': 300}])
+
+        channel = CapturingChannel()
+        drain(outbox, channel)
+        assert [(e['source_id'], len(e['records'])) for e in channel.envelopes] == [(1, 1), (2, 2)]
+        assert outbox.pending('test') == 0
+    finally:
+        outbox.close()
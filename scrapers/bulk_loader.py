@@ -0,0 +1,196 @@
+"""
+Bulk load of scraped records straight into scraped_prices
+For backfills and historical imports only: records skip RabbitMQ and the
+ingestion worker, are COPY'd into a staging table in large batches, and get
+the worker's validation and anomaly flagging as one set-based pass
+"""
+import csv
+import io
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from psycopg2.extensions import cursor as TupleCursor
+
+# Same rule as the ingestion worker's detectAnomaly: flag a price more than
+# 30% away from the average of the last 10 approved prices of the
+# product/location within 7 days. For historical records the window ends at
+# the record's own scraped_at instead of now.
+ANOMALY_THRESHOLD = 0.3
+
+STAGING_TABLE = """
+    CREATE TEMP TABLE IF NOT EXISTS bulk_scraped_prices (
+        product_id INTEGER,
+        location_id INTEGER,
+        source_id INTEGER,
+        price DECIMAL(10, 2),
+        unit VARCHAR(50),
+        currency VARCHAR(10),
+        price_per_kg DECIMAL(10, 2),
+        scraped_at TIMESTAMP
+    ) ON COMMIT DELETE ROWS
+"""
+
+INSERT_FROM_STAGING = """
+    WITH scored AS (
+        SELECT s.*, recent.avg_price,
+               ABS(s.price - recent.avg_price) / NULLIF(recent.avg_price, 0) AS price_change
+        FROM bulk_scraped_prices s
+        LEFT JOIN LATERAL (
+            SELECT AVG(price) AS avg_price
+            FROM (
+                SELECT p.price
+                FROM scraped_prices p
+                WHERE p.product_id = s.product_id
+                  AND p.location_id = s.location_id
+                  AND p.status = 'approved'
+                  AND p.scraped_at > s.scraped_at - INTERVAL '7 days'
+                  AND p.scraped_at <= s.scraped_at
+                ORDER BY p.scraped_at DESC
+                LIMIT 10
+            ) last_approved
+        ) recent ON true
+    ), inserted AS (
+        INSERT INTO scraped_prices
+            (product_id, location_id, source_id, price, unit, currency,
+             price_per_kg, scraped_at, status, flagged_reason)
+        SELECT product_id, location_id, source_id, price, unit, currency, price_per_kg, scraped_at,
+               CASE WHEN price_change > %(threshold)s THEN 'flagged' ELSE 'pending' END,
+               CASE WHEN price_change > %(threshold)s THEN
+                   'Price changed ' || to_char(price_change * 100, 'FM999999990.0')
+                   || '%% from recent average (₦' || to_char(avg_price, 'FM999999999990.00') || ')'
+               END
+        FROM scored
+        RETURNING status
+    )
+    SELECT status, COUNT(*) AS count FROM inserted GROUP BY status
+"""
+
+
+class BulkLoadResult:
+    def __init__(self):
+        self.inserted = 0
+        self.flagged = 0
+        self.invalid = 0
+        self.batches = 0
+
+    def __repr__(self):
+        return (f"BulkLoadResult(inserted={self.inserted}, flagged={self.flagged}, "
+                f"invalid={self.invalid}, batches={self.batches})")
+
+
+def is_valid(record: Dict) -> bool:
+    """The ingestion worker's validateData"""
+    if not record.get('product_id') or not record.get('location_id'):
+        return False
+    try:
+        if not record.get('price') or float(record['price']) <= 0:
+            return False
+    except (TypeError, ValueError):
+        return False
+    return bool(record.get('unit')) and bool(record.get('currency'))
+
+
+class BulkLoader:
+    """Buffers records and loads them in batches of `batch_size`, one transaction per batch"""
+
+    def __init__(self, conn, batch_size: int = 50000, logger: Optional[logging.Logger] = None):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.logger = logger or logging.getLogger(__name__)
+        self.pending: List[tuple] = []
+        self.result = BulkLoadResult()
+
+        with self.conn.cursor() as cursor:
+            cursor.execute(STAGING_TABLE)
+        self.conn.commit()
+
+    def add(self, record: Dict, source_id: int, scraped_at: Optional[str] = None):
+        """Validate a record and queue it for the next batch"""
+        if not is_valid(record):
+            self.result.invalid += 1
+            return
+
+        self.pending.append((
+            record['product_id'],
+            record['location_id'],
+            record.get('source_id') or source_id,
+            record['price'],
+            record['unit'],
+            record['currency'],
+            record.get('price_per_kg'),
+            record.get('scraped_at') or scraped_at or datetime.utcnow().isoformat(),
+        ))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """COPY the pending records into staging and insert them with anomaly flags"""
+        if not self.pending:
+            return
+
+        rows, self.pending = self.pending, []
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+
+        try:
+            with self.conn.cursor(cursor_factory=TupleCursor) as cursor:
+                cursor.copy_expert(
+                    """COPY bulk_scraped_prices
+                       (product_id, location_id, source_id, price, unit, currency, price_per_kg, scraped_at)
+                       FROM STDIN WITH (FORMAT csv)""",
+                    buffer
+                )
+                cursor.execute(INSERT_FROM_STAGING, {'threshold': ANOMALY_THRESHOLD})
+                counts = dict(cursor.fetchall())
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        flagged = counts.get('flagged', 0)
+        self.result.inserted += sum(counts.values())
+        self.result.flagged += flagged
+        self.result.batches += 1
+        self.logger.info(f"📥 Bulk loaded {sum(counts.values())} record(s), {flagged} flagged")
+
+    def close(self) -> BulkLoadResult:
+        self.flush()
+        return self.result
+
+
+def read_records(path: str) -> Iterator[Dict]:
+    """Records from a JSON Lines file of batch envelopes (as published to the queue) or single records
+
+    Envelope fields (source_id, scraped_at) are copied onto their records
+    unless a record sets its own.
+    """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item.get('records'), list):
+                for record in item['records']:
+                    yield {
+                        'source_id': item.get('source_id'),
+                        'scraped_at': item.get('scraped_at'),
+                        **record,
+                    }
+            elif isinstance(item.get('data'), dict):
+                # Older single-record messages
+                yield {'source_id': item.get('source_id'), 'scraped_at': item.get('scraped_at'), **item['data']}
+            else:
+                yield item
+
+
+def bulk_import(conn, path: str, source_id: Optional[int] = None, batch_size: int = 50000,
+                logger: Optional[logging.Logger] = None) -> BulkLoadResult:
+    """Load a JSON Lines export into scraped_prices"""
+    loader = BulkLoader(conn, batch_size=batch_size, logger=logger)
+    for record in read_records(path):
+        loader.add(record, source_id)
+    return loader.close()
@@ -0,0 +1,113 @@
+"""
+Cross-run duplicate suppression for scraped records
+Listings stay up for days, so most records of a run repeat an observation an
+earlier run already published; only new or changed ones are sent on
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Set
+
+NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_title(title: Optional[str]) -> str:
+    """Lowercase alphanumeric words only, so punctuation and spacing edits do not count as changes"""
+    return NON_WORD.sub(' ', (title or '').lower()).strip()
+
+
+def fingerprint(source: str, record: Dict) -> str:
+    """Identity of an observation: source, product, location, price and normalized title"""
+    key = '\x1f'.join((
+        source,
+        str(record.get('product_id')),
+        str(record.get('location_id')),
+        f"{float(record.get('price') or 0):.2f}",
+        normalize_title(record.get('title')),
+    ))
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class FingerprintStore:
+    """Bounded on-disk set of published fingerprints with TTL expiry and LRU eviction
+
+    An observation is suppressed while its fingerprint is younger than `ttl`
+    seconds, so an unchanged listing is republished once per TTL and the
+    latest prices never go stale downstream. Suppressed sightings refresh
+    `last_seen` only; when the store outgrows `max_entries` the least
+    recently seen fingerprints are evicted first.
+    """
+
+    def __init__(self, path: str, ttl: float = 86400, max_entries: int = 200000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                source TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                published_at REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (source, fingerprint)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_fingerprints_last_seen ON fingerprints(last_seen);
+        """)
+        self.expire()
+
+    def fresh(self, source: str, fingerprints: Iterable[str]) -> Set[str]:
+        """The fingerprints published less than `ttl` ago, marking them as seen now"""
+        fingerprints = list(set(fingerprints))
+        if not fingerprints:
+            return set()
+
+        now = time.time()
+        fresh = set()
+        with self.lock, self.conn:
+            # Stay under SQLite's bound parameter limit
+            for start in range(0, len(fingerprints), 500):
+                chunk = fingerprints[start:start + 500]
+                rows = self.conn.execute(
+                    f"""SELECT fingerprint FROM fingerprints
+                        WHERE source = ? AND published_at >= ?
+                        AND fingerprint IN ({','.join('?' * len(chunk))})""",
+                    [source, now - self.ttl, *chunk]
+                )
+                fresh.update(row[0] for row in rows)
+            self.conn.executemany(
+                "UPDATE fingerprints SET last_seen = ? WHERE source = ? AND fingerprint = ?",
+                [(now, source, fp) for fp in fresh]
+            )
+        return fresh
+
+    def remember(self, source: str, fingerprints: Iterable[str]):
+        """Record fingerprints as published now"""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                """INSERT INTO fingerprints (source, fingerprint, published_at, last_seen)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT (source, fingerprint) DO UPDATE
+                   SET published_at = excluded.published_at, last_seen = excluded.last_seen""",
+                [(source, fp, now, now) for fp in set(fingerprints)]
+            )
+
+    def expire(self):
+        """Drop expired fingerprints, then the least recently seen ones beyond max_entries"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM fingerprints WHERE published_at < ?", (time.time() - self.ttl,))
+            excess = self.conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.conn.execute(
+                    """DELETE FROM fingerprints WHERE (source, fingerprint) IN (
+                           SELECT source, fingerprint FROM fingerprints ORDER BY last_seen LIMIT ?)""",
+                    (excess,)
+                )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,385 @@
+"""
+Concurrent fetch layer shared by all scrapers
+Politeness is enforced per host with a token bucket and a concurrency cap
+instead of blind sleeps between requests. A circuit breaker per host stops
+hammering a source that is down or rate limiting us, and an optional
+deadline bounds how long a run may keep fetching.
+"""
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Dict, Hashable, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from http_cache import HttpCache, PendingEntry
+from http_session import RETRY_STATUSES, RequestTiming, RetryPolicy, build_session, timed_get
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `burst` saved up"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class HostLimiter:
+    """Per-host politeness: a token bucket for request rate plus a cap on requests in flight"""
+
+    def __init__(self, rate: float, burst: int, max_concurrency: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def _slot(self, host: str):
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = (
+                    TokenBucket(self.rate, self.burst),
+                    threading.BoundedSemaphore(self.max_concurrency)
+                )
+            return self.hosts[host]
+
+    @contextmanager
+    def limit(self, url: str):
+        """Hold a concurrency slot for the url's host and spend one rate token"""
+        bucket, semaphore = self._slot(urlparse(url).netloc)
+        with semaphore:
+            bucket.acquire()
+            yield
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to a host whose circuit is open"""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"circuit open for {host}, retrying in {retry_in:.0f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class DeadlineExceeded(Exception):
+    """Raised instead of sending a request once the run's time budget is spent"""
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures (errors, 429s, 5xx)
+
+    While open every request is refused. After `cooldown` seconds one probe
+    request is let through (half-open): success closes the circuit, failure
+    opens it again with the cooldown doubled, up to `max_cooldown`.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 60, max_cooldown: float = 900):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def retry_in(self) -> float:
+        """Seconds until the circuit lets a probe through, 0 if requests are allowed now"""
+        with self.lock:
+            if self.state == self.OPEN:
+                return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+            if self.state == self.HALF_OPEN and self.probing:
+                return self.cooldown
+            return 0.0
+
+    def before_request(self) -> bool:
+        """Whether a request may be sent now. In half-open state only one probe at a time is allowed"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = self.HALF_OPEN
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def record(self, failed: bool) -> bool:
+        """Record the outcome of a request. Returns True if this opened the circuit"""
+        with self.lock:
+            probe = self.state == self.HALF_OPEN
+            self.probing = False
+            if not failed:
+                self.state = self.CLOSED
+                self.failures = 0
+                self.cooldown = self.base_cooldown
+                return False
+
+            self.failures += 1
+            if probe:
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+            if probe or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+
+class HostBreakers:
+    """One circuit breaker per host, shared by every fetcher in the process
+    so a host that failed in one run stays open for the next scheduled run"""
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 60, max_cooldown: float = 900):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.hosts: Dict[str, CircuitBreaker] = {}
+        self.lock = threading.Lock()
+
+    def get(self, url: str) -> CircuitBreaker:
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = CircuitBreaker(self.failure_threshold, self.cooldown, self.max_cooldown)
+            return self.hosts[host]
+
+
+BREAKERS = HostBreakers(
+    failure_threshold=int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5')),
+    cooldown=float(os.getenv('CIRCUIT_COOLDOWN', '60')),
+    max_cooldown=float(os.getenv('CIRCUIT_MAX_COOLDOWN', '900'))
+)
+
+
+class FetchResult:
+    """Outcome of one fetch. `error` is set instead of raising so callers can keep going
+
+    `unchanged` is True when the HTTP cache knows this exact page from an
+    earlier fetch (304 Not Modified or identical content hash) that was
+    parsed with the same signature. Otherwise `cache_entry` is the page's
+    pending HttpCache entry, to be committed once its records are handed off.
+    """
+
+    __slots__ = ('key', 'url', 'status_code', 'text', 'error', 'elapsed', 'unchanged',
+                 'attempts', 'timing', 'cache_entry')
+
+    def __init__(self, key: Hashable, url: str, status_code: Optional[int] = None,
+                 text: Optional[str] = None, error: Optional[Exception] = None,
+                 elapsed: float = 0.0, unchanged: bool = False, attempts: int = 0,
+                 timing: Optional[RequestTiming] = None, cache_entry: Optional[PendingEntry] = None):
+        self.key = key
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.error = error
+        self.elapsed = elapsed
+        self.unchanged = unchanged
+        self.attempts = attempts
+        self.timing = timing
+        self.cache_entry = cache_entry
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class Fetcher:
+    """Fetches many urls on a thread pool while respecting each host's politeness budget
+
+    All requests share one pooled keep-alive session. Failed attempts
+    (connection errors, timeouts, 429/5xx) are retried per `retry` policy, each
+    retry spending a politeness token like any other request.
+
+    `stats` sums per-attempt connect / wait / transfer seconds so a run can
+    report where fetch time goes.
+
+    Requests to a host whose circuit is open, or made after `deadline`
+    (a time.monotonic() value), fail immediately without touching the network.
+    """
+
+    def __init__(self, headers: Optional[Dict] = None, rate: float = 0.5, burst: int = 2,
+                 max_concurrency: int = 3, timeout: float = 30,
+                 cache: Optional[HttpCache] = None, retry: Optional[RetryPolicy] = None,
+                 breakers: Optional[HostBreakers] = None, deadline: Optional[float] = None,
+                 cache_signature: Optional[str] = None):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.breakers = breakers or BREAKERS
+        self.max_concurrency = max_concurrency
+        self.limiter = HostLimiter(rate, burst, max_concurrency)
+        self.cache = cache
+        self.cache_signature = cache_signature
+        self.retry = retry or RetryPolicy()
+        self.session = build_session(headers, pool_size=max_concurrency)
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+
+    def fetch(self, url: str, key: Hashable = None) -> FetchResult:
+        """Fetch a single url, waiting for the host's rate limit first"""
+        start = time.monotonic()
+        try:
+            entry = self.cache.lookup(url) if self.cache else None
+            conditional = self.cache.conditional_headers(entry) if self.cache else {}
+
+            response, attempts, timing = self._get(url, conditional)
+
+            if response.status_code == 304 and entry:
+                text = self.cache.not_modified(entry)
+                if text is not None:
+                    pending = None
+                    if entry.signature != self.cache_signature:
+                        pending = self.cache.revalidated(entry, self.cache_signature)
+                    return FetchResult(key, url, 304, text, elapsed=time.monotonic() - start,
+                                       unchanged=pending is None, attempts=attempts, timing=timing,
+                                       cache_entry=pending)
+                # Cached body is gone, fetch the page in full
+                response, more_attempts, timing = self._get(url)
+                attempts += more_attempts
+
+            response.raise_for_status()
+            pending = None
+            if self.cache:
+                pending = self.cache.prepare(
+                    url, response.text,
+                    response.headers.get('ETag'),
+                    response.headers.get('Last-Modified'),
+                    entry=entry, signature=self.cache_signature
+                )
+                if pending.unchanged:
+                    # Nothing to hand off: only the validators may be newer
+                    self.cache.commit(pending)
+                    pending = None
+            return FetchResult(key, url, response.status_code, response.text,
+                               elapsed=time.monotonic() - start,
+                               unchanged=self.cache is not None and pending is None,
+                               attempts=attempts, timing=timing, cache_entry=pending)
+        except Exception as e:
+            return FetchResult(key, url, error=e, elapsed=time.monotonic() - start)
+
+    def time_left(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def _check(self, url: str, breaker: CircuitBreaker):
+        """Fail fast when the run is out of time or the host's circuit is open"""
+        time_left = self.time_left()
+        if time_left is not None and time_left <= 0:
+            self._count('deadline_skips')
+            raise DeadlineExceeded(f"run deadline reached before fetching {url}")
+        retry_in = breaker.retry_in()
+        if retry_in > 0:
+            self._count('circuit_skips')
+            raise CircuitOpenError(urlparse(url).netloc, retry_in)
+
+    def _get(self, url: str, headers: Optional[Dict] = None) -> Tuple[requests.Response, int, RequestTiming]:
+        """GET with retries. Returns the final response, attempts made and the last attempt's timing"""
+        breaker = self.breakers.get(url)
+        attempt = 0
+        while True:
+            self._check(url, breaker)
+            response, error, timing = None, None, None
+            with self.limiter.limit(url):
+                # The circuit may have opened while this request waited for a slot
+                self._check(url, breaker)
+                if not breaker.before_request():
+                    self._count('circuit_skips')
+                    raise CircuitOpenError(urlparse(url).netloc, breaker.retry_in())
+
+                time_left = self.time_left()
+                timeout = self.timeout if time_left is None else max(1.0, min(self.timeout, time_left))
+                try:
+                    response, timing = timed_get(self.session, url, headers, timeout)
+                except Exception as e:
+                    error = e
+
+            self._record(timing, error)
+            failed = error is not None or response.status_code in RETRY_STATUSES
+            if breaker.record(failed):
+                self._count('circuit_opened')
+
+            if not self.retry.should_retry(attempt, response, error):
+                if error is not None:
+                    raise error
+                return response, attempt + 1, timing
+
+            # Back off outside the politeness slot so other requests can proceed
+            delay = self.retry.delay(attempt, response)
+            time_left = self.time_left()
+            if (time_left is not None and delay >= time_left) or breaker.retry_in() > 0:
+                # No point waiting: out of time, or the host is being left alone
+                if error is not None:
+                    raise error
+                return response, attempt + 1, timing
+
+            with self.stats_lock:
+                self.stats['retries'] += 1
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _count(self, key: str):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def _record(self, timing: Optional[RequestTiming], error: Optional[Exception]):
+        with self.stats_lock:
+            self.stats['requests'] += 1
+            if error is not None:
+                self.stats['errors'] += 1
+                return
+            self.stats['new_connections'] += 0 if timing.reused else 1
+            self.stats['connect_seconds'] += timing.connect
+            self.stats['wait_seconds'] += timing.wait
+            self.stats['transfer_seconds'] += timing.transfer
+
+    def close(self):
+        self.session.close()
+        if self.cache:
+            self.cache.close()
+
+    def fetch_all(self, urls: Dict[Hashable, str]) -> Iterator[FetchResult]:
+        """Fetch all urls concurrently and yield results as they complete
+
+        The caller can parse each page while the remaining requests are still
+        in flight, so CPU work overlaps with network waits.
+        """
+        if not urls:
+            return
+
+        workers = min(len(urls), self.max_concurrency * len({urlparse(u).netloc for u in urls.values()}))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fetch')
+        try:
+            futures = [executor.submit(self.fetch, url, key) for key, url in urls.items()]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # Stop queued requests if the caller abandons the generator early
+            executor.shutdown(wait=True, cancel_futures=True)
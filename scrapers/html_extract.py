@@ -0,0 +1,187 @@
+"""
+Listing extraction with pluggable HTML parser backends
+Selectors are declared once per scraper and compiled for the chosen backend:
+  - 'lxml': lxml tree with precompiled XPath expressions (fastest)
+  - 'soup': BeautifulSoup restricted by a SoupStrainer to the listing containers
+"""
+import time
+from typing import Dict, List, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer
+from lxml import etree, html as lxml_html
+
+BACKENDS = ('lxml', 'soup')
+
+
+class Selector:
+    """One element selector: tag plus optional class, matched as a whole class token
+    or as a substring (`contains=True`). With `attr` the attribute value is
+    extracted instead of the element text."""
+
+    def __init__(self, tag: str, cls: Optional[str] = None, contains: bool = False,
+                 attr: Optional[str] = None):
+        self.tag = tag
+        self.cls = cls
+        self.contains = contains
+        self.attr = attr
+
+    def xpath(self) -> str:
+        conditions = []
+        if self.cls and self.contains:
+            conditions.append(f"contains(@class, '{self.cls}')")
+        elif self.cls:
+            conditions.append(f"contains(concat(' ', normalize-space(@class), ' '), ' {self.cls} ')")
+        if self.attr:
+            conditions.append(f"@{self.attr}")
+        return self.tag + ''.join(f"[{c}]" for c in conditions)
+
+    def css(self) -> str:
+        if self.cls and self.contains:
+            css = f'{self.tag}[class*="{self.cls}"]'
+        elif self.cls:
+            css = f'{self.tag}.{self.cls}'
+        else:
+            css = self.tag
+        return css + (f'[{self.attr}]' if self.attr else '')
+
+    def soup_kwargs(self) -> Dict:
+        kwargs = {}
+        if self.cls and self.contains:
+            cls = self.cls
+            kwargs['class_'] = lambda x: x and cls in str(x)
+        elif self.cls:
+            kwargs['class_'] = self.cls
+        if self.attr:
+            kwargs[self.attr] = True
+        return kwargs
+
+    def __repr__(self):
+        return f"Selector({self.xpath()!r})"
+
+
+class ListingExtractor:
+    """Extracts one dict of raw field strings per listing container
+
+    `containers` are alternatives tried in order (the first one with results
+    wins). Each field maps to selectors tried in order inside a container.
+    """
+
+    def __init__(self, containers: List[Selector], fields: Dict[str, List[Selector]],
+                 backend: str = 'lxml'):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown parser backend '{backend}', expected one of {BACKENDS}")
+
+        self.backend = backend
+        self.containers = containers
+        self.fields = fields
+
+        # lxml: compile every XPath once
+        self.container_xpaths = [etree.XPath(f"//{s.xpath()}") for s in containers]
+        self.field_xpaths = {
+            name: [(etree.XPath(f"(.//{s.xpath()})[1]"), s.attr) for s in selectors]
+            for name, selectors in fields.items()
+        }
+
+        # soup: only build the subtrees of the listing containers
+        container_kwargs = [s.soup_kwargs() for s in containers]
+        self.strainer = SoupStrainer(
+            lambda tag, attrs: any(
+                tag == s.tag and _soup_attrs_match(s, attrs) for s in containers
+            )
+        )
+        self.container_finds = [(s.tag, kwargs) for s, kwargs in zip(containers, container_kwargs)]
+        self.field_finds = {
+            name: [(s.tag, s.soup_kwargs(), s.attr) for s in selectors]
+            for name, selectors in fields.items()
+        }
+
+    def extract(self, page_html: str, backend: Optional[str] = None) -> List[Dict[str, Optional[str]]]:
+        """Return [{field: text or None}] for every listing on the page"""
+        if not page_html or not page_html.strip():
+            return []
+        if (backend or self.backend) == 'lxml':
+            return self._extract_lxml(page_html)
+        return self._extract_soup(page_html)
+
+    def _extract_lxml(self, page_html: str) -> List[Dict[str, Optional[str]]]:
+        root = lxml_document(page_html)
+
+        listings = []
+        for xpath in self.container_xpaths:
+            listings = xpath(root)
+            if listings:
+                break
+
+        results = []
+        for listing in listings:
+            item = {}
+            for name, candidates in self.field_xpaths.items():
+                item[name] = None
+                for xpath, attr in candidates:
+                    found = xpath(listing)
+                    if found:
+                        element = found[0]
+                        item[name] = element.get(attr) if attr else \
+                            ''.join(text.strip() for text in element.itertext())
+                        break
+            results.append(item)
+        return results
+
+    def _extract_soup(self, page_html: str) -> List[Dict[str, Optional[str]]]:
+        soup = BeautifulSoup(page_html, 'html.parser', parse_only=self.strainer)
+
+        listings = []
+        for tag, kwargs in self.container_finds:
+            listings = soup.find_all(tag, **kwargs)
+            if listings:
+                break
+
+        results = []
+        for listing in listings:
+            item = {}
+            for name, candidates in self.field_finds.items():
+                item[name] = None
+                for tag, kwargs, attr in candidates:
+                    element = listing.find(tag, **kwargs)
+                    if element:
+                        item[name] = element.get(attr) if attr else element.get_text(strip=True)
+                        break
+            results.append(item)
+        return results
+
+    def compare(self, page_html: str, repeat: int = 5) -> Dict:
+        """Time every backend on the same page and check they extract the same listings"""
+        report = {}
+        outputs = {}
+        for backend in BACKENDS:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                outputs[backend] = self.extract(page_html, backend)
+            elapsed = (time.perf_counter() - start) / repeat
+            report[backend] = {
+                'seconds': elapsed,
+                'listings': len(outputs[backend]),
+            }
+        report['identical'] = all(outputs[b] == outputs[BACKENDS[0]] for b in BACKENDS)
+        return report
+
+
+def lxml_document(page_html: str):
+    """Parse a page with lxml"""
+    try:
+        return lxml_html.document_fromstring(page_html)
+    except ValueError:
+        # Unicode input with an XML encoding declaration
+        return lxml_html.document_fromstring(page_html.encode('utf-8'))
+
+
+def _soup_attrs_match(selector: Selector, attrs: Dict) -> bool:
+    """SoupStrainer callback: does a start tag's raw attributes match the selector's class rule"""
+    if not selector.cls:
+        return True
+    classes = attrs.get('class') or ''
+    if isinstance(classes, (list, tuple)):
+        classes = ' '.join(classes)
+    if selector.contains:
+        return selector.cls in classes
+    return selector.cls in classes.split()
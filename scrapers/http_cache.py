@@ -0,0 +1,212 @@
+"""
+On-disk HTTP cache for the fetch layer
+Revalidates pages with ETag / Last-Modified and fingerprints bodies so an
+unchanged page can skip parsing and publishing altogether. A fetched page is
+only remembered once the scraper commits it, after its records are safe
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Dict, Optional
+
+
+class CacheEntry:
+    __slots__ = ('url', 'etag', 'last_modified', 'content_hash', 'size', 'body_file', 'signature')
+
+    def __init__(self, url, etag, last_modified, content_hash, size, body_file, signature=None):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.size = size
+        self.body_file = body_file
+        self.signature = signature
+
+
+class PendingEntry:
+    """A fetched page not yet written to the cache; see HttpCache.commit()
+
+    `text` is None when the committed body is already the same, in which
+    case committing only updates the validators and signature. `unchanged`
+    is True when the committed entry already matches body and signature:
+    the page needs no parsing and can be committed right away.
+    """
+    __slots__ = ('url', 'text', 'etag', 'last_modified', 'content_hash', 'signature', 'unchanged')
+
+    def __init__(self, url, text, etag, last_modified, content_hash, signature, unchanged=False):
+        self.url = url
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.signature = signature
+        self.unchanged = unchanged
+
+
+class HttpCache:
+    """zlib-compressed page bodies on disk with a SQLite index and LRU eviction
+
+    Stats per run: `revalidations` (conditional requests sent), `not_modified`
+    (304 answers), `unchanged` (200 with the same content hash), `stale`
+    (known pages to parse again because the parse signature changed),
+    `misses`, and `bytes_saved` (body bytes not downloaded thanks to 304s).
+
+    Pages are cached in two steps: prepare() compares a response with the
+    committed entry and commit() writes it once the page's records have
+    been handed off. A page whose parse or publish failed is therefore
+    still new to the next run, and so is every page once the `signature`
+    its records were parsed with (selectors, product rules) changes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats = Counter()
+        # Fetcher threads update the stats concurrently; separate from `lock`,
+        # which evict() holds while counting
+        self.stats_lock = threading.Lock()
+        self.lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, 'index.db'), timeout=30,
+                                    check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                stored_size INTEGER NOT NULL,
+                body_file TEXT NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(entries)")}
+        if 'signature' not in columns:
+            self.conn.execute("ALTER TABLE entries ADD COLUMN signature TEXT")
+
+    def lookup(self, url: str) -> Optional[CacheEntry]:
+        with self.lock:
+            row = self.conn.execute(
+                """SELECT url, etag, last_modified, content_hash, size, body_file, signature
+                   FROM entries WHERE url = ?""",
+                (url,)
+            ).fetchone()
+        return CacheEntry(*row) if row else None
+
+    def conditional_headers(self, entry: Optional[CacheEntry]) -> Dict[str, str]:
+        """Revalidation headers for a cached entry"""
+        headers = {}
+        if entry and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry and entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        if headers:
+            self._count('revalidations')
+        return headers
+
+    def read_body(self, entry: CacheEntry) -> Optional[str]:
+        """Decompressed body of an entry, None if the file has gone missing"""
+        try:
+            with open(os.path.join(self.directory, entry.body_file), 'rb') as f:
+                return zlib.decompress(f.read()).decode('utf-8')
+        except (OSError, zlib.error):
+            return None
+
+    def not_modified(self, entry: CacheEntry) -> Optional[str]:
+        """Handle a 304: return the cached body and count the bytes we did not download"""
+        body = self.read_body(entry)
+        if body is not None:
+            self._count('not_modified')
+            self._count('bytes_saved', entry.size)
+            self._touch(entry.url)
+        return body
+
+    def prepare(self, url: str, text: str, etag: Optional[str], last_modified: Optional[str],
+                entry: Optional[CacheEntry] = None, signature: Optional[str] = None) -> PendingEntry:
+        """Compare a 200 response with the committed `entry` without writing anything"""
+        content_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        same_body = entry is not None and entry.content_hash == content_hash
+        unchanged = same_body and entry.signature == signature
+        self._count('unchanged' if unchanged else 'stale' if same_body else 'misses')
+        if same_body and self.read_body(entry) is None:
+            same_body = False
+        return PendingEntry(url, None if same_body else text, etag, last_modified, content_hash,
+                            signature, unchanged)
+
+    def revalidated(self, entry: CacheEntry, signature: Optional[str] = None) -> PendingEntry:
+        """Pending update of an entry a 304 confirmed but whose signature is out of date"""
+        self._count('stale')
+        return PendingEntry(entry.url, None, entry.etag, entry.last_modified, entry.content_hash, signature)
+
+    def commit(self, pending: PendingEntry):
+        """Write a prepared page: its body if new, its validators and signature"""
+        body_file = hashlib.sha1(pending.url.encode('utf-8')).hexdigest() + '.z'
+        stored_size = None
+        if pending.text is not None:
+            raw = pending.text.encode('utf-8')
+            compressed = zlib.compress(raw, 6)
+            stored_size = len(compressed)
+            tmp_path = os.path.join(self.directory, body_file + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp_path, os.path.join(self.directory, body_file))
+
+        with self.lock, self.conn:
+            if stored_size is None:
+                self.conn.execute(
+                    """UPDATE entries SET etag = ?, last_modified = ?, signature = ?, last_access = ?
+                       WHERE url = ?""",
+                    (pending.etag, pending.last_modified, pending.signature, time.time(), pending.url)
+                )
+            else:
+                self.conn.execute(
+                    """INSERT OR REPLACE INTO entries
+                       (url, etag, last_modified, content_hash, size, stored_size, body_file,
+                        last_access, signature)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (pending.url, pending.etag, pending.last_modified, pending.content_hash, len(raw),
+                     stored_size, body_file, time.time(), pending.signature)
+                )
+
+        if stored_size is not None:
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        with self.lock, self.conn:
+            total = self.conn.execute("SELECT COALESCE(SUM(stored_size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+
+            rows = self.conn.execute(
+                "SELECT url, stored_size, body_file FROM entries ORDER BY last_access"
+            ).fetchall()
+            for url, stored_size, body_file in rows:
+                if total <= self.max_bytes:
+                    break
+                self.conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+                try:
+                    os.remove(os.path.join(self.directory, body_file))
+                except OSError:
+                    pass
+                total -= stored_size
+                self._count('evictions')
+
+    def _count(self, key: str, amount: int = 1):
+        with self.stats_lock:
+            self.stats[key] += amount
+
+    def _touch(self, url: str):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE entries SET last_access = ? WHERE url = ?", (time.time(), url))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,147 @@
+"""
+Pooled HTTP session with retries and latency breakdown
+One keep-alive connection pool per scraper, bounded retries with exponential
+backoff and full jitter for 429/5xx (honouring Retry-After), and per-request
+connect / wait / transfer timings
+"""
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Connect time of the last connection opened by this thread
+_connect_timing = threading.local()
+
+
+class TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _connect_timing.seconds = time.perf_counter() - start
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _connect_timing.seconds = time.perf_counter() - start
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections record how long TCP + TLS setup took"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
+
+def build_session(headers: Optional[Dict] = None, pool_size: int = 10) -> requests.Session:
+    """Session with a keep-alive pool of `pool_size` connections per host and compressed transfer"""
+    session = requests.Session()
+    session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+    session.headers.update(headers or {})
+
+    # Retries are handled by RetryPolicy so each attempt goes through the
+    # politeness limiter and is timed separately
+    adapter = TimedAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class RetryPolicy:
+    """Bounded retries with exponential backoff and full jitter"""
+
+    def __init__(self, max_retries: int = 3, backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 statuses=RETRY_STATUSES):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.statuses = statuses
+
+    def should_retry(self, attempt: int, response: Optional[requests.Response] = None,
+                     error: Optional[Exception] = None) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        if error is not None:
+            return isinstance(error, (requests.ConnectionError, requests.Timeout))
+        return response is not None and response.status_code in self.statuses
+
+    def delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Seconds to wait before retry number `attempt + 1`"""
+        retry_after = parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After is either delay-seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestTiming:
+    """Where the time of one request attempt went
+
+    connect: new TCP + TLS setup (0 on a reused keep-alive connection)
+    wait: request sent until response headers arrived
+    transfer: reading (and decompressing) the body
+    """
+
+    __slots__ = ('connect', 'wait', 'transfer', 'reused')
+
+    def __init__(self, connect: float, wait: float, transfer: float):
+        self.connect = connect
+        self.wait = wait
+        self.transfer = transfer
+        self.reused = connect == 0
+
+    @property
+    def total(self) -> float:
+        return self.connect + self.wait + self.transfer
+
+
+def timed_get(session: requests.Session, url: str, headers: Optional[Dict] = None,
+              timeout: float = 30) -> Tuple[requests.Response, RequestTiming]:
+    """GET through the session and return the response with its timing breakdown"""
+    _connect_timing.seconds = 0.0
+    start = time.perf_counter()
+    response = session.get(url, headers=headers, timeout=timeout, stream=True)
+    headers_at = time.perf_counter()
+    response.content  # read the body now so transfer time is measured
+    done = time.perf_counter()
+
+    connect = _connect_timing.seconds
+    return response, RequestTiming(connect, max(0.0, headers_at - start - connect), done - headers_at)
@@ -1,10 +1,22 @@
 """
 Website Inspector Tool
-Use this to analyze the HTML structure of a website before scraping
+Use this to analyze the HTML structure of a website before scraping.
+With --profile it proposes listing selectors for saved or live pages and
+times the ways of running them (see selector_profiler.py)
 """
+import json
+import multiprocessing
+import os
 import requests
 from bs4 import BeautifulSoup
-import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+from fetcher import Fetcher
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
 
 def inspect_website(url: str):
     """Inspect website structure to help build scrapers"""
@@ -13,14 +25,21 @@ def inspect_website(url: str):
     print("=" * 80)
     
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
+        # Pooled session with retries on 429/5xx, same as the scrapers
+        fetcher = Fetcher(headers=HEADERS)
+        try:
+            page = fetcher.fetch(url)
+        finally:
+            fetcher.close()
+        if not page.ok:
+            raise page.error
         
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
+        if page.timing:
+            print(f"⏱️  Fetched in {page.elapsed:.2f}s ({page.attempts} attempt(s): "
+                  f"connect {page.timing.connect * 1000:.0f} ms, wait {page.timing.wait * 1000:.0f} ms, "
+                  f"transfer {page.timing.transfer * 1000:.0f} ms)")
         
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = BeautifulSoup(page.text, 'html.parser')
         
         # Check for tables
         tables = soup.find_all('table')
@@ -89,11 +108,132 @@ def inspect_website(url: str):
         print(f"❌ Error: {e}")
 
 
+def load_pages(targets: List[str]) -> List[Tuple[str, str]]:
+    """(source, html) of every target: saved files are read, URLs fetched concurrently"""
+    pages = []
+    urls = {}
+    for target in targets:
+        if os.path.isfile(target):
+            with open(target, encoding='utf-8', errors='replace') as f:
+                pages.append((target, f.read()))
+        else:
+            urls[target] = target
+    
+    if urls:
+        # Politeness budget per host, so many URLs of one site are not a burst
+        fetcher = Fetcher(headers=HEADERS)
+        try:
+            for page in fetcher.fetch_all(urls):
+                if page.ok:
+                    pages.append((page.url, page.text))
+                else:
+                    print(f"❌ Error fetching {page.url}: {page.error}")
+        finally:
+            fetcher.close()
+    return pages
+
+def profile_pages(pages: List[Tuple[str, str]], jobs: int = 1, repeat: int = 5) -> List[Dict]:
+    """Profile every page, on `jobs` processes when there are several pages
+    
+    Each page is timed inside a single process, so its strategies compare
+    fairly; absolute times are higher when processes share busy cores.
+    """
+    from selector_profiler import profile_page
+    
+    jobs = max(1, min(jobs, len(pages)))
+    if jobs == 1:
+        return [profile_page(html, source, repeat) for source, html in pages]
+    
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(profile_page, html, source, repeat) for source, html in pages]
+        return [future.result() for future in futures]
+
+def print_profile(report: Dict):
+    """Print one page's candidate structures, proposed selectors and strategy timings"""
+    print(f"\n🔍 {report['source']} ({report['bytes'] / 1024:.0f} KiB)")
+    print("=" * 80)
+    
+    if not report['candidates']:
+        print("No repeated structure with prices found")
+        return
+    
+    print("\n📦 Repeated structures (best first):")
+    for candidate in report['candidates']:
+        print(f"    {candidate['selector']:<50} x{candidate['count']:<4} "
+              f"price {candidate['price_share']:.0%}  link {candidate['link_share']:.0%}  "
+              f"score {candidate['score']:.1f}")
+    
+    profile = report['profile']
+    print("\n🏷️  Proposed listing_selectors:")
+    print("    listing_selectors = {")
+    for field, selectors in report['selectors'].items():
+        fill = '' if field == 'container' else f"  # filled in {profile['fill'][field]:.0%} of listings"
+        print(f"        '{field}': [{', '.join(selectors)}],{fill}")
+    print("    }")
+    
+    print("\n⏱️  Strategies (mean per page):")
+    for strategy, timing in profile['strategies'].items():
+        marker = '⭐' if strategy == profile['fastest'] else '  '
+        print(f"    {marker} {strategy:<7} {timing['parser']:<12} "
+              f"parse {profile['parse'][timing['parser']] * 1000:7.2f} ms + query {timing['seconds'] * 1000:7.2f} ms "
+              f"= {timing['total'] * 1000:7.2f} ms  {timing['listings']:>4} listings"
+              f"{'' if timing['identical'] else '  ⚠️  differs from xpath'}")
+    
+    if profile['sample']:
+        print("\n📋 First listing:")
+        for field, value in profile['sample'][0].items():
+            print(f"    {field:<10} {(value or '')[:70]}")
+
+def print_profile_summary(reports: List[Dict]):
+    """Across pages: how often each container was proposed and each strategy was fastest"""
+    profiled = [r for r in reports if 'profile' in r]
+    containers = {}
+    fastest = {}
+    for report in profiled:
+        container = report['selectors']['container'][0]
+        containers[container] = containers.get(container, 0) + 1
+        fastest[report['profile']['fastest']] = fastest.get(report['profile']['fastest'], 0) + 1
+    
+    print(f"\n{'=' * 80}")
+    print(f"📊 {len(profiled)}/{len(reports)} page(s) with listings")
+    for container, count in sorted(containers.items(), key=lambda item: -item[1]):
+        print(f"    {container:<50} proposed on {count} page(s)")
+    for strategy, count in sorted(fastest.items(), key=lambda item: -item[1]):
+        print(f"    {strategy:<7} fastest on {count} page(s)")
+
+def profile_targets(targets: List[str], jobs: int = 1, repeat: int = 5, output: str = None) -> List[Dict]:
+    """Fetch or read every target, profile them and print the reports"""
+    pages = load_pages(targets)
+    reports = profile_pages(pages, jobs=jobs, repeat=repeat)
+    for report in reports:
+        print_profile(report)
+    if len(reports) > 1:
+        print_profile_summary(reports)
+    
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Profile saved to: {output}")
+    return reports
+
+
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Usage: python inspect_website.py <URL>")
-        print("Example: python inspect_website.py https://example.com/prices")
-        sys.exit(1)
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Analyze the HTML structure of a website before scraping')
+    parser.add_argument('targets', nargs='+', metavar='URL_OR_FILE',
+                        help='Page to inspect; with --profile any number of URLs and saved HTML files')
+    parser.add_argument('--profile', action='store_true',
+                        help='Find listing structures, propose selectors and time lambda/CSS/XPath strategies')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Pages profiled at once with --profile (default: CPU count)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Timing repetitions per strategy with --profile (default: 5)')
+    parser.add_argument('--json', metavar='FILE', help='Also write the --profile reports as JSON')
+    args = parser.parse_args()
     
-    url = sys.argv[1]
-    inspect_website(url)
\ No newline at end of file
+    if args.profile:
+        profile_targets(args.targets, jobs=args.jobs, repeat=args.repeat, output=args.json)
+    else:
+        for url in args.targets:
+            inspect_website(url)
\ No newline at end of file
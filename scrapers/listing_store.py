@@ -0,0 +1,78 @@
+"""
+Persistent store of listing identifiers seen by previous runs
+Lets paginated crawls stop as soon as they reach content they already know
+"""
+import sqlite3
+import threading
+import time
+from typing import Iterable, Set
+
+
+class ListingStore:
+    """SQLite-backed set of (source, listing_id) with first/last seen times"""
+
+    def __init__(self, path: str, retention_days: int = 30):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS seen_listings (
+                source TEXT NOT NULL,
+                listing_id TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (source, listing_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_seen_listings_last_seen ON seen_listings(last_seen);
+        """)
+
+        # Listings not seen for a while have long expired on the site
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM seen_listings WHERE last_seen < ?",
+                (time.time() - retention_days * 86400,)
+            )
+
+    def known(self, source: str, listing_ids: Iterable[str], before: float) -> Set[str]:
+        """The subset of listing_ids first seen before `before` (i.e. by an earlier run)"""
+        listing_ids = list(set(listing_ids))
+        if not listing_ids:
+            return set()
+
+        known = set()
+        with self.lock:
+            # Stay under SQLite's bound parameter limit
+            for start in range(0, len(listing_ids), 500):
+                chunk = listing_ids[start:start + 500]
+                rows = self.conn.execute(
+                    f"""SELECT listing_id FROM seen_listings
+                        WHERE source = ? AND first_seen < ?
+                        AND listing_id IN ({','.join('?' * len(chunk))})""",
+                    [source, before, *chunk]
+                )
+                known.update(row[0] for row in rows)
+        return known
+
+    def has_history(self, source: str) -> bool:
+        """Whether any listing of this source was recorded before"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM seen_listings WHERE source = ? LIMIT 1", (source,)
+            ).fetchone()
+        return row is not None
+
+    def remember(self, source: str, listing_ids: Iterable[str]):
+        """Record listing_ids as seen now, keeping their original first_seen"""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                """INSERT INTO seen_listings (source, listing_id, first_seen, last_seen)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT (source, listing_id) DO UPDATE SET last_seen = excluded.last_seen""",
+                [(source, listing_id, now, now) for listing_id in set(listing_ids)]
+            )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,59 @@
+"""
+Compiled location matcher
+Resolves free-text listing locations to location IDs in one regex pass
+"""
+import re
+from typing import Dict, Optional, Tuple
+
+
+SEPARATOR = r'[\s-]+'
+
+
+def name_pattern(name: str) -> str:
+    """Regex for a location name where spaces and hyphens are interchangeable"""
+    return SEPARATOR.join(re.escape(part) for part in re.split(SEPARATOR, name.strip()))
+
+
+class LocationMatcher:
+    """Matches location names on word boundaries, preferring the most specific one
+
+    Built from one or more {name: location_id} tiers, most specific first
+    (e.g. markets/cities, then states). When several names appear in the
+    text the winner is the one from the most specific tier, then the longest,
+    then the last one (Jiji writes "State, Area").
+    """
+
+    def __init__(self, *tiers: Dict[str, int]):
+        self.targets = []
+        seen = set()
+        for rank, tier in enumerate(tiers):
+            for name, location_id in tier.items():
+                if name.casefold() not in seen:
+                    seen.add(name.casefold())
+                    self.targets.append((name, rank, location_id))
+
+        # Longest names first so 'Lagos Island' is tried before 'Lagos'
+        # at the same position
+        self.targets.sort(key=lambda target: len(target[0]), reverse=True)
+        alternatives = [
+            f"(?P<t{index}>{name_pattern(name)})"
+            for index, (name, _, _) in enumerate(self.targets)
+        ]
+        self.pattern = re.compile(
+            r'(?<!\w)(?:' + '|'.join(alternatives) + r')(?!\w)',
+            re.IGNORECASE
+        ) if alternatives else None
+
+    def match(self, text: str) -> Optional[Tuple[str, int]]:
+        """Return (matched name, location_id) for the best match in text, or None"""
+        if not text or self.pattern is None:
+            return None
+
+        best = None
+        for match in self.pattern.finditer(text):
+            name, rank, location_id = self.targets[int(match.lastgroup[1:])]
+            score = (-rank, len(name), match.start())
+            if best is None or score > best[0]:
+                best = (score, name, location_id)
+
+        return (best[1], best[2]) if best else None
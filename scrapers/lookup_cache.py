@@ -0,0 +1,109 @@
+"""
+In-memory lookup cache for products and locations
+Loaded from Postgres once per connection and refreshed on a TTL, so
+name -> ID lookups on the scraping hot path never touch the database
+"""
+import re
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Cap on remembered substring lookups, listing text is noisy and unbounded
+MAX_MEMO_ENTRIES = 10000
+
+
+def name_aliases(name: str) -> List[str]:
+    """Alternative spellings of a name: 'Lagos Island (Eko) Market' -> 'Lagos Island', 'Eko'"""
+    aliases = []
+    base = re.sub(r'\s+market$', '', name, flags=re.IGNORECASE).strip()
+    if base != name:
+        aliases.append(base)
+
+    match = re.match(r'^(.*?)\s*\((.+?)\)\s*(.*)$', base)
+    if match:
+        outer = f"{match.group(1)} {match.group(3)}".strip()
+        aliases.extend([outer, match.group(2).strip()])
+
+    return [a for a in aliases if a]
+
+
+class LookupIndex:
+    """Exact, case-folded and substring lookups over the names of one table"""
+
+    def __init__(self, rows: Iterable[Tuple[int, str]]):
+        self.exact: Dict[str, int] = {}
+        self.folded: Dict[str, int] = {}
+        self.names: List[Tuple[str, int]] = []
+        self.memo: Dict[str, Optional[int]] = {}
+
+        rows = list(rows)
+
+        # Rows come ordered by id, so the first row wins on collisions
+        for row_id, name in rows:
+            self.exact.setdefault(name, row_id)
+            self.folded.setdefault(name.casefold(), row_id)
+            self.names.append((name.casefold(), row_id))
+
+        # Aliases never shadow a real name
+        for row_id, name in rows:
+            for alias in name_aliases(name):
+                self.folded.setdefault(alias.casefold(), row_id)
+
+    def lookup(self, name: str) -> Optional[int]:
+        """Resolve a name to an ID, mirroring the old `LOWER(name) LIKE '%name%'` query"""
+        if name in self.exact:
+            return self.exact[name]
+
+        folded = name.strip().casefold()
+        if folded in self.folded:
+            return self.folded[folded]
+
+        if folded in self.memo:
+            return self.memo[folded]
+
+        result = next((row_id for row_name, row_id in self.names if folded and folded in row_name), None)
+
+        if len(self.memo) >= MAX_MEMO_ENTRIES:
+            self.memo.clear()
+        self.memo[folded] = result
+        return result
+
+
+class LookupCache:
+    """Product and location indexes with TTL refresh and per-run hit/miss counters"""
+
+    def __init__(self, ttl: float = 900):
+        self.ttl = ttl
+        self.products = LookupIndex([])
+        self.locations = LookupIndex([])
+        self.loaded_at = None
+        self.stats = Counter()
+
+    def load(self, conn):
+        """Load both tables in two queries"""
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id, name FROM products ORDER BY id")
+            products = [(row['id'], row['name']) for row in cursor.fetchall()]
+
+            cursor.execute("SELECT id, name FROM locations ORDER BY id")
+            locations = [(row['id'], row['name']) for row in cursor.fetchall()]
+
+        self.products = LookupIndex(products)
+        self.locations = LookupIndex(locations)
+        self.loaded_at = time.monotonic()
+
+    def refresh_if_stale(self, conn):
+        """Reload the indexes once the TTL has passed"""
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl:
+            self.load(conn)
+            self.stats['refreshes'] += 1
+
+    def product_id(self, name: str) -> Optional[int]:
+        return self._count('product', self.products.lookup(name))
+
+    def location_id(self, name: str) -> Optional[int]:
+        return self._count('location', self.locations.lookup(name))
+
+    def _count(self, kind: str, result: Optional[int]) -> Optional[int]:
+        self.stats[f"{kind}_{'hits' if result is not None else 'misses'}"] += 1
+        return result
@@ -0,0 +1,320 @@
+"""
+Run metrics for scrapers
+Per-stage counters and latency histograms, exported in Prometheus text format
+(textfile or a local HTTP endpoint) and as a JSON run report
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Latency buckets (seconds) wide enough for in-memory lookups and slow fetches alike
+DEFAULT_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+def label_set(labels: Dict) -> LabelSet:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels: LabelSet, extra: LabelSet = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in pairs) + '}'
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram, as Prometheus expects"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        result.append((float('inf'), self.count))
+        return result
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and histograms keyed by metric name and labels"""
+
+    def __init__(self, prefix: str = 'scraper_'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelSet, float]] = {}
+        self.gauges: Dict[str, Dict[LabelSet, float]] = {}
+        self.histograms: Dict[str, Dict[LabelSet, Histogram]] = {}
+        self.help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str):
+        self.help[self.prefix + name] = help_text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = label_set(labels)
+        with self.lock:
+            series = self.counters.setdefault(self.prefix + name + '_total', {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self.lock:
+            self.gauges.setdefault(self.prefix + name, {})[label_set(labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = label_set(labels)
+        with self.lock:
+            series = self.histograms.setdefault(self.prefix + name + '_seconds', {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def to_prometheus(self) -> str:
+        """All series in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for kind, metrics in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted(metrics):
+                    self._header(lines, name, kind)
+                    for labels, value in sorted(metrics[name].items()):
+                        lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+
+            for name in sorted(self.histograms):
+                self._header(lines, name, 'histogram')
+                for labels, histogram in sorted(self.histograms[name].items(), key=lambda item: item[0]):
+                    for bound, count in histogram.cumulative():
+                        lines.append(f"{name}_bucket{format_labels(labels, (('le', format_value(bound)),))} {count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, lines: List[str], name: str, kind: str):
+        base = name[:-len('_total')] if kind == 'counter' and name.endswith('_total') else name
+        help_text = self.help.get(base) or self.help.get(name)
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def write_textfile(self, path: str):
+        """Write the metrics atomically, e.g. for node_exporter's textfile collector"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        """Expose /metrics over HTTP on a daemon thread"""
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+        thread.start()
+        return server
+
+
+# Process-wide registry exported by the runner and the scheduler
+REGISTRY = MetricsRegistry()
+
+REGISTRY.describe('runs', 'Scraper runs by final status')
+REGISTRY.describe('run_seconds', 'Wall time of whole scraper runs')
+REGISTRY.describe('last_run_timestamp_seconds', 'Unix time the last run of a scraper finished')
+REGISTRY.describe('last_success_timestamp_seconds', 'Unix time the last successful run of a scraper finished')
+REGISTRY.describe('scheduled_runs', 'Scheduled runs by outcome (started, skipped, coalesced)')
+REGISTRY.describe('schedule_lateness_seconds', 'Delay between a run being due and starting')
+REGISTRY.describe('job_duration_seconds', 'Duration of the last scheduled run of a scraper')
+REGISTRY.describe('db_connect_seconds', 'Time to connect to Postgres and preload lookups')
+REGISTRY.describe('broker_connect_seconds', 'Time for the outbox drainer to connect to RabbitMQ and declare the queue')
+REGISTRY.describe('fetch_seconds', 'Time to fetch one page, retries and rate limiting included')
+REGISTRY.describe('parse_seconds', 'Time to extract listings from one page')
+REGISTRY.describe('filter_seconds', 'Time to classify and validate the listings of one page')
+REGISTRY.describe('normalize_seconds', 'Time to parse pack sizes and compute price per kg for the records of one page')
+REGISTRY.describe('lookup_seconds', 'Time of one product or location lookup')
+REGISTRY.describe('publish_seconds', 'Time to publish and confirm one batch')
+REGISTRY.describe('pages', 'Fetched pages by result (ok, unchanged, error)')
+REGISTRY.describe('listings', 'Listings extracted from fetched pages')
+REGISTRY.describe('listings_rejected', 'Listings dropped before publishing, by reason')
+REGISTRY.describe('rule_rejections', 'Per-product keyword rule rejections')
+REGISTRY.describe('records', 'Price records produced by scrapers')
+REGISTRY.describe('published_records', 'Records confirmed by the broker')
+REGISTRY.describe('publish_failures', 'Records the broker did not confirm')
+REGISTRY.describe('outbox_written', 'Records committed to the local outbox')
+REGISTRY.describe('outbox_pending', 'Records still waiting in the outbox at the end of the last run')
+REGISTRY.describe('dedupe_seconds', 'Time to fingerprint and check one batch of records against earlier runs')
+REGISTRY.describe('dedupe_records', 'Records by dedupe outcome (new, suppressed)')
+REGISTRY.describe('dedupe_suppression_ratio', 'Share of records of the last run suppressed as already published')
+REGISTRY.describe('anomaly_window_seconds', 'Time to load the recent approved prices for the anomaly pre-screen')
+REGISTRY.describe('anomaly_screen_seconds', 'Time to score one batch of records against recent prices')
+REGISTRY.describe('anomaly_flagged', 'Records flagged by the anomaly pre-screen')
+REGISTRY.describe('bulk_load_seconds', 'Time to COPY and insert the records of a bulk (backfill) run')
+REGISTRY.describe('bulk_loaded', 'Records inserted into scraped_prices by bulk runs')
+REGISTRY.describe('archive_seconds', 'Time to compress and append one fetched page to the page archive')
+REGISTRY.describe('archived_bytes', 'Compressed bytes appended to the page archive')
+REGISTRY.describe('replayed_pages', 'Archived pages parsed again by replay runs')
+
+
+def series_name(name: str, labels: Dict) -> str:
+    """Report key of a series, e.g. fetch{query=bag+garri}"""
+    if not labels:
+        return name
+    return name + '{' + ','.join(f"{key}={value}" for key, value in label_set(labels)) + '}'
+
+
+class RunMetrics:
+    """Stage timings and counters of one scraper run, mirrored into a registry for export
+
+    `stage('parse')` times a block and `observe('fetch', seconds, query=...)`
+    records an already measured duration; each stage becomes a
+    `scraper_<stage>_seconds` histogram. `count('listings_rejected',
+    reason='duplicate')` becomes `scraper_listings_rejected_total`. Every
+    series carries a `scraper` label.
+    """
+
+    def __init__(self, scraper: str, registry: MetricsRegistry = REGISTRY):
+        self.scraper = scraper
+        self.registry = registry
+        self.lock = threading.Lock()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters = Counter()
+        self.gauges: Dict[str, float] = {}
+        self.started_at = None
+        self.started = None
+        self.elapsed = None
+        self.status = None
+
+    def start(self):
+        with self.lock:
+            self.stages.clear()
+            self.counters.clear()
+            self.gauges.clear()
+        self.started_at = datetime.utcnow().isoformat()
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.status = 'running'
+
+    @contextmanager
+    def stage(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = series_name(name, labels)
+        with self.lock:
+            stage = self.stages.get(key)
+            if stage is None:
+                stage = self.stages[key] = {'count': 0, 'seconds': 0.0, 'max': 0.0}
+            stage['count'] += 1
+            stage['seconds'] += seconds
+            stage['max'] = max(stage['max'], seconds)
+        self.registry.observe(name, seconds, scraper=self.scraper, **labels)
+
+    def count(self, name: str, value: float = 1, **labels):
+        if not value:
+            return
+        with self.lock:
+            self.counters[series_name(name, labels)] += value
+        self.registry.inc(name, value, scraper=self.scraper, **labels)
+
+    def gauge(self, name: str, value: float, **labels):
+        with self.lock:
+            self.gauges[series_name(name, labels)] = value
+        self.registry.set(name, value, scraper=self.scraper, **labels)
+
+    def finish(self, status: str):
+        self.status = status
+        if self.started is not None:
+            self.elapsed = time.perf_counter() - self.started
+
+    def report(self) -> Dict:
+        """JSON-friendly summary of this run"""
+        with self.lock:
+            stages = {
+                key: {**stage, 'avg': stage['seconds'] / stage['count']}
+                for key, stage in sorted(self.stages.items())
+            }
+            counters = dict(sorted(self.counters.items()))
+            gauges = dict(sorted(self.gauges.items()))
+        return {
+            'scraper': self.scraper,
+            'status': self.status,
+            'started_at': self.started_at,
+            'elapsed': self.elapsed,
+            'stages': stages,
+            'counters': counters,
+            'gauges': gauges,
+        }
+
+
+def write_run_report(path: str, results: List[Dict], elapsed: float, started_at: Optional[str] = None):
+    """Write the results of one runner invocation, including each scraper's metrics, as JSON"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    report = {
+        'started_at': started_at,
+        'finished_at': datetime.utcnow().isoformat(),
+        'elapsed': elapsed,
+        'scrapers': results,
+    }
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    os.replace(tmp_path, path)
@@ -0,0 +1,259 @@
+"""
+Durable local outbox for scraped records
+Records are committed to a SQLite WAL spool first and forwarded to the
+scraped_prices queue by a background drainer, so a broker outage neither
+slows scraping down nor loses prices
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from itertools import takewhile
+from typing import Callable, Dict, List, Optional, Tuple
+
+from publisher import BatchPublisher
+
+
+class Outbox:
+    """Append-only SQLite spool of records waiting for a broker confirm
+
+    Rows are deleted only once the broker confirmed the batch they were sent
+    in, so delivery is at least once: a crash between confirm and delete sends
+    those records again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL survives process crashes; only an OS crash can lose the last commits
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source_id INTEGER,
+                source_name TEXT NOT NULL,
+                record TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_outbox_source ON outbox(source_name, id);
+        """)
+
+    def put(self, source_id: Optional[int], source_name: str, records: List[Dict]):
+        """Durably append records in one transaction"""
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO outbox (source_id, source_name, record, created_at) VALUES (?, ?, ?, ?)",
+                [(source_id, source_name, json.dumps(record), now) for record in records]
+            )
+
+    def peek(self, source_name: str, limit: int) -> List[Tuple[int, Optional[int], Dict]]:
+        """Oldest pending records of a source as (row id, source id, record)
+
+        Records without a `scraped_at` are stamped with the time they were
+        put, so one sent after a broker outage keeps its scrape time.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                """SELECT id, source_id, record, created_at FROM outbox
+                   WHERE source_name = ? ORDER BY id LIMIT ?""",
+                (source_name, limit)
+            ).fetchall()
+
+        pending = []
+        for row_id, source_id, record, created_at in rows:
+            record = json.loads(record)
+            if not record.get('scraped_at'):
+                put_at = datetime.fromtimestamp(created_at, timezone.utc).replace(tzinfo=None)
+                record['scraped_at'] = put_at.isoformat()
+            pending.append((row_id, source_id, record))
+        return pending
+
+    def ack(self, row_ids: List[int]):
+        """Remove confirmed records"""
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM outbox WHERE id = ?", [(row_id,) for row_id in row_ids])
+
+    def fail(self, row_ids: List[int], error: str):
+        """Keep records for a later attempt, noting why this one failed"""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, last_error = ? WHERE id = ?",
+                [(error, row_id) for row_id in row_ids]
+            )
+
+    def pending(self, source_name: Optional[str] = None) -> int:
+        with self.lock:
+            if source_name is None:
+                return self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE source_name = ?", (source_name,)
+            ).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class OutboxDrainer:
+    """Background thread forwarding one source's outbox records to RabbitMQ in confirmed batches
+
+    The thread owns its broker connection (pika connections are not thread
+    safe). `connect()` must return a (connection, channel) pair with the queue
+    declared; while it fails the drainer retries with exponential backoff and
+    records simply accumulate in the outbox.
+    """
+
+    def __init__(self, outbox: Outbox, source_id: int, source_name: str, connect: Callable[[], Tuple],
+                 batch_size: int = 100, poll_interval: float = 1.0, max_backoff: float = 60.0,
+                 logger: Optional[logging.Logger] = None,
+                 on_batch: Optional[Callable[[int, float, bool], None]] = None):
+        self.outbox = outbox
+        self.source_id = source_id
+        self.source_name = source_name
+        self.connect = connect
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.logger = logger or logging.getLogger(__name__)
+        self.on_batch = on_batch
+
+        self.connection = None
+        self.publisher = None
+        self.published = 0
+        self.last_error = None
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.drain_deadline = None
+        self.thread = threading.Thread(target=self._run, name=f"{source_name} outbox", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def notify(self):
+        """New records were written"""
+        self.wakeup.set()
+
+    def _run(self):
+        backoff = 1.0
+        while not self.stopping.is_set():
+            if self.drain_deadline is not None and time.monotonic() >= self.drain_deadline:
+                break
+            if self.connection is None and not self._connect():
+                if self._wait(backoff):
+                    break
+                backoff = min(self.max_backoff, backoff * 2)
+                continue
+
+            rows = self.outbox.peek(self.source_name, self.batch_size)
+            if not rows:
+                if self.drain_deadline is not None:
+                    break
+                self._service_connection()
+                self._wait(self.poll_interval)
+                continue
+
+            if self._publish(rows):
+                backoff = 1.0
+            else:
+                self._disconnect()
+                if self._wait(backoff):
+                    break
+                backoff = min(self.max_backoff, backoff * 2)
+
+        self._disconnect()
+
+    def _wait(self, seconds: float) -> bool:
+        """Sleep until woken or `seconds` pass. Returns True when the drainer should exit"""
+        if self.drain_deadline is not None:
+            seconds = min(seconds, max(0.0, self.drain_deadline - time.monotonic()))
+        self.wakeup.wait(seconds)
+        self.wakeup.clear()
+        return self.stopping.is_set() or (
+            self.drain_deadline is not None and time.monotonic() >= self.drain_deadline
+        )
+
+    def _connect(self) -> bool:
+        try:
+            self.connection, channel = self.connect()
+            self.publisher = BatchPublisher(
+                channel, self.source_id, self.source_name, logger=self.logger, on_batch=self.on_batch
+            )
+            self.logger.info("Outbox drainer connected to RabbitMQ")
+            return True
+        except Exception as e:
+            self.connection = None
+            self.last_error = repr(e)
+            self.logger.warning(
+                f"RabbitMQ unavailable ({e!r}), {self.outbox.pending(self.source_name)} record(s) kept in outbox"
+            )
+            return False
+
+    def _publish(self, rows: List[Tuple[int, Optional[int], Dict]]) -> bool:
+        """Send rows as one confirmed batch and ack them once the broker confirmed it
+
+        A batch carries one source ID, so only the leading rows stored with
+        the same one are sent; the rest go out with the next batch.
+        """
+        source_id = rows[0][1]
+        rows = list(takewhile(lambda row: row[1] == source_id, rows))
+        row_ids = [row_id for row_id, _, _ in rows]
+        records = [record for _, _, record in rows]
+        if self.publisher.publish_batch(records, source_id=self.source_id if source_id is None else source_id):
+            self.outbox.ack(row_ids)
+            self.published += len(rows)
+            return True
+
+        failed = self.publisher.result.failed
+        self.last_error = failed[-1]['error'] if failed else 'not confirmed'
+        failed.clear()
+        self.outbox.fail(row_ids, self.last_error)
+        return False
+
+    def _service_connection(self):
+        """Answer heartbeats while idle so the broker keeps the connection open"""
+        try:
+            self.connection.process_data_events(time_limit=0)
+        except Exception as e:
+            self.logger.warning(f"RabbitMQ connection lost while idle: {e!r}")
+            self._disconnect()
+
+    def _disconnect(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+        self.connection = None
+        self.publisher = None
+
+    def drain(self, timeout: float) -> int:
+        """Keep forwarding until this source's outbox is empty or `timeout` passes, then stop.
+        Returns the number of records still waiting"""
+        self.drain_deadline = time.monotonic() + timeout
+        self.wakeup.set()
+        self.thread.join(timeout + 5)
+        return self.outbox.pending(self.source_name)
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """Stop the thread, waiting at most `timeout` seconds for it. Returns whether it stopped
+
+        A thread blocked in a broker call is left behind (it is a daemon);
+        whatever it has not acked stays in the outbox for the next run.
+        """
+        self.stopping.set()
+        self.wakeup.set()
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            self.logger.warning(
+                f"Outbox drainer did not stop within {timeout:.0f}s ({self.last_error or 'blocked in a broker call'}), "
+                f"{self.outbox.pending(self.source_name)} record(s) left in the outbox for the next run"
+            )
+            return False
+        return True
@@ -0,0 +1,146 @@
+"""
+Raw page archive
+Fetched pages appended to compressed, WARC-like segment files with an SQLite
+index by source, query and time, so pages can be parsed again offline
+(see replay.py) after the site's markup or our product rules change
+"""
+import gzip
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+SEGMENT_SUFFIX = '.warc.gz'
+
+
+def warc_record(url: str, body: bytes, fetched_at: float, fields: Dict[str, object]) -> bytes:
+    """A WARC/1.1 'resource' record holding one page body, extra metadata as X- headers"""
+    headers = [
+        'WARC/1.1',
+        'WARC-Type: resource',
+        f'WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>',
+        f"WARC-Date: {datetime.fromtimestamp(fetched_at, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}",
+        f'WARC-Target-URI: {url}',
+        'Content-Type: text/html; charset=utf-8',
+        *(f'X-{name}: {value}' for name, value in fields.items() if value is not None),
+        f'Content-Length: {len(body)}',
+    ]
+    return '\r\n'.join(headers).encode('utf-8') + b'\r\n\r\n' + body + b'\r\n\r\n'
+
+
+def read_record(path: str, offset: int, length: int) -> Tuple[Dict[str, str], str]:
+    """Headers and page text of the record stored at `offset` of a segment file"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = gzip.decompress(f.read(length))
+
+    head, _, rest = data.partition(b'\r\n\r\n')
+    lines = head.decode('utf-8').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines[1:])
+    body = rest[:int(headers['Content-Length'])]
+    return headers, body.decode('utf-8', errors='replace')
+
+
+class PageArchive:
+    """Append-only archive of raw pages: gzip segment files plus an SQLite index
+
+    Every page is its own gzip member, so segments stay valid WARC files
+    (readable by standard WARC tools) and any page can be decompressed alone
+    from its indexed offset. Each process writes its own segment, rolled over
+    at `max_segment_bytes`; the index row is written after the page is on
+    disk, so it never points at data that is not there.
+    """
+
+    def __init__(self, directory: str, max_segment_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.segment = None
+        self.segment_name = None
+        self.conn = sqlite3.connect(os.path.join(directory, 'index.db'), timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL,
+                query TEXT,
+                page INTEGER,
+                url TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                run_started REAL,
+                status INTEGER,
+                segment TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_pages_source_time ON pages(source, fetched_at);
+            CREATE INDEX IF NOT EXISTS idx_pages_source_query_time ON pages(source, query, fetched_at);
+        """)
+
+    def open_segment(self):
+        if self.segment is not None:
+            self.segment.close()
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+        self.segment_name = f"pages-{stamp}-{os.getpid()}-{uuid.uuid4().hex[:6]}{SEGMENT_SUFFIX}"
+        self.segment = open(os.path.join(self.directory, self.segment_name), 'ab')
+
+    def append(self, source: str, url: str, text: str, query: Optional[str] = None,
+               page: Optional[int] = None, status: Optional[int] = None,
+               run_started: Optional[float] = None, fetched_at: Optional[float] = None) -> int:
+        """Archive one fetched page, returning its compressed size"""
+        fetched_at = fetched_at or time.time()
+        record = warc_record(url, text.encode('utf-8'), fetched_at, {
+            'Source': source, 'Query': query, 'Page': page, 'Status': status, 'Run-Started': run_started,
+        })
+        member = gzip.compress(record, compresslevel=6)
+
+        with self.lock:
+            if self.segment is None or self.segment.tell() >= self.max_segment_bytes:
+                self.open_segment()
+            offset = self.segment.tell()
+            self.segment.write(member)
+            self.segment.flush()
+
+            with self.conn:
+                self.conn.execute(
+                    """INSERT INTO pages (source, query, page, url, fetched_at, run_started,
+                                          status, segment, offset, length)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (source, query, page, url, fetched_at, run_started,
+                     status, self.segment_name, offset, len(member))
+                )
+        return len(member)
+
+    def entries(self, source: str, since: Optional[float] = None, until: Optional[float] = None,
+                queries: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+        """Index rows of a source's pages fetched in [since, until), by run then fetch time"""
+        sql = "SELECT * FROM pages WHERE source = ? AND fetched_at >= ? AND fetched_at < ?"
+        params: List = [source, since or 0, until or float('inf')]
+        if queries:
+            sql += f" AND query IN ({','.join('?' * len(queries))})"
+            params.extend(queries)
+        sql += " ORDER BY run_started, fetched_at"
+
+        cursor = self.conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        for row in cursor.execute(sql, params):
+            entry = dict(row)
+            entry['path'] = os.path.join(self.directory, entry['segment'])
+            yield entry
+
+    def read(self, entry: Dict) -> str:
+        """Page text of an index row"""
+        return read_record(entry['path'], entry['offset'], entry['length'])[1]
+
+    def close(self):
+        with self.lock:
+            if self.segment is not None:
+                self.segment.close()
+                self.segment = None
+            self.conn.close()
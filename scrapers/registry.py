@@ -0,0 +1,73 @@
+"""
+Scraper registry
+Scrapers are declared by name and import path ('module:Class') and only
+imported when they are about to run, so listing them or running one of them
+neither pays for nor breaks on the others
+"""
+import importlib
+import logging
+from importlib.metadata import entry_points
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Installed packages can add scrapers through this entry point group, e.g.
+#   [project.entry-points."agroconnect.scrapers"]
+#   "konga scraper" = "konga_scrapers.konga:KongaScraper"
+ENTRY_POINT_GROUP = 'agroconnect.scrapers'
+
+
+class ScraperLoadError(Exception):
+    """A scraper's module could not be imported or does not define its class"""
+
+
+def entry_point_scrapers() -> List[Dict]:
+    """Scraper configs declared by installed packages (read from metadata, nothing is imported)"""
+    try:
+        found = entry_points()
+        # Python < 3.10 returns a dict of groups
+        found = found.select(group=ENTRY_POINT_GROUP) if hasattr(found, 'select') else found.get(ENTRY_POINT_GROUP, [])
+    except Exception as e:
+        logger.warning(f"Could not read scraper entry points: {e}")
+        return []
+    return [{'name': ep.name, 'path': ep.value, 'origin': 'entry point'} for ep in found]
+
+
+def registered_scrapers(configs: List[Dict]) -> List[Dict]:
+    """The configured scrapers plus entry point scrapers not configured under the same name"""
+    names = {config['name'] for config in configs}
+    return list(configs) + [config for config in entry_point_scrapers() if config['name'] not in names]
+
+
+def import_path(config: Dict) -> str:
+    """Where a scraper's class lives, as 'module:Class'"""
+    scraper_class = config.get('class')
+    if scraper_class is not None and not isinstance(scraper_class, str):
+        return f"{scraper_class.__module__}:{scraper_class.__qualname__}"
+    return config.get('path') or scraper_class
+
+
+def load_scraper_class(config: Dict) -> type:
+    """Import a scraper's module and return its class
+
+    Configs may also carry the class itself under 'class'. Import errors are
+    raised as ScraperLoadError so a broken scraper fails on its own.
+    """
+    scraper_class = config.get('class')
+    if scraper_class is not None and not isinstance(scraper_class, str):
+        return scraper_class
+
+    path = import_path(config)
+    module_name, _, class_name = (path or '').partition(':')
+    if not module_name or not class_name:
+        raise ScraperLoadError(f"{config['name']}: import path must look like 'module:Class', not {path!r}")
+
+    try:
+        module = importlib.import_module(module_name)
+    except Exception as e:
+        raise ScraperLoadError(f"{config['name']}: cannot import {module_name} ({e!r})") from e
+
+    try:
+        return getattr(module, class_name)
+    except AttributeError:
+        raise ScraperLoadError(f"{config['name']}: {module_name} has no {class_name}") from None
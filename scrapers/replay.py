@@ -0,0 +1,99 @@
+"""
+Offline re-parse of archived pages
+Runs a scraper's page parsing over a range of the page archive on a process
+pool and streams the records into the scraper's normal publish path, so
+markup or rule changes can be applied to old pages without fetching them again
+"""
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import groupby
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from page_archive import PageArchive, read_record
+from registry import load_scraper_class
+
+# Runs handed to the pool ahead of the one being published, per worker
+READ_AHEAD = 2
+
+# One scraper per worker process, built by init_worker
+_worker_scraper = None
+
+
+def init_worker(scraper_config: Dict, lookup_cache):
+    """Build this worker's scraper with the parent's product/location indexes (no database)"""
+    global _worker_scraper
+    _worker_scraper = load_scraper_class(scraper_config)()
+    # Per-listing INFO logs of many processes would drown the parent's (set
+    # after the import, whose logging.basicConfig would reset the level)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    lookup_cache.ttl = float('inf')
+    _worker_scraper.lookup_cache = lookup_cache
+
+
+def parse_run(entries: List[Dict]) -> List[Dict]:
+    """Parse the archived pages of one scraper run, stamping records with their fetch time"""
+    scraper = _worker_scraper
+    # Listings repeated on overlapping pages are dropped per run, as they were live
+    scraper.begin_replay_run()
+
+    records = []
+    for entry in entries:
+        text = read_record(entry['path'], entry['offset'], entry['length'])[1]
+        scraped_at = datetime.fromtimestamp(entry['fetched_at'], timezone.utc).replace(tzinfo=None).isoformat()
+        for record in scraper.parse_archived_page(text, entry['query'], entry['page']):
+            record['scraped_at'] = scraped_at
+            records.append(record)
+    return records
+
+
+def collect(scraper, pages: int, future) -> List[Dict]:
+    """Wait for one run's records and count its pages"""
+    records = future.result()
+    scraper.metrics.count('replayed_pages', pages)
+    return records
+
+
+def replay_records(scraper, scraper_config: Dict, archive_dir: str, since: Optional[float] = None,
+                   until: Optional[float] = None, queries: Optional[Sequence[str]] = None,
+                   workers: Optional[int] = None) -> Iterator[Dict]:
+    """Records re-parsed from a scraper's archived pages, in fetch order
+
+    Pages are parsed one run per task on `workers` processes; only a few runs
+    are in flight ahead of the consumer, so the publish path sets the pace and
+    memory stays flat however large the range. Meant to be passed to
+    `scraper.run(records=...)`, which has loaded the lookup indexes by the
+    time the first record is asked for.
+    """
+    workers = workers or os.cpu_count() or 1
+    archive = PageArchive(archive_dir)
+    try:
+        entries = archive.entries(scraper.source_name, since, until, queries)
+        runs = (list(pages) for _, pages in groupby(entries, key=lambda e: e['run_started']))
+
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            # Fork is unsafe here: the parent runs publisher and drainer threads
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+            initargs=(scraper_config, scraper.lookup_cache),
+        )
+        try:
+            pending = deque()
+            pages = 0
+            for run in runs:
+                pending.append((len(run), pool.submit(parse_run, run)))
+                pages += len(run)
+                if len(pending) >= workers * READ_AHEAD:
+                    yield from collect(scraper, *pending.popleft())
+            while pending:
+                yield from collect(scraper, *pending.popleft())
+            scraper.logger.info(f"Replayed {pages} archived page(s)")
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+    finally:
+        archive.close()
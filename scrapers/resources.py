@@ -0,0 +1,215 @@
+"""
+Connections shared by the scrapers of one runner or scheduler process
+A Postgres connection pool and one long-lived RabbitMQ connection that
+scrapers borrow from instead of connecting (and declaring the queue, and
+looking up their source) on every run
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelLease:
+    """One scraper's channel on the shared RabbitMQ connection
+
+    pika's BlockingConnection is not thread safe, so every call that touches
+    the connection (publishing on any channel, servicing heartbeats) is made
+    under the manager's lock. The lease stands in for both halves of the
+    (connection, channel) pair OutboxDrainer expects: closing it closes only
+    this channel, never the shared connection.
+    """
+
+    def __init__(self, resources: 'RunResources', channel):
+        self.resources = resources
+        self.channel = channel
+
+    def confirm_delivery(self):
+        with self.resources.amqp_lock:
+            self.channel.confirm_delivery()
+
+    def basic_publish(self, **kwargs):
+        with self.resources.amqp_lock:
+            self.channel.basic_publish(**kwargs)
+
+    def process_data_events(self, time_limit: float = 0):
+        with self.resources.amqp_lock:
+            self.resources.amqp_connection.process_data_events(time_limit=time_limit)
+
+    def close(self):
+        with self.resources.amqp_lock:
+            try:
+                if self.channel.is_open:
+                    self.channel.close()
+            except Exception:
+                pass
+
+
+class RunResources:
+    """Postgres pool and RabbitMQ connection for every scraper run in this process
+
+    Connections are checked before they are handed out: a pooled Postgres
+    connection idle for more than `health_interval` seconds must answer
+    `SELECT 1`, and a RabbitMQ connection that is closed or fails to service
+    its heartbeats is replaced. Broken connections are dropped and reopened
+    transparently. A background thread answers broker heartbeats so the
+    RabbitMQ connection survives the idle time between scheduled runs.
+    """
+
+    def __init__(self, max_db_connections: int = 4, health_interval: float = 30.0,
+                 database_url: Optional[str] = None, rabbitmq_url: Optional[str] = None):
+        self.database_url = database_url or os.getenv('DATABASE_URL')
+        self.rabbitmq_url = rabbitmq_url or os.getenv('RABBITMQ_URL')
+        self.max_db_connections = max(1, max_db_connections)
+        self.health_interval = health_interval
+
+        self.db_lock = threading.Lock()
+        self.db_pool = None
+        # getconn() fails instead of waiting when the pool is empty
+        self.db_slots = threading.BoundedSemaphore(self.max_db_connections)
+        self.db_last_used: Dict[int, float] = {}
+
+        self.amqp_lock = threading.RLock()
+        self.amqp_connection = None
+        self.queue_declared = False
+        self.heartbeat_interval = 5.0
+        self.heartbeat_thread = None
+        self.stopping = threading.Event()
+
+        self.source_lock = threading.Lock()
+        self.source_ids: Dict[str, int] = {}
+
+    # Postgres
+
+    def acquire_db(self):
+        """Borrow a healthy pooled connection, waiting for one if all are in use"""
+        from psycopg2.extras import RealDictCursor
+        from psycopg2.pool import ThreadedConnectionPool
+
+        self.db_slots.acquire()
+        try:
+            with self.db_lock:
+                if self.db_pool is None:
+                    self.db_pool = ThreadedConnectionPool(
+                        1, self.max_db_connections, self.database_url, cursor_factory=RealDictCursor
+                    )
+            conn = self.db_pool.getconn()
+            if not self.db_healthy(conn):
+                logger.warning("Pooled Postgres connection is broken, reconnecting")
+                self.db_pool.putconn(conn, close=True)
+                conn = self.db_pool.getconn()
+            return conn
+        except Exception:
+            self.db_slots.release()
+            raise
+
+    def db_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - self.db_last_used.get(id(conn), 0) < self.health_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def release_db(self, conn):
+        """Return a borrowed connection, closing it if it is unusable"""
+        try:
+            broken = bool(conn.closed)
+            if not broken:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            self.db_last_used[id(conn)] = time.monotonic()
+            self.db_pool.putconn(conn, close=broken)
+        finally:
+            self.db_slots.release()
+
+    @contextmanager
+    def db(self):
+        conn = self.acquire_db()
+        try:
+            yield conn
+        finally:
+            self.release_db(conn)
+
+    def source_id(self, source_name: str, lookup: Callable[[], int]) -> int:
+        """A source's ID, looked up (or created) by `lookup` once per process"""
+        # Held across the lookup so two first runs cannot both insert the source
+        with self.source_lock:
+            if source_name not in self.source_ids:
+                self.source_ids[source_name] = lookup()
+            return self.source_ids[source_name]
+
+    # RabbitMQ
+
+    def amqp_channel(self, queue: str) -> ChannelLease:
+        """A new channel on the shared connection, (re)connecting and declaring `queue` as needed"""
+        import pika
+
+        with self.amqp_lock:
+            if not self.amqp_healthy():
+                self.close_amqp()
+                self.amqp_connection = pika.BlockingConnection(pika.URLParameters(self.rabbitmq_url))
+                self.queue_declared = False
+                logger.info("Shared RabbitMQ connection opened")
+                if self.heartbeat_thread is None:
+                    self.heartbeat_thread = threading.Thread(
+                        target=self._heartbeat, name='amqp-heartbeat', daemon=True
+                    )
+                    self.heartbeat_thread.start()
+
+            channel = self.amqp_connection.channel()
+            if not self.queue_declared:
+                channel.queue_declare(queue=queue, durable=True)
+                self.queue_declared = True
+            return ChannelLease(self, channel)
+
+    def amqp_healthy(self) -> bool:
+        if self.amqp_connection is None or not self.amqp_connection.is_open:
+            return False
+        try:
+            self.amqp_connection.process_data_events(time_limit=0)
+            return True
+        except Exception as e:
+            logger.warning(f"Shared RabbitMQ connection failed its health check: {e!r}")
+            return False
+
+    def _heartbeat(self):
+        while not self.stopping.wait(self.heartbeat_interval):
+            with self.amqp_lock:
+                if self.amqp_connection is not None and self.amqp_connection.is_open:
+                    try:
+                        self.amqp_connection.process_data_events(time_limit=0)
+                    except Exception as e:
+                        # Replaced on the next amqp_channel() call
+                        logger.warning(f"Shared RabbitMQ connection lost: {e!r}")
+
+    def close_amqp(self):
+        with self.amqp_lock:
+            if self.amqp_connection is not None:
+                try:
+                    self.amqp_connection.close()
+                except Exception:
+                    pass
+            self.amqp_connection = None
+
+    def close(self):
+        self.stopping.set()
+        if self.heartbeat_thread is not None:
+            self.heartbeat_thread.join()
+            self.heartbeat_thread = None
+        self.close_amqp()
+        with self.db_lock:
+            if self.db_pool is not None:
+                self.db_pool.closeall()
+                self.db_pool = None
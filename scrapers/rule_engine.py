@@ -0,0 +1,107 @@
+"""
+Product rule engine
+Compiles every product's keyword rules into one matcher so a listing title
+is classified against all products in a single pass
+"""
+import re
+from collections import Counter
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+
+class Classification:
+    """Result of classifying one title: matched products and rejections with the rule responsible"""
+
+    __slots__ = ('matches', 'named', 'rejections')
+
+    def __init__(self):
+        # (product_name, include keyword that matched)
+        self.matches: List[Tuple[str, str]] = []
+        # Matched products whose own product_terms appear in the title
+        self.named: Set[str] = set()
+        # (product_name, reason, keyword) - reason is 'excluded' or 'no_include'
+        self.rejections: List[Tuple[str, str, Optional[str]]] = []
+
+    def best(self, preferred: Iterable[str] = ()) -> Optional[Tuple[str, str]]:
+        """Pick one match: products named in the title first, then the page's own products, then rule order"""
+        preferred = set(preferred)
+        ranked = sorted(
+            enumerate(self.matches),
+            key=lambda item: (item[1][0] not in self.named, item[1][0] not in preferred, item[0])
+        )
+        return ranked[0][1] if ranked else None
+
+
+class ProductRuleEngine:
+    """Classifies titles against `must_include` / `must_not_include` rules of all products
+
+    Keywords keep their substring semantics. A lookahead alternation finds the
+    longest keyword starting at each position in one regex scan, and each
+    keyword carries the shorter keywords it contains, so overlapping keywords
+    ('gold' inside 'mama gold') are still seen.
+
+    A product's optional `product_terms` (e.g. ['rice']) gate listings coming
+    from pages fetched for other products, because include keywords like
+    'white' or 'bag' are only meaningful on the product's own search page.
+    """
+
+    def __init__(self, product_rules: Dict[str, Dict]):
+        self.rules = []
+        keywords = set()
+        for product_name, rules in product_rules.items():
+            include = frozenset(k.casefold() for k in rules.get('must_include', []))
+            exclude = frozenset(k.casefold() for k in rules.get('must_not_include', []))
+            terms = frozenset(k.casefold() for k in rules.get('product_terms', []))
+            self.rules.append((product_name, include, exclude, terms))
+            keywords |= include | exclude | terms
+
+        self.implied: Dict[str, FrozenSet[str]] = {
+            keyword: frozenset(k for k in keywords if k in keyword)
+            for keyword in keywords
+        }
+        alternation = '|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+        self.pattern = re.compile(f"(?=({alternation}))") if keywords else None
+        self.stats = Counter()
+
+    def keywords_in(self, title: str) -> FrozenSet[str]:
+        """All keywords occurring anywhere in the title"""
+        if self.pattern is None:
+            return frozenset()
+
+        found = set()
+        for match in self.pattern.finditer(title.casefold()):
+            found |= self.implied[match.group(1)]
+        return frozenset(found)
+
+    def classify(self, title: str, page_products: Iterable[str] = ()) -> Classification:
+        """Classify a title against every product's rules in one pass over the text"""
+        page_products = set(page_products)
+        found = self.keywords_in(title)
+        result = Classification()
+
+        for product_name, include, exclude, terms in self.rules:
+            named = bool(terms & found)
+            if product_name not in page_products and not named:
+                continue
+
+            excluded = exclude & found
+            if excluded:
+                result.rejections.append((product_name, 'excluded', min(excluded)))
+                continue
+
+            included = include & found
+            if not included:
+                result.rejections.append((product_name, 'no_include', None))
+                continue
+
+            result.matches.append((product_name, min(included, key=lambda k: (-len(k), k))))
+            if named:
+                result.named.add(product_name)
+
+        return result
+
+    def record(self, result: Classification, chosen: Optional[Tuple[str, str]]):
+        """Tally which rules fired so they can be tuned from the run log"""
+        if chosen:
+            self.stats[(chosen[0], 'include', chosen[1])] += 1
+        for product_name, reason, keyword in result.rejections:
+            self.stats[(product_name, reason, keyword)] += 1
@@ -5,7 +5,8 @@ Runs all configured scrapers in sequence or parallel
 import sys
 import os
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
 import logging
 
 # Setup logging
@@ -20,72 +21,167 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-# Import all your scrapers here
-# Uncomment as you create them
-from scrapers.sample_scraper import SampleScraper
-from scrapers.jiji_scraper import JijiScraper
+from metrics import REGISTRY, write_run_report
+from registry import import_path, load_scraper_class, registered_scrapers
+from resources import RunResources
 
 # Configure which scrapers to run
+# Scrapers are declared by import path ('module:Class') and imported only
+# when they run; installed packages can add more through entry points
+# (see registry.py)
 ACTIVE_SCRAPERS = [
-    {
-        'name': 'Sample Scraper',
-        'class': SampleScraper,
-        'enabled': True,
-        'priority': 1  # Lower number = higher priority
-    },
-
     {
         'name': 'jiji scraper',
-        'class': JijiScraper,
+        'path': 'scrapers.jiji_scraper:JijiScraper',
         'enabled': True,
-        'priority': 2
+        'priority': 1,  # Lower number = higher priority
+        'interval': 30,  # minutes between scheduled runs
+        'jitter': 0.1,  # up to 10% of the interval added at random
+        'overlap': 'coalesce'  # or 'skip'
     }
     # Add more scrapers here
 ]
 
-def run_scraper(scraper_config):
-    """Run a single scraper and return results"""
+def active_scrapers():
+    """Enabled scrapers (configured and from entry points) by priority, without importing any"""
+    enabled = [s for s in registered_scrapers(ACTIVE_SCRAPERS) if s.get('enabled', True)]
+    enabled.sort(key=lambda x: x.get('priority', 999))
+    return enabled
+
+# Number of scrapers allowed to run at the same time in parallel mode.
+# Scrapers are I/O bound (HTTP, Postgres, RabbitMQ) so threads are enough.
+MAX_PARALLEL_WORKERS = int(os.getenv('SCRAPER_WORKERS', '4'))
+
+# Time budget (seconds) of one run of all scrapers, 0 for none. Shared by
+# priority: each scraper's share is weighted by 1 / priority (or its
+# 'budget_weight'), and time left unused by one scraper passes on to the next.
+RUN_BUDGET = float(os.getenv('SCRAPER_RUN_BUDGET', '0'))
+
+def budget_weight(scraper_config):
+    return scraper_config.get('budget_weight', 1 / max(1, scraper_config.get('priority', 999)))
+
+# JSON report of the last run (per-scraper stage timings and counters), and
+# optionally the Prometheus metrics as a file for node_exporter's textfile collector
+METRICS_REPORT_PATH = os.getenv('SCRAPER_METRICS_REPORT', 'scraper_run_report.json')
+METRICS_TEXTFILE_PATH = os.getenv('SCRAPER_METRICS_TEXTFILE')
+
+def record_run(scraper_name, status, elapsed):
+    """Export the outcome of one scraper run"""
+    REGISTRY.inc('runs', scraper=scraper_name, status=status)
+    REGISTRY.observe('run', elapsed, scraper=scraper_name)
+    REGISTRY.set('last_run_timestamp_seconds', time.time(), scraper=scraper_name)
+    if status == 'success':
+        REGISTRY.set('last_success_timestamp_seconds', time.time(), scraper=scraper_name)
+
+def export_metrics(results, elapsed, started_at):
+    """Write the JSON run report and the Prometheus textfile, if configured"""
+    try:
+        if METRICS_REPORT_PATH:
+            write_run_report(METRICS_REPORT_PATH, results, elapsed, started_at)
+        if METRICS_TEXTFILE_PATH:
+            REGISTRY.write_textfile(METRICS_TEXTFILE_PATH)
+    except OSError as e:
+        logger.error(f"Could not write run metrics: {e}")
+
+def run_scraper(scraper_config, deadline=None, bulk=False, resources=None):
+    """Run a single scraper and return results
+    
+    `deadline` is a time.monotonic() value the scraper must finish by.
+    With `bulk` records are loaded straight into scraped_prices (backfills).
+    `resources` are the run's shared Postgres/RabbitMQ connections.
+    """
     scraper_name = scraper_config['name']
-    scraper_class = scraper_config['class']
+    
+    if deadline is not None and deadline - time.monotonic() <= 0:
+        logger.warning(f"⏱️  {scraper_name} skipped, no time left in the run budget")
+        REGISTRY.inc('runs', scraper=scraper_name, status='skipped')
+        return {
+            'name': scraper_name,
+            'status': 'skipped',
+            'elapsed': 0.0,
+            'error': 'run budget exhausted'
+        }
     
     logger.info(f"\n{'='*60}")
     logger.info(f"Starting: {scraper_name}")
     logger.info(f"{'='*60}")
     
+    start_time = time.time()
+    scraper = None
+    
     try:
-        start_time = time.time()
-        
-        # Initialize and run scraper
+        # Import (first run only), initialize and run scraper. A module that
+        # fails to import only fails this scraper
+        scraper_class = load_scraper_class(scraper_config)
         scraper = scraper_class()
-        scraper.run()
+        scraper.run(deadline=deadline, bulk=bulk, resources=resources)
         
         elapsed = time.time() - start_time
         logger.info(f"✅ {scraper_name} completed in {elapsed:.2f}s")
+        record_run(scraper_name, 'success', elapsed)
         
         return {
             'name': scraper_name,
             'status': 'success',
-            'elapsed': elapsed
+            'elapsed': elapsed,
+            'metrics': scraper.metrics.report()
         }
         
     except Exception as e:
         logger.error(f"{scraper_name} failed: {e}")
+        elapsed = time.time() - start_time
+        record_run(scraper_name, 'failed', elapsed)
         return {
             'name': scraper_name,
             'status': 'failed',
-            'error': str(e)
+            'elapsed': elapsed,
+            'error': str(e),
+            'metrics': scraper.metrics.report() if scraper else None
+        }
+
+def run_parallel(scraper_configs, max_workers, deadline=None, bulk=False, resources=None):
+    """Run scrapers concurrently on a thread pool, keeping priority order in the results
+    
+    Scrapers run side by side, so they all share the same `deadline`.
+    """
+    workers = max(1, min(max_workers, len(scraper_configs)))
+    logger.info(f"Parallel mode: {workers} worker(s)")
+    
+    results = [None] * len(scraper_configs)
+    
+    # Scrapers are submitted in priority order, so higher priority ones
+    # get a worker first when there are more scrapers than workers
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scraper') as executor:
+        futures = {
+            executor.submit(run_scraper, config, deadline, bulk, resources): index
+            for index, config in enumerate(scraper_configs)
         }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                # run_scraper already catches scraper errors, this only
+                # guards against failures in the pool itself
+                logger.error(f"{scraper_configs[index]['name']} failed: {e}")
+                results[index] = {
+                    'name': scraper_configs[index]['name'],
+                    'status': 'failed',
+                    'elapsed': 0.0,
+                    'error': str(e)
+                }
+    
+    return results
 
-def run_all_scrapers(parallel=False):
-    """Run all enabled scrapers"""
+def run_all_scrapers(parallel=False, max_workers=None, budget=None, bulk=False):
+    """Run all enabled scrapers, within `budget` seconds if given (default RUN_BUDGET)"""
     
     logger.info(f"\n{'#'*60}")
     logger.info(f"SCRAPER RUN STARTED: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     logger.info(f"{'#'*60}\n")
     
     # Filter enabled scrapers and sort by priority
-    enabled_scrapers = [s for s in ACTIVE_SCRAPERS if s.get('enabled', True)]
-    enabled_scrapers.sort(key=lambda x: x.get('priority', 999))
+    enabled_scrapers = active_scrapers()
     
     logger.info(f"Running {len(enabled_scrapers)} scraper(s):\n")
     for scraper in enabled_scrapers:
@@ -95,18 +191,37 @@ def run_all_scrapers(parallel=False):
     
     results = []
     total_start = time.time()
+    started_at = datetime.utcnow().isoformat()
     
-    if parallel:
-        # TODO: Implement parallel execution with threading/multiprocessing
-        logger.warning("Parallel execution not yet implemented, running sequentially")
+    budget = budget if budget is not None else RUN_BUDGET
+    run_deadline = time.monotonic() + budget if budget else None
+    if budget:
+        logger.info(f"Time budget: {budget:.0f}s")
     
-    # Sequential execution
-    for scraper_config in enabled_scrapers:
-        result = run_scraper(scraper_config)
-        results.append(result)
-        
-        # Small delay between scrapers to be polite to servers
-        time.sleep(2)
+    # One Postgres pool and RabbitMQ connection shared by every scraper of the run
+    workers = max_workers or MAX_PARALLEL_WORKERS
+    resources = RunResources(max_db_connections=workers if parallel else 1)
+    try:
+        if parallel and enabled_scrapers:
+            results = run_parallel(enabled_scrapers, workers, run_deadline, bulk, resources)
+        else:
+            # Sequential execution
+            for index, scraper_config in enumerate(enabled_scrapers):
+                deadline = None
+                if run_deadline is not None:
+                    # This scraper's share of what is left, by priority
+                    remaining_weights = sum(budget_weight(s) for s in enabled_scrapers[index:])
+                    share = budget_weight(scraper_config) / remaining_weights
+                    deadline = time.monotonic() + max(0.0, run_deadline - time.monotonic()) * share
+                
+                result = run_scraper(scraper_config, deadline, bulk, resources)
+                results.append(result)
+                
+                # Small delay between scrapers to be polite to servers
+                if index < len(enabled_scrapers) - 1:
+                    time.sleep(2)
+    finally:
+        resources.close()
     
     total_elapsed = time.time() - total_start
     
@@ -117,10 +232,12 @@ def run_all_scrapers(parallel=False):
     
     successful = [r for r in results if r['status'] == 'success']
     failed = [r for r in results if r['status'] == 'failed']
+    skipped = [r for r in results if r['status'] == 'skipped']
     
     logger.info(f"Total Time: {total_elapsed:.2f}s")
     logger.info(f"Successful: {len(successful)}/{len(results)}")
-    logger.info(f"Failed: {len(failed)}/{len(results)}\n")
+    logger.info(f"Failed: {len(failed)}/{len(results)}")
+    logger.info(f"Skipped: {len(skipped)}/{len(results)}\n")
     
     if successful:
         logger.info("Successful scrapers:")
@@ -132,22 +249,94 @@ def run_all_scrapers(parallel=False):
         for r in failed:
             logger.info(f"   - {r['name']}: {r['error']}")
     
+    if skipped:
+        logger.info("\n Skipped scrapers (out of time):")
+        for r in skipped:
+            logger.info(f"   - {r['name']}")
+    
     logger.info(f"\n{'#'*60}\n")
     
+    export_metrics(results, total_elapsed, started_at)
+    
     return results
 
-def run_specific_scraper(scraper_name):
-    """Run a specific scraper by name"""
-    scraper_config = next((s for s in ACTIVE_SCRAPERS if s['name'] == scraper_name), None)
+def run_bulk_import(path, source_id=None):
+    """Load a JSON Lines file of records or queue envelopes straight into scraped_prices"""
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    from bulk_loader import bulk_import
+    
+    logger.info(f"Bulk importing {path}")
+    start = time.time()
+    conn = psycopg2.connect(os.getenv('DATABASE_URL'), cursor_factory=RealDictCursor)
+    try:
+        result = bulk_import(conn, path, source_id=source_id, logger=logger)
+    finally:
+        conn.close()
+    logger.info(f"✅ {result} in {time.time() - start:.2f}s")
+    return result
+
+def parse_time(value):
+    """Epoch seconds of an ISO date or date-time given on the command line (UTC)"""
+    if value is None:
+        return None
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def run_replay(scraper_name, since=None, until=None, queries=None, workers=None, bulk=False):
+    """Parse a scraper's archived pages again and publish the records (see replay.py)"""
+    from base_scraper import STATE_DIR
+    from replay import replay_records
+    
+    scraper_config = next((s for s in registered_scrapers(ACTIVE_SCRAPERS) if s['name'] == scraper_name), None)
+    if not scraper_config:
+        logger.error(f"Scraper '{scraper_name}' not found")
+        return
+    
+    scraper = load_scraper_class(scraper_config)()
+    archive_dir = scraper.page_archive_dir or os.path.join(STATE_DIR, 'page_archive')
+    logger.info(f"Replaying {scraper_name} pages from {archive_dir} "
+                f"({since or 'start'} to {until or 'now'}, {workers or os.cpu_count()} worker(s))")
+    
+    started_at = datetime.utcnow().isoformat()
+    start_time = time.time()
+    records = replay_records(
+        scraper, scraper_config, archive_dir,
+        since=parse_time(since), until=parse_time(until), queries=queries, workers=workers
+    )
+    try:
+        scraper.run(bulk=bulk, records=records)
+        status, error = 'success', None
+    except Exception as e:
+        logger.error(f"Replay of {scraper_name} failed: {e}")
+        status, error = 'failed', str(e)
+    
+    elapsed = time.time() - start_time
+    logger.info(f"{'✅' if status == 'success' else '❌'} Replay of {scraper_name} finished in {elapsed:.2f}s")
+    result = {'name': scraper_name, 'status': status, 'elapsed': elapsed, 'metrics': scraper.metrics.report()}
+    if error:
+        result['error'] = error
+    export_metrics([result], elapsed, started_at)
+    return result
+
+def run_specific_scraper(scraper_name, bulk=False):
+    """Run a specific scraper by name, importing only that scraper"""
+    scrapers = registered_scrapers(ACTIVE_SCRAPERS)
+    scraper_config = next((s for s in scrapers if s['name'] == scraper_name), None)
     
     if not scraper_config:
         logger.error(f"Scraper '{scraper_name}' not found")
         logger.info("Available scrapers:")
-        for s in ACTIVE_SCRAPERS:
+        for s in scrapers:
             logger.info(f"  - {s['name']}")
         return
     
-    run_scraper(scraper_config)
+    started_at = datetime.utcnow().isoformat()
+    result = run_scraper(scraper_config, bulk=bulk)
+    export_metrics([result], result['elapsed'], started_at)
+    return result
 
 if __name__ == '__main__':
     import argparse
@@ -155,18 +344,42 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Run agricultural price scrapers')
     parser.add_argument('--scraper', type=str, help='Run specific scraper by name')
     parser.add_argument('--parallel', action='store_true', help='Run scrapers in parallel')
+    parser.add_argument('--workers', type=int, default=None,
+                        help=f'Max scrapers running at once with --parallel (default: {MAX_PARALLEL_WORKERS}), '
+                             f'parse processes with --replay (default: CPU count)')
+    parser.add_argument('--budget', type=float, default=None,
+                        help='Time budget of the whole run in seconds, shared by priority (default: SCRAPER_RUN_BUDGET)')
+    parser.add_argument('--bulk', action='store_true',
+                        help='Backfill mode: COPY records straight into scraped_prices instead of RabbitMQ')
+    parser.add_argument('--bulk-import', metavar='FILE',
+                        help='Load a JSON Lines file of records or queue envelopes into scraped_prices and exit')
+    parser.add_argument('--source-id', type=int, default=None,
+                        help='Source ID for --bulk-import records that do not carry one')
+    parser.add_argument('--replay', metavar='SCRAPER',
+                        help="Parse a scraper's archived pages (PAGE_ARCHIVE=1) again and publish the records")
+    parser.add_argument('--since', help='--replay: first fetch time, ISO date or date-time (UTC)')
+    parser.add_argument('--until', help='--replay: end of the range (exclusive), ISO date or date-time (UTC)')
+    parser.add_argument('--query', action='append', dest='queries',
+                        help='--replay: only pages of this search query (repeatable)')
     parser.add_argument('--list', action='store_true', help='List all available scrapers')
     
     args = parser.parse_args()
     
     if args.list:
+        # Read from the registry only, no scraper is imported
         print("\nAvailable Scrapers:")
-        print("-" * 60)
-        for scraper in ACTIVE_SCRAPERS:
+        print("-" * 100)
+        for scraper in registered_scrapers(ACTIVE_SCRAPERS):
             status = "Enabled" if scraper.get('enabled', True) else "Disabled"
-            print(f"{scraper['name']:<30} {status:<15} Priority: {scraper.get('priority', 'N/A')}")
+            print(f"{scraper['name']:<30} {status:<10} Priority: {scraper.get('priority', 'N/A'):<5} "
+                  f"{import_path(scraper)}" + (f" ({scraper['origin']})" if scraper.get('origin') else ''))
         print()
+    elif args.replay:
+        run_replay(args.replay, since=args.since, until=args.until, queries=args.queries,
+                   workers=args.workers, bulk=args.bulk)
+    elif args.bulk_import:
+        run_bulk_import(args.bulk_import, source_id=args.source_id)
     elif args.scraper:
-        run_specific_scraper(args.scraper)
+        run_specific_scraper(args.scraper, bulk=args.bulk)
     else:
-        run_all_scrapers(parallel=args.parallel)
\ No newline at end of file
+        run_all_scrapers(parallel=args.parallel, max_workers=args.workers, budget=args.budget, bulk=args.bulk)
\ No newline at end of file
@@ -1,12 +1,19 @@
 """
 Scraper Scheduler
-Runs scrapers automatically at configured intervals
+Runs each scraper automatically at its own interval on a worker pool
 """
-import schedule
+import heapq
+import os
+import random
+import threading
 import time
 import logging
-from datetime import datetime
-from run_all_scrapers import run_all_scrapers, run_specific_scraper
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional
+from metrics import REGISTRY
+from resources import RunResources
+from run_all_scrapers import MAX_PARALLEL_WORKERS, active_scrapers, export_metrics, run_scraper
 
 logging.basicConfig(
     level=logging.INFO,
@@ -15,61 +22,243 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Prometheus endpoint of the scheduler process (0 disables it)
+METRICS_PORT = int(os.getenv('SCRAPER_METRICS_PORT', '9108'))
+METRICS_HOST = os.getenv('SCRAPER_METRICS_HOST', '127.0.0.1')
+
 # SCHEDULE CONFIGURATION
-# Adjust these based on your needs
-SCHEDULES = {
-    'all_scrapers': {
-        'interval': 30,  # minutes
-        'enabled': True
-    },
-    # You can add specific scraper schedules
-    # 'Sample Scraper': {
-    #     'interval': 15,
-    #     'enabled': False
-    # }
-}
-
-def scheduled_run_all():
-    """Scheduled execution of all scrapers"""
-    logger.info(f"\n⏰ Scheduled run triggered at {datetime.now()}")
-    run_all_scrapers()
-
-def setup_schedules():
-    """Configure all schedules"""
-    if SCHEDULES['all_scrapers']['enabled']:
-        interval = SCHEDULES['all_scrapers']['interval']
-        schedule.every(interval).minutes.do(scheduled_run_all)
-        logger.info(f"✅ Scheduled: All scrapers every {interval} minutes")
-    
-    # Add more specific schedules here
-    # schedule.every().hour.do(lambda: run_specific_scraper("Lagos Market Board"))
-    # schedule.every().day.at("09:00").do(scheduled_run_all)
-
-def run_scheduler():
+# Each ACTIVE_SCRAPERS entry may set its own 'interval' (minutes), 'jitter'
+# (share of the interval added at random to each run, so scrapers started
+# together drift apart) and 'overlap' policy. These are the defaults.
+DEFAULT_INTERVAL_MINUTES = 30
+DEFAULT_JITTER = 0.1
+
+# What to do when a run is due while the previous one is still going:
+# 'coalesce' runs once more right after it finishes, however many runs were
+# missed; 'skip' drops the missed run and waits for the next interval
+DEFAULT_OVERLAP = 'coalesce'
+OVERLAP_POLICIES = ('coalesce', 'skip')
+
+# Share of its interval a run may take, so it is finished before the next
+# run is due (the scraper stops fetching and publishes what it has)
+RUN_BUDGET_SHARE = float(os.getenv('SCHEDULER_BUDGET_SHARE', '0.9'))
+
+# Scrapers running at the same time
+SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', str(MAX_PARALLEL_WORKERS)))
+
+
+class ScheduledJob:
+    """One scraper's schedule, run state and timing history"""
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.name = config['name']
+        self.interval = config.get('interval', DEFAULT_INTERVAL_MINUTES) * 60
+        self.jitter = config.get('jitter', DEFAULT_JITTER) * self.interval
+        self.overlap = config.get('overlap', DEFAULT_OVERLAP)
+        if self.overlap not in OVERLAP_POLICIES:
+            raise ValueError(f"{self.name}: overlap must be one of {OVERLAP_POLICIES}, not {self.overlap!r}")
+
+        # Unjittered slot of the next run; runs stay on a fixed grid so
+        # jitter and slow runs do not make the schedule drift
+        self.next_slot = None
+        self.next_run = None
+        self.running = False
+        self.pending_since = None
+        self.runs = 0
+        self.skipped = 0
+        self.coalesced = 0
+        self.last_lateness = None
+        self.last_duration = None
+        self.last_status = None
+
+    def plan(self, slot: float):
+        """Set the next run to `slot` plus random jitter"""
+        self.next_slot = slot
+        self.next_run = slot + random.uniform(0, self.jitter)
+
+    def advance(self, now: float):
+        """Move to the first slot after `now`, returning how many slots were passed over"""
+        missed = 0
+        slot = self.next_slot + self.interval
+        while slot + self.jitter <= now:
+            slot += self.interval
+            missed += 1
+        self.plan(slot)
+        return missed
+
+
+class Scheduler:
+    """Fires jobs at precise times and runs them on a thread pool
+
+    The loop sleeps on an Event until the earliest due job (a heap keyed by
+    run time) or until a finishing run wakes it, so there is no polling.
+    A run never overlaps the previous run of the same job. All runs borrow
+    their connections from one RunResources kept open for the scheduler's
+    lifetime.
+    """
+
+    def __init__(self, jobs: List[ScheduledJob], workers: int = SCHEDULER_WORKERS):
+        self.jobs = jobs
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='job')
+        self.resources = RunResources(max_db_connections=max(1, workers))
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.heap = []
+        self.sequence = 0
+        # Latest result of every scraper, written together as the run report
+        self.latest_results = {}
+
+    def _push(self, job: ScheduledJob):
+        self.sequence += 1
+        heapq.heappush(self.heap, (job.next_run, self.sequence, job))
+
+    def start(self, run_now: bool = False):
+        now = time.monotonic()
+        with self.lock:
+            for job in self.jobs:
+                job.plan(now if run_now else now + job.interval)
+                self._push(job)
+
+    def run_forever(self):
+        while not self.stopping.is_set():
+            with self.lock:
+                timeout = self._dispatch_due(time.monotonic())
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+
+    def _dispatch_due(self, now: float) -> Optional[float]:
+        """Start every due job and return the seconds until the next one"""
+        while self.heap and self.heap[0][0] <= now:
+            due, _, job = heapq.heappop(self.heap)
+            if job.next_run != due:
+                continue  # stale heap entry
+
+            if job.running:
+                if job.overlap == 'coalesce':
+                    if job.pending_since is None:
+                        job.pending_since = due
+                    job.coalesced += 1
+                    REGISTRY.inc('scheduled_runs', scraper=job.name, outcome='coalesced')
+                    logger.warning(f"⏳ {job.name} still running, will run again when it finishes")
+                else:
+                    job.skipped += 1
+                    REGISTRY.inc('scheduled_runs', scraper=job.name, outcome='skipped')
+                    logger.warning(f"⏭️  {job.name} still running, skipping this run")
+            else:
+                self._submit(job, due, now)
+
+            missed = job.advance(now)
+            if missed and job.overlap == 'coalesce':
+                # Covered by the run just started or the catch-up run pending
+                job.coalesced += missed
+                REGISTRY.inc('scheduled_runs', missed, scraper=job.name, outcome='coalesced')
+            elif missed:
+                job.skipped += missed
+                REGISTRY.inc('scheduled_runs', missed, scraper=job.name, outcome='skipped')
+            self._push(job)
+
+        return max(0.0, self.heap[0][0] - now) if self.heap else None
+
+    def _submit(self, job: ScheduledJob, due: float, now: float):
+        job.running = True
+        job.last_lateness = now - due
+        REGISTRY.inc('scheduled_runs', scraper=job.name, outcome='started')
+        REGISTRY.observe('schedule_lateness', job.last_lateness, scraper=job.name)
+        logger.info(f"\n⏰ Running {job.name} (late by {job.last_lateness:.2f}s)")
+        self.executor.submit(self._run, job)
+
+    def _run(self, job: ScheduledJob):
+        started_at = datetime.utcnow().isoformat()
+        start = time.monotonic()
+        try:
+            result = run_scraper(
+                job.config, deadline=start + job.interval * RUN_BUDGET_SHARE, resources=self.resources
+            )
+        except Exception as e:
+            # run_scraper catches scraper errors, this only guards the scheduler
+            logger.error(f"{job.name} failed: {e}")
+            result = {'name': job.name, 'status': 'failed', 'elapsed': time.monotonic() - start, 'error': str(e)}
+
+        duration = time.monotonic() - start
+
+        with self.lock:
+            self.latest_results[job.name] = result
+            results = list(self.latest_results.values())
+        export_metrics(results, duration, started_at)
+
+        with self.lock:
+            job.running = False
+            job.runs += 1
+            job.last_duration = duration
+            job.last_status = result['status']
+            REGISTRY.set('job_duration_seconds', duration, scraper=job.name)
+
+            if job.overlap == 'coalesce' and job.pending_since is not None and not self.stopping.is_set():
+                # One catch-up run for everything missed while this one ran
+                now = time.monotonic()
+                pending_since, job.pending_since = job.pending_since, None
+                self._submit(job, pending_since, now)
+
+            if job.last_duration > job.interval:
+                logger.warning(
+                    f"⚠️  {job.name} took {duration:.0f}s, longer than its {job.interval:.0f}s interval"
+                )
+        self.wakeup.set()
+
+    def stop(self):
+        """Stop scheduling and wait for running scrapers to finish"""
+        self.stopping.set()
+        self.wakeup.set()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.resources.close()
+
+    def describe(self):
+        now = time.monotonic()
+        with self.lock:
+            for job in sorted(self.jobs, key=lambda j: j.next_run):
+                next_at = datetime.now() + timedelta(seconds=job.next_run - now)
+                logger.info(
+                    f"   - {job.name}: every {job.interval / 60:g} min "
+                    f"(jitter {job.jitter:.0f}s, overlap: {job.overlap}), next at {next_at:%H:%M:%S}"
+                )
+
+
+def build_jobs() -> List[ScheduledJob]:
+    """One job per enabled scraper (scrapers are imported on their first run)"""
+    return [ScheduledJob(config) for config in active_scrapers()]
+
+
+def run_scheduler(run_now: bool = False):
     """Main scheduler loop"""
     logger.info("\n" + "="*60)
     logger.info("🕐 SCRAPER SCHEDULER STARTED")
     logger.info("="*60)
-    
-    setup_schedules()
-    
-    logger.info("\n📅 Active Schedules:")
-    for job in schedule.get_jobs():
-        logger.info(f"   - {job}")
-    
+
+    scheduler = Scheduler(build_jobs())
+    scheduler.start(run_now=run_now)
+
+    if METRICS_PORT:
+        REGISTRY.serve(METRICS_PORT, METRICS_HOST)
+        logger.info(f"📈 Metrics at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+    logger.info(f"\n📅 Active Schedules ({SCHEDULER_WORKERS} worker(s)):")
+    scheduler.describe()
+
     logger.info("\n⏳ Waiting for scheduled runs... (Press Ctrl+C to stop)\n")
-    
-    # Optional: Run once immediately
-    # logger.info("🚀 Running initial scrape...")
-    # run_all_scrapers()
-    
+
     try:
-        while True:
-            schedule.run_pending()
-            time.sleep(60)  # Check every minute
+        scheduler.run_forever()
     except KeyboardInterrupt:
-        logger.info("\n\n🛑 Scheduler stopped by user")
+        logger.info("\n\n🛑 Scheduler stopped by user, waiting for running scrapers...")
+        scheduler.stop()
 
 if __name__ == '__main__':
-    run_scheduler()
-    
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run scrapers on their schedules')
+    parser.add_argument('--run-now', action='store_true', help='Run every scraper once at startup')
+    args = parser.parse_args()
+
+    run_scheduler(run_now=args.run_now)
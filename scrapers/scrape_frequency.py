@@ -0,0 +1,196 @@
+"""
+Adaptive scrape frequency per product
+Scrapes volatile products often and stable ones rarely, based on how fast
+their prices have been moving per location
+"""
+import math
+import sqlite3
+import statistics
+import threading
+import time
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional
+
+# Per (product, location): relative price change per hour between consecutive
+# daily medians of approved prices
+DB_VOLATILITY_QUERY = """
+    WITH daily AS (
+        SELECT product_id, location_id,
+               time_bucket('1 day', time) AS bucket,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY price) AS price
+        FROM prices
+        WHERE time > NOW() - %s * INTERVAL '1 day'
+          AND product_id = ANY(%s)
+          AND price > 0
+        GROUP BY 1, 2, 3
+    ), changes AS (
+        SELECT product_id, location_id,
+               ABS(LN(price / LAG(price) OVER w))
+                 / NULLIF(EXTRACT(EPOCH FROM bucket - LAG(bucket) OVER w) / 3600, 0) AS rate
+        FROM daily
+        WINDOW w AS (PARTITION BY product_id, location_id ORDER BY bucket)
+    )
+    SELECT product_id, location_id, AVG(rate) AS rate, COUNT(rate) AS samples
+    FROM changes
+    WHERE rate IS NOT NULL
+    GROUP BY product_id, location_id
+"""
+
+
+class ProductPlan:
+    """Scrape decision for one product"""
+
+    __slots__ = ('product', 'rate', 'interval', 'last_scraped', 'due', 'basis')
+
+    def __init__(self, product: str, rate: Optional[float], interval: float,
+                 last_scraped: Optional[float], due: bool, basis: str):
+        self.product = product
+        self.rate = rate
+        self.interval = interval
+        self.last_scraped = last_scraped
+        self.due = due
+        self.basis = basis
+
+
+class FrequencyPlanner:
+    """Turns recent price change rates into per-product scrape intervals
+
+    A product is rescraped once its prices are expected to have moved by
+    `change_threshold` (relative), i.e. interval = threshold / change per hour,
+    clamped to [min_interval, max_interval] seconds. The change rate of a
+    product is that of its most volatile location, because one search covers
+    every location. Rates come from the `prices` hypertable when it has enough
+    history, otherwise from the medians this planner records after each run.
+    Products with no history yet use min_interval.
+    """
+
+    def __init__(self, path: str, min_interval: float, max_interval: float,
+                 change_threshold: float = 0.05, lookback_days: int = 30, min_samples: int = 3):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.change_threshold = change_threshold
+        self.lookback_days = lookback_days
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS price_observations (
+                source TEXT NOT NULL,
+                product TEXT NOT NULL,
+                location_id INTEGER NOT NULL,
+                observed_at REAL NOT NULL,
+                price REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_price_observations
+                ON price_observations(source, product, location_id, observed_at);
+            CREATE TABLE IF NOT EXISTS product_schedule (
+                source TEXT NOT NULL,
+                product TEXT NOT NULL,
+                last_scraped REAL NOT NULL,
+                PRIMARY KEY (source, product)
+            );
+        """)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM price_observations WHERE observed_at < ?",
+                (time.time() - lookback_days * 86400,)
+            )
+
+    def db_rates(self, conn, product_ids: Dict[str, int]) -> Dict[str, float]:
+        """Change rate per product from the prices hypertable (products with too little history are left out)"""
+        names = {product_id: name for name, product_id in product_ids.items() if product_id}
+        if not names:
+            return {}
+
+        with conn.cursor() as cursor:
+            cursor.execute(DB_VOLATILITY_QUERY, (self.lookback_days, list(names)))
+            rows = cursor.fetchall()
+
+        rates = {}
+        for row in rows:
+            if row['samples'] >= self.min_samples:
+                name = names[row['product_id']]
+                rates[name] = max(rates.get(name, 0.0), float(row['rate']))
+        return rates
+
+    def local_rate(self, source: str, product: str) -> Optional[float]:
+        """Change rate per product from the run medians recorded by this planner"""
+        with self.lock:
+            rows = self.conn.execute(
+                """SELECT location_id, observed_at, price FROM price_observations
+                   WHERE source = ? AND product = ? ORDER BY location_id, observed_at""",
+                (source, product)
+            ).fetchall()
+
+        rates = []
+        for _, group in groupby(rows, key=lambda row: row[0]):
+            points = list(group)
+            changes = [
+                abs(math.log(price / previous_price)) / ((observed_at - previous_at) / 3600)
+                for (_, previous_at, previous_price), (_, observed_at, price) in zip(points, points[1:])
+                if observed_at > previous_at and previous_price > 0 and price > 0
+            ]
+            if len(changes) >= self.min_samples:
+                rates.append(statistics.fmean(changes))
+
+        return max(rates) if rates else None
+
+    def interval(self, rate: Optional[float]) -> float:
+        """Seconds between scrapes for a change rate (relative change per hour)"""
+        if rate is None:
+            return self.min_interval
+        if rate <= 0:
+            return self.max_interval
+        return min(self.max_interval, max(self.min_interval, self.change_threshold / rate * 3600))
+
+    def plan(self, source: str, products: Iterable[str],
+             db_rates: Optional[Dict[str, float]] = None) -> List[ProductPlan]:
+        """Interval and due state of every product"""
+        db_rates = db_rates or {}
+        with self.lock:
+            last_scraped = dict(self.conn.execute(
+                "SELECT product, last_scraped FROM product_schedule WHERE source = ?", (source,)
+            ).fetchall())
+
+        now = time.time()
+        plans = []
+        for product in products:
+            if product in db_rates:
+                rate, basis = db_rates[product], 'prices'
+            else:
+                rate = self.local_rate(source, product)
+                basis = 'history' if rate is not None else 'none'
+
+            interval = self.interval(rate)
+            last = last_scraped.get(product)
+            # A little slack so a product due just after the scheduled run is not skipped for a whole cycle
+            due = last is None or now - last >= interval * 0.95
+            plans.append(ProductPlan(product, rate, interval, last, due, basis))
+        return plans
+
+    def record(self, source: str, product: str, location_prices: Dict[int, List[float]],
+               scraped_at: Optional[float] = None):
+        """Mark a product as scraped and keep the median price seen per location"""
+        scraped_at = scraped_at or time.time()
+        rows = [
+            (source, product, location_id, scraped_at, statistics.median(prices))
+            for location_id, prices in location_prices.items()
+            if prices
+        ]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                """INSERT INTO price_observations (source, product, location_id, observed_at, price)
+                   VALUES (?, ?, ?, ?, ?)""",
+                rows
+            )
+            self.conn.execute(
+                """INSERT INTO product_schedule (source, product, last_scraped) VALUES (?, ?, ?)
+                   ON CONFLICT (source, product) DO UPDATE SET last_scraped = excluded.last_scraped""",
+                (source, product, scraped_at)
+            )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -1,72 +1,137 @@
 import sys
 import os
-import requests
-from bs4 import BeautifulSoup
-from typing import List, Dict
+from typing import Dict, Iterator, List, Optional, Tuple
 import re
-import time
-import random
+from collections import Counter
 
 # Fix import path to find base_scraper in the parent directory
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from base_scraper import BaseScraper
+from fetcher import CircuitOpenError, DeadlineExceeded
+from html_extract import Selector
+from rule_engine import ProductRuleEngine
+from units import UnitNormalizer
 
 class JijiScraper(BaseScraper):
+    # Roughly one search every 2-3 seconds, with up to 3 in flight
+    requests_per_second = 0.4
+    burst = 2
+    max_concurrency = 3
+    
+    # Pagination: deepest page per query, pages of one query fetched at once,
+    # and the share of already-known listings on a page that stops paging
+    max_pages = int(os.getenv('JIJI_MAX_PAGES', '10'))
+    page_window = 2
+    known_stop_ratio = 0.5
+    
+    # Jiji structure often changes, alternatives are tried in order
+    listing_selectors = {
+        'container': [
+            Selector('div', 'b-list-advert__gallery__item', contains=True),
+            Selector('div', 'masonry-item'),
+        ],
+        'title': [
+            Selector('div', 'b-advert-title-inner'),
+            Selector('h3'),
+            Selector('div', 'qa-advert-title'),
+        ],
+        'price': [
+            Selector('div', 'qa-advert-price'),
+            Selector('span', 'price', contains=True),
+        ],
+        'location': [
+            Selector('span', 'b-list-advert__region'),
+            Selector('div', 'b-list-advert__region'),
+        ],
+        'url': [
+            Selector('a', attr='href'),
+        ],
+    }
+    
     def __init__(self):
         super().__init__("Jiji.ng Marketplace")
         
         self.base_url = "https://jiji.ng"
         
         # STRICT RULES CONFIGURATION
+        # `product_terms` name the product itself; a listing found on another
+        # product's search page is only considered when it mentions one.
+        # `base_unit` / `unit_quantity` / `density` convert prices to per kg;
+        # a pack size in the title overrides `default_unit`
         self.product_rules = {
             'Rice (Local)': {
                 'query': 'mango+rice',
                 'must_include': ['local', 'nigeria', 'mango', 'ofada', 'stone free', 'abakaliki'],
                 'must_not_include': ['foreign', 'long grain', 'thailand', 'caprice', 'vape'], 
-                'default_unit': 'bag (50kg)'
+                'product_terms': ['rice'],
+                'default_unit': 'bag (50kg)',
+                'base_unit': 'kg',
+                'unit_quantity': 50
             },
             'Rice (Foreign)': {
                 'query': 'mama+gold+rice',
                 'must_include': ['foreign', 'royal', 'stallion', 'caprice', 'thailand', 'mama gold'], 
                 'must_not_include': ['local', 'ofada', 'nigeria'],
-                'default_unit': 'bag (50kg)'
+                'product_terms': ['rice'],
+                'default_unit': 'bag (50kg)',
+                'base_unit': 'kg',
+                'unit_quantity': 50
             },
             'Beans (Brown)': {
                 'query': 'brown+beans',
                 'must_include': ['brown', 'honey', 'oloyin', 'drum'],
                 'must_not_include': ['white', 'black'],
-                'default_unit': 'bag (100kg)'
+                'product_terms': ['beans'],
+                'default_unit': 'bag (100kg)',
+                'base_unit': 'kg',
+                'unit_quantity': 100
             },
             'Tomatoes': {
                 'query': 'basket+tomatoes',
                 'must_include': ['basket', 'fresh', 'rafia'],
                 'must_not_include': ['paste', 'tin', 'sachet'],
-                'default_unit': 'basket'
+                'product_terms': ['tomato'],
+                'default_unit': 'basket',
+                'base_unit': 'kg',
+                'unit_quantity': None  # basket sizes vary, per kg only when the title says
             },
              'Onions': {
                 'query': 'bag+onions',
                 'must_include': ['dry', 'bag', 'white', 'red'],
                 'must_not_include': ['spring', 'powder'],
-                'default_unit': 'bag (100kg)'
+                'product_terms': ['onion'],
+                'default_unit': 'bag (100kg)',
+                'base_unit': 'kg',
+                'unit_quantity': 100
             },
             'Palm Oil': {
                 'query': 'palm+oil+25+liters',
                 'must_include': ['red', 'palm', 'oil'],
                 'must_not_include': ['kernel', 'vegetable', 'kings'],
-                'default_unit': 'liter'
+                'product_terms': ['palm oil'],
+                'default_unit': 'liter',
+                'base_unit': 'l',
+                'unit_quantity': 1,
+                'density': 0.91  # kg per liter
             },
             'Yam': {
                 'query': 'tubers+yam',
                 'must_include': ['tuber', 'fresh', 'benue', 'abuja'],
                 'must_not_include': ['flour', 'pounded', 'dried'],
-                'default_unit': 'tuber'
+                'product_terms': ['yam'],
+                'default_unit': 'tuber',
+                'base_unit': 'kg',
+                'unit_quantity': None  # tuber weights vary
             },
             'Garri (White)': {
                 'query': 'bag+garri',
                 'must_include': ['white', 'ijebu', 'bag'],
                 'must_not_include': ['yellow', 'fried'],
-                'default_unit': 'bag (50kg)'
+                'product_terms': ['garri', 'gari'],
+                'default_unit': 'bag (50kg)',
+                'base_unit': 'kg',
+                'unit_quantity': 50
             }
         }
         
@@ -87,30 +152,9 @@ class JijiScraper(BaseScraper):
         # 7 New Benin (Edo), 8 Onitsha Main (Anambra), 9 Terminus (Plateau),
         # 10+ additional markets inserted later (Port Harcourt, Obio-Akpor, ...)
         
-        self.location_map = {
-            # State-level defaults
-            'Lagos': 1,
-            'FCT': 2,
-            'Abuja': 2,
-            'Abia': 3,
-            'Oyo': 4,
-            'Kano': 5,
-            'Rivers': 10,   # default to Port Harcourt Market (ID 10)
-            'Edo': 7,
-            'Anambra': 8,
-            'Plateau': 9,
-            'Ogun': 29,     # Ado-Odo/Ota Market (ID 29)
-            'Kwara': 17,
-            'Borno': 19,
-            'Delta': 26,
-            'Ebonyi': 27,
-            'Nasarawa': 28,
-            'Benue': 25,
-            'Osun': 32,
-
-            # City / market specific mappings (substring match)
+        # City / market specific mappings, preferred over the state defaults
+        self.market_locations = {
             'Port Harcourt': 10,
-            'Port-Harcourt': 10,
             'Obio-Akpor': 11,
             'Shomolu': 12,
             'Ajah': 13,
@@ -137,100 +181,247 @@ class JijiScraper(BaseScraper):
             'Ede': 32,
             'Ilorin South': 33,
             'Sagamu': 34,
-
-            # Fallbacks
             'Ibadan': 4,
         }
+        
+        # State-level defaults
+        self.state_locations = {
+            'Lagos': 1,
+            'FCT': 2,
+            'Abuja': 2,
+            'Abia': 3,
+            'Oyo': 4,
+            'Kano': 5,
+            'Rivers': 10,   # default to Port Harcourt Market (ID 10)
+            'Edo': 7,
+            'Anambra': 8,
+            'Plateau': 9,
+            'Ogun': 29,     # Ado-Odo/Ota Market (ID 29)
+            'Kwara': 17,
+            'Borno': 19,
+            'Delta': 26,
+            'Ebonyi': 27,
+            'Nasarawa': 28,
+            'Benue': 25,
+            'Osun': 32,
+        }
+        
+        self.build_location_matcher(self.market_locations, self.state_locations)
+        
+        # All products' keyword rules compiled into one classifier
+        self.rule_engine = ProductRuleEngine(self.product_rules)
+        self.unit_normalizer = UnitNormalizer(self.product_rules)
+        self.product_ids = {}
+        self.seen_listings = set()
+    
+    def parse_settings(self) -> Dict:
+        """Selectors plus the product rules and location maps a page's records depend on"""
+        return {
+            **super().parse_settings(),
+            'product_rules': self.product_rules,
+            'market_locations': self.market_locations,
+            'state_locations': self.state_locations,
+        }
     
-    def scrape(self) -> List[Dict]:
-        """Scrape prices from Jiji.ng with strict filtering"""
-        all_results = []
+    def search_url(self, query: str, page: int = 1) -> str:
+        """Search results URL for a query and page number"""
+        url = f"{self.base_url}/search?query={query}"
+        return url if page == 1 else f"{url}&page={page}"
+    
+    def scrape(self) -> Iterator[Dict]:
+        """Scrape prices from Jiji.ng with strict filtering, yielding each page's records as it is parsed"""
+        self.seen_listings = set()
+        
+        # In adaptive mode only products whose prices are due for a refresh
+        products = self.due_products(list(self.product_rules))
+        if not products:
+            self.logger.info("😴 No product is due for scraping yet")
+            return
+        
+        # 1. Build Search URLs, one per distinct query.
+        # Every page is classified against all products, so products sharing
+        # a query (or a broad category page) are served by a single fetch.
+        query_products = {}
+        for product_name in products:
+            query_products.setdefault(self.product_rules[product_name]['query'], []).append(product_name)
         
-        for product_name, rules in self.product_rules.items():
-            self.logger.info(f"\n🔍 Searching for: {product_name}")
+        self.logger.info(f"\n🔍 Searching for: {', '.join(products)}")
+        scraped_records = []
+        failed_queries = set()
+        
+        # A first crawl goes deep, so fetch several pages per query at once.
+        # Later runs usually stop on page 1, so start with a single page.
+        first_crawl = not self.listing_store.has_history(self.source_name)
+        window = self.page_window if first_crawl else 1
+        next_page = {query: 1 for query in query_products}
+        
+        while next_page:
+            if self.out_of_time():
+                self.logger.warning(f"⏱️  Out of time, not paging further into: {', '.join(next_page)}")
+                break
             
-            try:
-                # 1. Build Search URL
-                search_url = f"{self.base_url}/search?query={rules['query']}"
-                
-                # Random delay to avoid getting blocked
-                time.sleep(random.uniform(2, 5))
+            # One round: the next pages of every query still paging, all in flight together
+            search_urls = {
+                (query, page_no): self.search_url(query, page_no)
+                for query, first in next_page.items()
+                for page_no in range(first, min(first + window, self.max_pages + 1))
+            }
+            finished = set()
+            
+            # Pages arrive as they finish downloading, so parsing one page
+            # overlaps with the requests still in flight
+            for page in self.fetch_pages(search_urls):
+                query, page_no = page.key
+                page_products = query_products[query]
+                self.metrics.observe('fetch', page.elapsed, query=query)
+                self.metrics.count('pages', result='error' if not page.ok else 'unchanged' if page.unchanged else 'ok')
                 
-                response = requests.get(search_url, headers=self.headers, timeout=30)
-                response.raise_for_status()
+                if isinstance(page.error, (CircuitOpenError, DeadlineExceeded)):
+                    # Source is failing or time is up: skip without waiting on the network
+                    self.logger.warning(f"⏭️  Skipped '{query}' page {page_no}: {page.error}")
+                    finished.add(query)
+                    failed_queries.add(query)
+                    continue
                 
-                soup = BeautifulSoup(response.text, 'html.parser')
+                if not page.ok:
+                    self.logger.error(f"❌ Error scraping {', '.join(page_products)} (page {page_no}): {page.error}")
+                    finished.add(query)
+                    failed_queries.add(query)
+                    continue
                 
-                # 2. Parse Listings
-                results = self.parse_listings(soup, product_name, rules)
-                all_results.extend(results)
+                # Same content as last time: nothing to parse, publish or page through
+                if page.unchanged:
+                    self.logger.info(f"⏭️  '{query}' page {page_no} unchanged since last run")
+                    finished.add(query)
+                    continue
                 
-                self.logger.info(f"✅ Found {len(results)} valid listings for {product_name}")
+                try:
+                    # 2. Parse Listings
+                    results, listing_ids = self.parse_page(page.text, page_products)
+                    
+                    # 3. Stop paging once we reach listings an earlier run already saw
+                    known = self.known_listings(listing_ids)
+                    self.remember_listings(listing_ids)
+                    if not listing_ids or len(known) >= self.known_stop_ratio * len(listing_ids):
+                        finished.add(query)
+                    
+                    self.logger.info(
+                        f"✅ Found {len(results)} valid listings on '{query}' page {page_no} "
+                        f"({len(known)}/{len(listing_ids)} known, {page.elapsed:.2f}s fetch)"
+                    )
+                    
+                except Exception as e:
+                    self.logger.error(f"❌ Error scraping {', '.join(page_products)} (page {page_no}): {e}")
+                    finished.add(query)
+                    failed_queries.add(query)
+                    continue
                 
-            except Exception as e:
-                self.logger.error(f"❌ Error scraping {product_name}: {e}")
-                continue
+                if self.adaptive_frequency:
+                    scraped_records.extend(results)
+                yield from results
+                self.page_handled(page)
+            
+            next_page = {
+                query: first + window
+                for query, first in next_page.items()
+                if query not in finished and first + window <= self.max_pages
+            }
+            window = self.page_window
+        
+        self.log_rule_stats()
         
-        return all_results
+        # Products whose search failed stay due for the next run
+        self.record_scraped_products(
+            [p for query, names in query_products.items() if query not in failed_queries for p in names],
+            scraped_records
+        )
+    
+    def listing_id(self, listing: Dict[str, Optional[str]]) -> str:
+        """Stable identifier of a listing: its advert URL without tracking parameters"""
+        if listing['url']:
+            return listing['url'].split('?')[0]
+        return f"{listing['title']}|{listing['price']}"
     
-    def parse_listings(self, soup: BeautifulSoup, product_name: str, rules: Dict) -> List[Dict]:
-        """Parse individual listings with strict filtering rules"""
+    def parse_page(self, html: str, page_products: List[str]) -> Tuple[List[Dict], List[str]]:
+        """Extract a search page and return its valid price records plus the IDs of all its listings"""
+        listings = self.extract_listings(html)
+        with self.metrics.stage('filter'):
+            records = self.parse_listings(listings, page_products)
+        with self.metrics.stage('normalize'):
+            self.unit_normalizer.normalize(records)
+        return records, [self.listing_id(l) for l in listings]
+    
+    def parse_archived_page(self, html: str, query: Optional[str], page: Optional[int]) -> List[Dict]:
+        """Records of an archived search page, classified as they would be for its query today"""
+        page_products = [name for name, rules in self.product_rules.items() if rules['query'] == query]
+        records, _ = self.parse_page(html, page_products or list(self.product_rules))
+        return records
+
+    def begin_replay_run(self):
+        self.seen_listings = set()
+
+    def parse_listings(self, listings: List[Dict[str, Optional[str]]], page_products: List[str]) -> List[Dict]:
+        """Parse individual listings, classifying each against every product's rules"""
         results = []
+        rejected = Counter()
         
-        # Jiji structure often changes, looking for the main item container
-        listings = soup.find_all('div', class_=lambda x: x and 'b-list-advert__gallery__item' in str(x))
-        
-        if not listings:
-            listings = soup.find_all('div', class_='masonry-item')
-            
         for listing in listings:
             try:
-                # A. Extract Title
-                title_elem = listing.find('div', class_='b-advert-title-inner') or \
-                             listing.find('h3') or \
-                             listing.find('div', class_='qa-advert-title')
-                             
-                if not title_elem:
+                # A. Title
+                if not listing['title']:
+                    rejected['no_title'] += 1
                     continue
                     
-                title_text = title_elem.get_text(strip=True).lower()
+                title_text = listing['title'].lower()
                 
-                # B. STRICT FILTERING
-                # Check Negative Keywords (e.g. remove "vape")
-                if any(bad_word in title_text for bad_word in rules['must_not_include']):
-                    # self.logger.debug(f"Skipped (Bad keyword): {title_text}")
+                # Overlapping search pages return the same adverts
+                listing_key = self.listing_id(listing)
+                if listing_key in self.seen_listings:
+                    rejected['duplicate'] += 1
                     continue
-
-                # Check Positive Keywords (must have at least one)
-                if not any(good_word in title_text for good_word in rules['must_include']):
-                    # self.logger.debug(f"Skipped (Irrelevant): {title_text}")
+                self.seen_listings.add(listing_key)
+                
+                # B. STRICT FILTERING
+                # One pass over the title checks every product's include and
+                # exclude keywords, preferring the products this page is for
+                classification = self.rule_engine.classify(title_text, page_products)
+                match = classification.best(page_products)
+                self.rule_engine.record(classification, match)
+                
+                if not match:
+                    rejected['no_rule_match'] += 1
                     continue
                 
-                # C. Extract Price
-                price_elem = listing.find('div', class_='qa-advert-price') or \
-                             listing.find('span', class_=lambda x: x and 'price' in str(x))
+                product_name, matched_keyword = match
+                rules = self.product_rules[product_name]
                 
-                if not price_elem:
+                # C. Price
+                if not listing['price']:
+                    rejected['no_price'] += 1
                     continue
                     
-                price_text = price_elem.get_text(strip=True)
-                price = self.extract_price(price_text)
+                price = self.extract_price(listing['price'])
                 
                 if not price or price <= 1000: # Filter out unrealistic low prices
+                    rejected['low_price'] += 1
                     continue
                 
-                # D. Extract & Map Location
-                location_elem = listing.find('span', class_='b-list-advert__region') or \
-                                listing.find('div', class_='b-list-advert__region')
-                                
-                raw_location = location_elem.get_text(strip=True) if location_elem else "Unknown"
+                # D. Map Location
+                raw_location = listing['location'] or "Unknown"
                 location_id = self.get_location_id(raw_location)
                 
-                # E. Get Product ID
-                product_id = self.get_product_id(product_name)
+                if not location_id:
+                    rejected['unknown_location'] += 1
+                    continue
+                
+                # E. Get Product ID (resolved once per product)
+                if product_name not in self.product_ids:
+                    self.product_ids[product_name] = self.get_product_id(product_name)
+                product_id = self.product_ids[product_name]
                 
                 if not product_id:
                     self.logger.warning(f"Skipping - Product ID not found for {product_name}")
+                    rejected['unknown_product'] += 1
                     continue
                 
                 # F. Add to Results
@@ -241,18 +432,36 @@ class JijiScraper(BaseScraper):
                     'location_name': raw_location, # Sending raw location for verification
                     'price': price,
                     'unit': rules['default_unit'],
-                    'currency': 'NGN'
+                    'currency': 'NGN',
+                    'title': title_text,
+                    'listing_id': listing_key,
+                    'matched_rule': matched_keyword
                 }
                 
                 results.append(price_data)
-                self.logger.info(f"  ✓ Found: ₦{price:,.0f} in {raw_location}")
+                self.logger.info(f"  ✓ Found: {product_name} ₦{price:,.0f} in {raw_location} (rule: '{matched_keyword}')")
                 
             except Exception as e:
                 # self.logger.error(f"Error parsing listing: {e}")
+                rejected['error'] += 1
                 continue
         
+        for reason, count in rejected.items():
+            self.metrics.count('listings_rejected', count, reason=reason)
         return results
     
+    def log_rule_stats(self):
+        """Log how often each rule accepted or rejected a listing"""
+        if not self.rule_engine.stats:
+            return
+        
+        self.logger.info("📋 Rule hits (product, rule, keyword): count")
+        for (product_name, reason, keyword), count in sorted(self.rule_engine.stats.items(), key=str):
+            self.logger.info(f"   {product_name:<16} {reason:<10} {keyword or '-':<12} {count}")
+            if reason != 'include':
+                self.metrics.count('rule_rejections', count, product=product_name, reason=reason)
+        self.rule_engine.stats.clear()
+    
     def extract_price(self, price_text: str) -> float:
         """Extract numeric price from text"""
         try:
@@ -262,16 +471,25 @@ class JijiScraper(BaseScraper):
         except:
             return 0.0
     
-    def get_location_id(self, raw_location_text: str) -> int:
-        """Map raw location string to database ID"""
-        for key, loc_id in self.location_map.items():
-            if key.lower() in raw_location_text.lower():
-                return loc_id
-        
-        # Default to Lagos (Mile 12) if unknown, but log it
-        # You might want to change this default behavior later
-        return 1
+    def get_location_id(self, raw_location_text: str) -> Optional[int]:
+        """Map raw location string to database ID, None if it is not a known location"""
+        return self.match_location(raw_location_text)
 
 if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Scrape prices from Jiji.ng')
+    parser.add_argument('--compare-parsers', metavar='HTML_FILE',
+                        help='Time both parser backends on a saved search page and exit')
+    args = parser.parse_args()
+    
     scraper = JijiScraper()
-    scraper.run()
\ No newline at end of file
+    
+    if args.compare_parsers:
+        with open(args.compare_parsers, encoding='utf-8') as f:
+            report = scraper.compare_parser_backends(f.read())
+        for backend in ('lxml', 'soup'):
+            print(f"{backend:<6} {report[backend]['listings']:>5} listings  {report[backend]['seconds'] * 1000:8.2f} ms")
+        print(f"Identical output: {report['identical']}")
+    else:
+        scraper.run()
\ No newline at end of file
@@ -0,0 +1,326 @@
+"""
+Selector discovery and profiling for new scrapers
+Finds the repeated, listing-like structures of a page, proposes container and
+field selectors for them and times the ways of running those selectors, so a
+new scraper starts with the fastest selectors that extract the same listings
+"""
+import re
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from bs4 import BeautifulSoup
+from lxml import etree
+
+from html_extract import Selector, lxml_document
+
+STRATEGIES = ('lambda', 'css', 'xpath')
+
+# A price as listings write it: "₦ 25,000", "NGN 4500", "12,500"
+PRICE_TEXT = re.compile(r'(?:₦|NGN|\$|£|€)\s?\d|\b\d{1,3}(?:,\d{3})+\b', re.IGNORECASE)
+
+# Class tokens usable as-is in XPath and CSS (no escaping)
+CLASS_TOKEN = re.compile(r'^-?[_a-zA-Z][\w-]*$')
+
+# Class-token substrings hinting at a field, and tags that suggest a title
+FIELD_HINTS = {
+    'title': ('title', 'name', 'heading', 'headline'),
+    'price': ('price', 'amount', 'cost'),
+    'location': ('region', 'location', 'city', 'address', 'area', 'place', 'state'),
+}
+TITLE_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5'}
+
+
+def element_text(element) -> str:
+    """Text of an element as ListingExtractor's lxml backend reads it"""
+    return ''.join(text.strip() for text in element.itertext())
+
+
+def class_tokens(element) -> List[str]:
+    return [token for token in (element.get('class') or '').split() if CLASS_TOKEN.match(token)]
+
+
+def selector_code(selector: Selector) -> str:
+    """A Selector as it is written in a scraper's listing_selectors"""
+    args = [repr(selector.tag)]
+    if selector.cls:
+        args.append(repr(selector.cls))
+    if selector.contains:
+        args.append('contains=True')
+    if selector.attr:
+        args.append(f'attr={selector.attr!r}')
+    return f"Selector({', '.join(args)})"
+
+
+def find_repeated(root, min_repeat: int = 4, limit: int = 5) -> List[Dict]:
+    """Repeated sibling structures that look like listings, best first
+
+    Siblings sharing a tag and a class token (or just a tag) form a
+    candidate. Candidates are ranked by how many instances they have, how many
+    of those show a price and a link, and how precisely their selector picks
+    out just those instances on the whole page; ties go to the outermost one.
+    """
+    groups = defaultdict(list)
+    for parent in root.iter():
+        children = [child for child in parent if isinstance(child.tag, str)]
+        if len(children) < min_repeat:
+            continue
+        by_key = defaultdict(list)
+        for child in children:
+            by_key[(child.tag, None)].append(child)
+            for token in set(class_tokens(child)):
+                by_key[(child.tag, token)].append(child)
+        for key, instances in by_key.items():
+            if len(instances) >= min_repeat:
+                groups[key].extend(instances)
+
+    candidates = []
+    for (tag, token), instances in groups.items():
+        selector = Selector(tag, token)
+        texts = [element_text(instance) for instance in instances]
+        price_share = sum(bool(PRICE_TEXT.search(text)) for text in texts) / len(instances)
+        if not price_share:
+            continue
+        link_share = sum(
+            instance.tag == 'a' or bool(instance.xpath('.//a[@href]')) for instance in instances
+        ) / len(instances)
+        rich_share = sum(
+            sum(1 for text in instance.itertext() if text.strip()) >= 2 for instance in instances
+        ) / len(instances)
+        precision = len(instances) / len(root.xpath(f"//{selector.xpath()}"))
+
+        candidates.append({
+            'selector': selector,
+            'instances': instances,
+            'count': len(instances),
+            'price_share': price_share,
+            'link_share': link_share,
+            'score': len(instances) * price_share * rich_share * precision * (0.5 + 0.5 * link_share),
+            'depth': sum(1 for _ in instances[0].iterancestors()),
+            'sample': texts[0][:80],
+        })
+
+    candidates.sort(key=lambda c: (-round(c['score'], 6), c['depth'], c['selector'].cls is None))
+    return candidates[:limit]
+
+
+def propose_fields(instances: List, min_coverage: float = 0.5, alternatives: int = 2) -> Dict[str, List[Selector]]:
+    """Field selectors for listing containers: title, price, location and url
+
+    Each element key (tag and class token, or a bare heading tag) is scored
+    on the first match inside every container, the way extraction reads it:
+    how many containers have one, whether its text looks like the field and
+    whether its class names hint at it. One key serves one field only.
+    """
+    stats = defaultdict(lambda: {'hits': 0, 'prices': 0, 'length': 0, 'commas': 0})
+    links = 0
+    for instance in instances:
+        if instance.tag == 'a' or instance.xpath('.//a[@href]'):
+            links += 1
+        seen = set()
+        for element in instance.iterdescendants():
+            if not isinstance(element.tag, str):
+                continue
+            keys = [(element.tag, token) for token in class_tokens(element)]
+            if element.tag in TITLE_TAGS or not keys:
+                keys.append((element.tag, None))
+            text = element_text(element)
+            for key in keys:
+                if key in seen:
+                    continue
+                seen.add(key)
+                entry = stats[key]
+                entry['hits'] += 1
+                entry['prices'] += bool(PRICE_TEXT.search(text)) and len(text) < 40
+                entry['length'] += len(text)
+                entry['commas'] += ',' in text and not any(c.isdigit() for c in text)
+
+    def hinted(key, field):
+        return bool(key[1]) and any(hint in key[1].lower() for hint in FIELD_HINTS[field])
+
+    scores = {'price': {}, 'title': {}, 'location': {}}
+    for key, entry in stats.items():
+        coverage = entry['hits'] / len(instances)
+        if coverage < min_coverage or key[0] in ('a', 'img', 'svg', 'source', 'picture'):
+            continue
+        price_share = entry['prices'] / entry['hits']
+        length = entry['length'] / entry['hits']
+        if price_share >= 0.5:
+            scores['price'][key] = coverage * price_share + hinted(key, 'price')
+            continue
+        if length >= 10:
+            scores['title'][key] = coverage * min(length / 40, 1) + hinted(key, 'title') + 0.5 * (key[0] in TITLE_TAGS)
+        if hinted(key, 'location') or entry['commas'] / entry['hits'] >= 0.5:
+            scores['location'][key] = coverage + hinted(key, 'location')
+
+    fields = {}
+    taken = set()
+    for field in ('price', 'title', 'location'):
+        ranked = [key for key, _ in sorted(scores[field].items(), key=lambda item: -item[1]) if key not in taken]
+        chosen = ranked[:alternatives]
+        taken.update(chosen)
+        if chosen:
+            fields[field] = [Selector(tag, token) for tag, token in chosen]
+    if links / len(instances) >= min_coverage:
+        fields['url'] = [Selector('a', attr='href')]
+    return fields
+
+
+class SelectorStrategies:
+    """One set of container and field selectors compiled three ways
+
+      - 'lambda': BeautifulSoup find_all/find with Python predicates on class tokens
+      - 'css':    BeautifulSoup with precompiled soupsieve CSS selectors
+      - 'xpath':  lxml with precompiled XPath (ListingExtractor's 'lxml' backend)
+
+    All three return the same [{field: text}] shape, so their output can be
+    checked against each other before their timings are compared.
+    """
+
+    def __init__(self, container: Selector, fields: Dict[str, List[Selector]]):
+        import soupsieve
+
+        self.container = container
+        self.fields = fields
+        self.predicates = {
+            'container': self.soup_find_args(container),
+            **{name: [(self.soup_find_args(s), s.attr) for s in selectors] for name, selectors in fields.items()},
+        }
+        self.css = {
+            'container': soupsieve.compile(container.css()),
+            **{name: [(soupsieve.compile(s.css()), s.attr) for s in selectors] for name, selectors in fields.items()},
+        }
+        self.xpaths = {
+            'container': etree.XPath(f"//{container.xpath()}"),
+            **{name: [(etree.XPath(f"(.//{s.xpath()})[1]"), s.attr) for s in selectors]
+               for name, selectors in fields.items()},
+        }
+
+    @staticmethod
+    def soup_find_args(selector: Selector):
+        kwargs = {}
+        if selector.cls:
+            token = selector.cls
+            kwargs['class_'] = (lambda value: value is not None and token in value) if selector.contains \
+                else (lambda value: value == token)
+        if selector.attr:
+            kwargs['attrs'] = {selector.attr: True}
+        return selector.tag, kwargs
+
+    def run(self, strategy: str, document) -> List[Dict[str, Optional[str]]]:
+        return getattr(self, f"run_{strategy}")(document)
+
+    def run_lambda(self, soup) -> List[Dict[str, Optional[str]]]:
+        tag, kwargs = self.predicates['container']
+        results = []
+        for listing in soup.find_all(tag, **kwargs):
+            item = {}
+            for name in self.fields:
+                item[name] = None
+                for (tag, kwargs), attr in self.predicates[name]:
+                    element = listing.find(tag, **kwargs)
+                    if element:
+                        item[name] = element.get(attr) if attr else element.get_text(strip=True)
+                        break
+            results.append(item)
+        return results
+
+    def run_css(self, soup) -> List[Dict[str, Optional[str]]]:
+        results = []
+        for listing in self.css['container'].select(soup):
+            item = {}
+            for name in self.fields:
+                item[name] = None
+                for pattern, attr in self.css[name]:
+                    element = pattern.select_one(listing)
+                    if element:
+                        item[name] = element.get(attr) if attr else element.get_text(strip=True)
+                        break
+            results.append(item)
+        return results
+
+    def run_xpath(self, root) -> List[Dict[str, Optional[str]]]:
+        results = []
+        for listing in self.xpaths['container'](root):
+            item = {}
+            for name in self.fields:
+                item[name] = None
+                for xpath, attr in self.xpaths[name]:
+                    found = xpath(listing)
+                    if found:
+                        item[name] = found[0].get(attr) if attr else element_text(found[0])
+                        break
+            results.append(item)
+        return results
+
+    def profile(self, page_html: str, repeat: int = 5) -> Dict:
+        """Mean parse and query time of each strategy, and whether it extracts what XPath does
+
+        `fastest` is the strategy with the lowest parse + query time among
+        those whose output matches the XPath reference.
+        """
+        parse = {}
+        documents = {}
+        for parser, build in (('html.parser', lambda: BeautifulSoup(page_html, 'html.parser')),
+                              ('lxml', lambda: lxml_document(page_html))):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                documents[parser] = build()
+            parse[parser] = (time.perf_counter() - start) / repeat
+
+        report = {'parse': parse, 'strategies': {}}
+        outputs = {}
+        for strategy in STRATEGIES:
+            parser = 'lxml' if strategy == 'xpath' else 'html.parser'
+            start = time.perf_counter()
+            for _ in range(repeat):
+                outputs[strategy] = self.run(strategy, documents[parser])
+            seconds = (time.perf_counter() - start) / repeat
+            report['strategies'][strategy] = {
+                'parser': parser,
+                'seconds': seconds,
+                'total': seconds + parse[parser],
+                'listings': len(outputs[strategy]),
+            }
+
+        for strategy in STRATEGIES:
+            report['strategies'][strategy]['identical'] = outputs[strategy] == outputs['xpath']
+        reliable = [s for s in STRATEGIES if report['strategies'][s]['identical']]
+        report['fastest'] = min(reliable, key=lambda s: report['strategies'][s]['total'])
+
+        listings = outputs['xpath']
+        report['fill'] = {
+            name: sum(bool(item[name]) for item in listings) / len(listings) if listings else 0.0
+            for name in self.fields
+        }
+        report['sample'] = listings[:3]
+        return report
+
+
+def profile_page(page_html: str, source: str = '', repeat: int = 5, min_repeat: int = 4) -> Dict:
+    """Find a page's listing structures, propose selectors for the best one and profile them"""
+    root = lxml_document(page_html)
+    candidates = find_repeated(root, min_repeat=min_repeat)
+    report = {
+        'source': source,
+        'bytes': len(page_html.encode('utf-8')),
+        'candidates': [
+            {**{key: value for key, value in candidate.items() if key not in ('instances', 'selector')},
+             'selector': selector_code(candidate['selector'])}
+            for candidate in candidates
+        ],
+    }
+    if not candidates:
+        return report
+
+    # Selectors picking out exactly the same containers are offered as
+    # alternatives, the way scrapers list fallbacks for markup changes
+    best = candidates[0]
+    containers = [c['selector'] for c in candidates if c['instances'] == best['instances']][:2]
+    fields = propose_fields(best['instances'])
+    report['selectors'] = {
+        'container': [selector_code(s) for s in containers],
+        **{name: [selector_code(s) for s in selectors] for name, selectors in fields.items()},
+    }
+    report['profile'] = SelectorStrategies(best['selector'], fields).profile(page_html, repeat=repeat)
+    return report
@@ -0,0 +1,130 @@
+"""
+Quantity and unit normalization for scraped records
+Reads the pack size from listing titles ("25kg", "10 litres", "5 x 1kg") and
+turns prices into per-kg values, so listings of different pack sizes and
+markets can be compared
+"""
+import math
+import re
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+KG, LITRE = 1, 2
+BASE_UNITS = {'kg': KG, 'l': LITRE}
+
+# Unit words as written in titles: (dimension, size in kg or litres)
+UNIT_WORDS = {
+    'kg': (KG, 1.0), 'kgs': (KG, 1.0), 'kilo': (KG, 1.0), 'kilos': (KG, 1.0),
+    'kilogram': (KG, 1.0), 'kilograms': (KG, 1.0),
+    'g': (KG, 0.001), 'gram': (KG, 0.001), 'grams': (KG, 0.001),
+    'ton': (KG, 1000.0), 'tons': (KG, 1000.0), 'tonne': (KG, 1000.0), 'tonnes': (KG, 1000.0),
+    'l': (LITRE, 1.0), 'ltr': (LITRE, 1.0), 'ltrs': (LITRE, 1.0),
+    'litre': (LITRE, 1.0), 'litres': (LITRE, 1.0), 'liter': (LITRE, 1.0), 'liters': (LITRE, 1.0),
+    'cl': (LITRE, 0.01), 'ml': (LITRE, 0.001),
+}
+
+# An optional pack count ("5 x"), an amount and a unit word. Spaces only
+# (no newlines) so a match never spans two titles of a joined batch.
+QUANTITY_PATTERN = re.compile(
+    r'(?:(?<![\d.])(\d+)[ \t]*[x×*][ \t]*)?(?<![\d.,])(\d+(?:\.\d+)?)[ \t]*('
+    + '|'.join(sorted(map(re.escape, UNIT_WORDS), key=len, reverse=True))
+    + r')\b',
+    re.IGNORECASE
+)
+
+PARENTHESIZED = re.compile(r'\(.*?\)')
+
+
+def parse_quantities(titles: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Pack size in kg or litres and its dimension (KG, LITRE or 0 if none) of each title
+
+    All titles are searched in one regex pass over the joined batch; the
+    first quantity of a title wins.
+    """
+    titles = [(title or '').replace('\n', ' ') for title in titles]
+    quantity = np.full(len(titles), np.nan)
+    dimension = np.zeros(len(titles), dtype=np.int8)
+    if not titles:
+        return quantity, dimension
+
+    starts = np.cumsum([0] + [len(title) + 1 for title in titles[:-1]])
+    matches = list(QUANTITY_PATTERN.finditer('\n'.join(titles)))
+    if not matches:
+        return quantity, dimension
+
+    rows = np.searchsorted(starts, [m.start() for m in matches], side='right') - 1
+    rows, first = np.unique(rows, return_index=True)
+    for row, index in zip(rows, first):
+        count, amount, word = matches[index].groups()
+        dim, size = UNIT_WORDS[word.lower()]
+        quantity[row] = float(amount) * size * (int(count) if count else 1)
+        dimension[row] = dim
+    return quantity, dimension
+
+
+class UnitNormalizer:
+    """Per-product unit conversions compiled from scraper product rules
+
+    Each product may set `base_unit` ('kg' or 'l'), `unit_quantity` (how many
+    base units its `default_unit` holds, None when unknown, e.g. a basket)
+    and `density` (kg per litre, to convert between the two). A quantity in
+    the title overrides the default unit; one in the other dimension is only
+    used when the product has a density.
+    """
+
+    def __init__(self, product_rules: Dict[str, Dict]):
+        self.products = {}
+        for name, rules in product_rules.items():
+            base = BASE_UNITS.get(rules.get('base_unit', 'kg'), KG)
+            default = rules.get('unit_quantity')
+            density = rules.get('density')
+            self.products[name] = (
+                base,
+                math.nan if default is None else float(default),
+                math.nan if density is None else float(density),
+                rules.get('default_unit', ''),
+            )
+
+    def normalize(self, records: List[Dict]):
+        """Set `unit`, `quantity`, `base_unit` and `price_per_kg` on every record in place"""
+        if not records:
+            return
+
+        parsed, parsed_dim = parse_quantities([r.get('title') for r in records])
+        unknown = (KG, math.nan, math.nan, None)
+        table = [self.products.get(r['product_name'], unknown) for r in records]
+        base = np.fromiter((row[0] for row in table), dtype=np.int8, count=len(records))
+        default = np.fromiter((row[1] for row in table), dtype=np.float64, count=len(records))
+        density = np.fromiter((row[2] for row in table), dtype=np.float64, count=len(records))
+        price = np.fromiter((float(r['price']) for r in records), dtype=np.float64, count=len(records))
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Title quantity in the product's base unit, via density when the dimensions differ
+            converted = np.where(
+                parsed_dim == base, parsed,
+                np.where(parsed_dim == KG, parsed / density, parsed * density)
+            )
+            from_title = (parsed_dim > 0) & (converted > 0)
+            quantity = np.where(from_title, converted, default)
+            kilograms = np.where(base == KG, quantity, quantity * density)
+            price_per_kg = np.round(price / kilograms, 2)
+
+        for i, record in enumerate(records):
+            default_unit = table[i][3]
+            if from_title[i] and default_unit is not None:
+                record['unit'] = self.unit_label(default_unit, parsed[i], parsed_dim[i])
+            record['quantity'] = None if math.isnan(quantity[i]) else float(quantity[i])
+            record['base_unit'] = 'kg' if base[i] == KG else 'l'
+            record['price_per_kg'] = float(price_per_kg[i]) if np.isfinite(price_per_kg[i]) else None
+
+    @staticmethod
+    def unit_label(default_unit: str, quantity: float, dimension: int) -> str:
+        """The default unit restated with the title's quantity: 'bag (50kg)' -> 'bag (25kg)', 'liter' -> '10 liter'"""
+        size = f"{quantity:g}kg" if dimension == KG else f"{quantity:g}L"
+        if PARENTHESIZED.search(default_unit):
+            return PARENTHESIZED.sub(f"({size})", default_unit, count=1)
+        if default_unit.lower() in UNIT_WORDS:
+            same_dimension = UNIT_WORDS[default_unit.lower()][0] == dimension
+            return f"{quantity:g} {default_unit}" if same_dimension else size
+        return f"{default_unit} ({size})" if default_unit else size
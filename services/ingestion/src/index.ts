@@ -1,5 +1,5 @@
 import amqp from 'amqplib';
-import { Pool } from 'pg';
+import { Pool, PoolClient } from 'pg';
 import dotenv from 'dotenv';
 
 dotenv.config();
@@ -8,6 +8,16 @@ const pool = new Pool({
   connectionString: process.env.DATABASE_URL,
 });
 
+// Verdict of the scrapers' anomaly pre-screen (scrapers/anomaly_screen.py)
+interface AnomalyScreen {
+  version: number;
+  score: number;
+  samples: number;
+  tags: string[];
+  flagged: boolean;
+  reason: string | null;
+}
+
 interface ScrapedData {
   product_id: number;
   product_name: string;
@@ -16,8 +26,15 @@ interface ScrapedData {
   price: number;
   unit: string;
   currency: string;
+  // Set by the scrapers' unit normalization (scrapers/units.py); null when the pack size is unknown
+  price_per_kg?: number | null;
+  anomaly?: AnomalyScreen;
+  // Records re-parsed from archived pages carry the time their page was fetched
+  scraped_at?: string;
 }
 
+const ANOMALY_SCREEN_VERSION = 1;
+
 interface QueueMessage {
   source_id: number;
   source_name: string;
@@ -25,6 +42,42 @@ interface QueueMessage {
   scraped_at: string;
 }
 
+// Batch envelope published by the Python scrapers (many records per message)
+interface BatchMessage {
+  version: number;
+  batch_id: string;
+  source_id: number;
+  source_name: string;
+  scraped_at: string;
+  records: ScrapedData[];
+}
+
+function isBatchMessage(message: QueueMessage | BatchMessage): message is BatchMessage {
+  return Array.isArray((message as BatchMessage).records);
+}
+
+// Whether scraped_prices has the price_per_kg column (migrations/001). Databases
+// created before it get the column at startup when the worker may alter the
+// table; otherwise records are stored without it instead of failing.
+let hasPricePerKg = true;
+
+async function ensurePricePerKgColumn(): Promise<boolean> {
+  try {
+    await pool.query('ALTER TABLE scraped_prices ADD COLUMN IF NOT EXISTS price_per_kg DECIMAL(10, 2)');
+    return true;
+  } catch (error) {
+    const result = await pool.query(
+      `SELECT 1 FROM information_schema.columns
+       WHERE table_name = 'scraped_prices' AND column_name = 'price_per_kg'`
+    );
+    if (result.rowCount === 0) {
+      console.warn('⚠️  scraped_prices.price_per_kg is missing and could not be added, storing records without it:', error);
+      return false;
+    }
+    return true;
+  }
+}
+
 async function validateData(data: ScrapedData): Promise<boolean> {
   // Basic validation
   if (!data.product_id || !data.location_id) {
@@ -86,8 +139,8 @@ async function detectAnomaly(data: ScrapedData): Promise<{
   }
 }
 
-async function saveToDatabase(message: QueueMessage) {
-  const client = await pool.connect();
+async function saveToDatabase(message: QueueMessage, sharedClient?: PoolClient) {
+  const client = sharedClient ?? await pool.connect();
   
   try {
     const { data, source_id, scraped_at } = message;
@@ -99,28 +152,26 @@ async function saveToDatabase(message: QueueMessage) {
       return;
     }
 
-    // Check for anomalies
-    const anomalyCheck = await detectAnomaly(data);
+    // Check for anomalies, trusting the scraper's pre-screen when present
+    const anomalyCheck = data.anomaly?.version === ANOMALY_SCREEN_VERSION
+      ? { isAnomaly: data.anomaly.flagged, reason: data.anomaly.reason ?? undefined }
+      : await detectAnomaly(data);
     const status = anomalyCheck.isAnomaly ? 'flagged' : 'pending';
     const flaggedReason = anomalyCheck.reason || null;
 
     // Insert into scraped_prices table
+    const columns = ['product_id', 'location_id', 'source_id', 'price', 'unit', 'currency',
+      'scraped_at', 'status', 'flagged_reason'];
+    const values: unknown[] = [data.product_id, data.location_id, source_id, data.price, data.unit,
+      data.currency, scraped_at, status, flaggedReason];
+    if (hasPricePerKg) {
+      columns.push('price_per_kg');
+      values.push(data.price_per_kg ?? null);
+    }
     await client.query(
-      `INSERT INTO scraped_prices 
-       (product_id, location_id, source_id, price, unit, currency, 
-        scraped_at, status, flagged_reason)
-       VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)`,
-      [
-        data.product_id,
-        data.location_id,
-        source_id,
-        data.price,
-        data.unit,
-        data.currency,
-        scraped_at,
-        status,
-        flaggedReason
-      ]
+      `INSERT INTO scraped_prices (${columns.join(', ')})
+       VALUES (${values.map((_, i) => `$${i + 1}`).join(', ')})`,
+      values
     );
 
     const statusEmoji = status === 'flagged' ? '🚩' : '✅';
@@ -133,6 +184,57 @@ async function saveToDatabase(message: QueueMessage) {
   } catch (error) {
     console.error('❌ Error saving to database:', error);
     throw error;
+  } finally {
+    if (!sharedClient) {
+      client.release();
+    }
+  }
+}
+
+// Errors caused by the record itself (SQLSTATE class 22 data exception, 23
+// integrity constraint violation): retrying the message can never succeed
+function isRecordError(error: unknown): boolean {
+  const code = (error as { code?: unknown })?.code;
+  return typeof code === 'string' && (code.startsWith('22') || code.startsWith('23'));
+}
+
+async function saveBatchToDatabase(batch: BatchMessage) {
+  const client = await pool.connect();
+
+  // One transaction per envelope so a requeued batch is never half inserted.
+  // Each record has its own savepoint: a record the database rejects is
+  // skipped instead of rolling back (and requeueing forever) the whole batch.
+  try {
+    await client.query('BEGIN');
+
+    let skipped = 0;
+    for (const data of batch.records) {
+      await client.query('SAVEPOINT record');
+      try {
+        await saveToDatabase({
+          source_id: batch.source_id,
+          source_name: batch.source_name,
+          data,
+          scraped_at: data.scraped_at ?? batch.scraped_at
+        }, client);
+        await client.query('RELEASE SAVEPOINT record');
+      } catch (error) {
+        if (!isRecordError(error)) {
+          throw error;
+        }
+        await client.query('ROLLBACK TO SAVEPOINT record');
+        skipped++;
+        console.warn(`⏭️  Skipped ${data.product_name} at ${data.location_name}: ${(error as Error).message}`);
+      }
+    }
+
+    await client.query('COMMIT');
+    console.log(`📦 Batch ${batch.batch_id.slice(0, 8)}: ${batch.records.length - skipped} record(s) processed` +
+      (skipped ? `, ${skipped} rejected by the database` : ''));
+
+  } catch (error) {
+    await client.query('ROLLBACK');
+    throw error;
   } finally {
     client.release();
   }
@@ -145,6 +247,7 @@ async function startWorker() {
     // Test database connection
     const testConn = await pool.query('SELECT NOW()');
     console.log('✅ Database connected');
+    hasPricePerKg = await ensurePricePerKgColumn();
 
     // Connect to RabbitMQ
     const connection = await amqp.connect(process.env.RABBITMQ_URL!);
@@ -160,19 +263,37 @@ async function startWorker() {
     // Consume messages
     channel.consume('scraped_prices', async (msg) => {
       if (msg) {
+        let message: QueueMessage | BatchMessage;
         try {
-          const message: QueueMessage = JSON.parse(msg.content.toString());
-          
-          console.log(`\n📥 Processing: ${message.data.product_name} from ${message.source_name}`);
-          
-          await saveToDatabase(message);
+          message = JSON.parse(msg.content.toString());
+        } catch (error) {
+          // Unparseable messages would be redelivered forever, drop them
+          console.error('❌ Dropping malformed message:', error);
+          channel.nack(msg, false, false);
+          return;
+        }
+
+        try {
+          if (isBatchMessage(message)) {
+            console.log(`\n📥 Processing batch of ${message.records.length} from ${message.source_name}`);
+            await saveBatchToDatabase(message);
+          } else {
+            console.log(`\n📥 Processing: ${message.data.product_name} from ${message.source_name}`);
+            await saveToDatabase(message);
+          }
           
           // Acknowledge message (remove from queue)
           channel.ack(msg);
           
         } catch (error) {
+          if (isRecordError(error)) {
+            // A single record the database rejects: requeueing cannot help
+            console.error('❌ Dropping record rejected by the database:', error);
+            channel.nack(msg, false, false);
+            return;
+          }
           console.error('❌ Error processing message:', error);
-          // Reject and requeue message
+          // Reject and requeue message (database or broker trouble)
           channel.nack(msg, false, true);
         }
       }